@@ -1,23 +1,102 @@
 import argparse #lets your script accept command-line arguments (like file names or ticker symbols).
 import time
-from ib_async import IB, RealTimeBar
+from ib_async import IB
 from ib_async.contract import Stock
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from ib_scheduler import HistoricalScheduler
+from bar_store import NY, BarStore
+from fake_ib import FakeIB
+from aggregator import BarAggregator
+from indicators import OpeningRange
+from pipeline import POLICIES, Bar, Pipeline
 
 
 #++++++++++++++++++++++++++++++++++++++++++
 """
-Included the breakout function but no real time subscription now, so cant test
+Included the breakout function but no real time subscription now, so cant test live.
+The live path can run offline on stored bars though, the exact same code as live:
+    python ORB_strategy.py XYZ --fake                                  # last stored day
+    python ORB_strategy.py XYZ --replay 2023-02-01 --replay-end 2023-02-18 --speed 1000
+--speed 0 replays as fast as possible, the reports show throughput and end-to-end lag.
 Video timestamp: 24:00, need to continue after subscription
 
 """
 
 
+NS = 1_000_000_000
+
+# engine states
+BUILDING = 0   # still inside the opening range
+ARMED = 1      # range done, waiting for the breakout
+TRIGGERED = 2  # breakout signalled (or skipped), nothing more today
+
+
+class OpeningRangeBreakout():
+    """
+    Streaming opening-range-breakout state machine for one symbol.
+    Feed it every bar as it arrives (5 sec or 1 min), each update is O(1):
+    - bars starting before open + opening_range_minutes grow the range (indicators.OpeningRange,
+      the same code the backtests' opening_range() is checked against)
+    - after that, the first bar trading above range_high returns "LONG",
+      the first bar trading below range_low returns "SHORT" (a bar doing both is skipped)
+    - a bar from a new day resets everything
+    __slots__ keeps each engine small, so hundreds of symbols fit in one event loop.
+    """
+    __slots__ = ("symbol", "opening_range_minutes", "range", "state", "signal", "signal_price", "signal_ns")
+
+    def __init__(self, symbol: str, opening_range_minutes: int = 15):
+        self.symbol = symbol
+        self.opening_range_minutes = opening_range_minutes
+        self.range = OpeningRange(opening_range_minutes)
+        self._reset()
+
+    def _reset(self):
+        self.state = BUILDING
+        self.signal = None
+        self.signal_price = None
+        self.signal_ns = None
+
+    @property
+    def range_high(self):
+        return self.range.high
+
+    @property
+    def range_low(self):
+        return self.range.low
+
+    def update(self, ts_ns: int, high: float, low: float):
+        """ts_ns: bar start time in UTC nanoseconds. Returns "LONG", "SHORT" or None."""
+        if ts_ns >= self.range.next_day_ns:
+            self._reset()  # the range starts its new session in update() below
+        if not self.range.update(ts_ns, high, low) or self.state == TRIGGERED:
+            return None  # before the open, still building the range, or done for today
+
+        if self.state == BUILDING:
+            if self.range.high == float("-inf"):  # no bars in the range, nothing to trade today
+                self.state = TRIGGERED
+                return None
+            self.state = ARMED
+
+        up = high > self.range.high
+        down = low < self.range.low
+        if up or down:
+            self.state = TRIGGERED
+            if up and down:
+                return None
+            self.signal = "LONG" if up else "SHORT"
+            self.signal_price = self.range.high if up else self.range.low
+            self.signal_ns = ts_ns
+            return self.signal
+        return None
+
+
 #======================BELOW IS Async VERSION, use command line to control========================
 
 # Fucntions that fetches data for a single symbol
 # symbol: str -> this is a hint that symbol should be a string only
-async def fetch_opening_range(ib: IB, symbol: str, opening_range_minutes: int = 15):
+async def fetch_opening_range(ib: IB, symbol: str, scheduler: HistoricalScheduler, opening_range_minutes: int = 15):
     print(f"== Requesting data for {symbol} ==")
 
     #Starts a timer to measure how long fetching takes.
@@ -40,7 +119,8 @@ async def fetch_opening_range(ib: IB, symbol: str, opening_range_minutes: int =
             f"barSizeSetting='{barSizeSetting}', whatToShow='{whatToShow}', useRTH={useRTH}"
         )
         
-        bars = await ib.reqHistoricalDataAsync(
+        # goes through the shared scheduler so many symbols don't trip IB's pacing limits
+        bars = await scheduler.request(
             contract,
             endDateTime=endDateTime,
             durationStr=durationStr,
@@ -54,18 +134,22 @@ async def fetch_opening_range(ib: IB, symbol: str, opening_range_minutes: int =
         if not bars:
             print(f"No bars received for {symbol}!")
         else:
-            for bar in bars[:opening_range_minutes]:
+            # bars covers 5 days, the opening range has to come from the latest session only
+            last_day = bars[-1].date.date()
+            today_bars = [bar for bar in bars if bar.date.date() == last_day]
+            for bar in today_bars[:opening_range_minutes]:
                 print(f"{bar.date} O={bar.open:.2f} H={bar.high:.2f} L={bar.low:.2f} C={bar.close:.2f} V={int(bar.volume)}")
             
             
-            #Getting the bars data and put all high and lows in a list -> then find highest and lowest
-            opening_range_bars = bars[:opening_range_minutes]
-            highs = [bar.high for bar in opening_range_bars]
-            lows = [bar.low for bar in opening_range_bars]
-            highest_high = max(highs)
-            lowest_low = min(lows)
+            # Run today's bars through the same engine the live bars will use,
+            # so if we start mid-session the range (and any breakout so far) is already known
+            engine = OpeningRangeBreakout(symbol, opening_range_minutes)
+            for bar in today_bars:
+                engine.update(int(bar.date.timestamp()) * NS, bar.high, bar.low)
+            highest_high = engine.range_high
+            lowest_low = engine.range_low
             
-            return symbol, highest_high, lowest_low
+            return symbol, highest_high, lowest_low, engine
 
     except Exception as e:
         print(f"Error fetching {symbol}: {e}")
@@ -74,45 +158,37 @@ async def fetch_opening_range(ib: IB, symbol: str, opening_range_minutes: int =
     end = time.perf_counter()
     print(f"Finished fetching {symbol} in {end - start} seconds")
 
-async def monitor_breakout(ib: IB, symbol: str): #we real request for real time bar here
-    
-    #This part is telling that we subscibe the 5s real time bar
-    ticker = ib.reqRealTimeBars(
-        Stock(symbol, "SMART", "USD"),
-        barSize=5,
-        whatToShow="TRADES",
-        useRTH=True
-        )
-
-    # Define an event handler to process incoming bars
-    """
-    Parameters
-
-    bars: a list of RealTimeBar objects (could hold OHLCV data for each time period).
-    hasNewBar: a boolean indicating if there is a new bar in this update.
-    
-    """
-    def on_bar(bars: list[RealTimeBar], hasNewBar: bool): #if no susbscription, nth will print out, just error
-        print(f"\n--- {symbol} 5-sec bars (count={len(bars)}) ---")
-        for bar in bars:
-            print(bar)
-
-    ticker.updateEvent += on_bar 
-    #this += is not the typical addition, it's adding the on_bar function as an event handler for ticker updates.
-
-    # keep this coroutine alive indefinitely
-    await asyncio.Event().wait()
+def monitor_breakout(ib: IB, symbol: str, engine: OpeningRangeBreakout, pipeline: Pipeline,
+                     recorder: BarAggregator = None): #we real request for real time bar here
 
+    # The ib callback only queues the 5s bar (see pipeline.py), the engine runs in this symbol's worker,
+    # so a slow symbol can't hold up the others
+    def on_bar(bar: Bar):
+        if recorder is not None: # 5s bars -> 1 min bars appended to the bar store
+            recorder.update(bar.ts_ns, bar.open, bar.high, bar.low, bar.close, bar.volume)
+        return engine.update(bar.ts_ns, bar.high, bar.low)
 
+    def on_signal(bar: Bar, signal: str):
+        print(f"{datetime.fromtimestamp(bar.ts_ns / NS, NY)} {symbol} {signal} breakout at {engine.signal_price:.2f} "
+              f"(range {engine.range_low:.2f} - {engine.range_high:.2f})")
 
+    #This part is telling that we subscibe the 5s real time bar
+    return pipeline.subscribe(ib, symbol, on_bar, on_result=on_signal, barSize=5, whatToShow="TRADES", useRTH=True)
 
 
 # Main function that connects once and launches all requests concurrently
 # symbols is provided by user in the command line
-async def main(symbols):
+async def main(symbols, fake_store=None, queue_size=256, policy="coalesce", threads=0, report_every=60.0,
+               record=None, replay=None, replay_end=None, speed=1000.0, **fake_options):
+    # replay: FakeIB streams the stored bars from this day on, history requests end where the replay starts
+    if replay is not None:
+        fake_store = fake_store or ""
+        fake_options.update(realtime_start=replay, realtime_end=replay_end, realtime_speed=speed)
+
     #Creates and connects an IB API client (only once).
-    ib = IB()
+    ib = IB() if fake_store is None else FakeIB(BarStore(fake_store or None), **fake_options)
     await ib.connectAsync("127.0.0.1", 7497, clientId=1)
+    scheduler = HistoricalScheduler(ib)
 
     start = time.perf_counter()
 
@@ -120,7 +196,7 @@ async def main(symbols):
     # This is like setting up all the chess boards.
     coroutine_tasks = []
     for symbol in symbols:
-        task = fetch_opening_range(ib, symbol, 15) # this 5 minutes replace the default 15 minutes
+        task = fetch_opening_range(ib, symbol, scheduler, 15) # this 5 minutes replace the default 15 minutes
         coroutine_tasks.append(task)
 
     # 2. Run all tasks concurrently and wait for them all to complete.
@@ -130,18 +206,46 @@ async def main(symbols):
     *tasks unpacks a list (or tuple) of tasks into separate arguments.
     """
     results = await asyncio.gather(*coroutine_tasks)
-    monitors =[]
+    scheduler.report()
+
+    # threads > 0 runs the engines in a thread pool instead of on the event loop
+    executor = ThreadPoolExecutor(threads) if threads else None
+    pipeline = Pipeline(maxsize=queue_size, policy=policy, executor=executor)
+    # record: keep the live bars as 1 min bars in this bar store folder ("" = default store)
+    store = BarStore(record or None) if record is not None else None
+    recorders = []
     for result in results:
-        symbol, highest_high, lowest_low = result
+        if result is None: #fetch failed, error already printed
+            continue
+        symbol, highest_high, lowest_low, engine = result
         print(f"{symbol}: Highest_high = {highest_high:.2f}, Lowest_low = {lowest_low:.2f}")
-        monitors.append(monitor_breakout(ib, symbol)) 
-        
-    await asyncio.gather(*monitors)
+        recorder = BarAggregator(symbol, 1, store) if store is not None else None
+        if recorder is not None:
+            recorders.append(recorder)
+        monitor_breakout(ib, symbol, engine, pipeline, recorder)
 
-    end = time.perf_counter()
-    print(f"Finished fetching {len(symbols)} symbols in {end - start:.2f} seconds")
-    
-    ib.disconnect()
+    try:
+        if replay is None or ib.replay is None:
+            await pipeline.run(report_every) # runs until Ctrl+C
+        else:
+            # replay: done once every stored bar has gone through the engines
+            runner = asyncio.ensure_future(pipeline.run(report_every))
+            await ib.replay.wait()
+            await pipeline.drain()
+            runner.cancel()
+            ib.replay.report()
+    finally:
+        pipeline.report()
+        for recorder in recorders: # write the last minute and whatever is still batched
+            recorder.finish()
+        if recorders:
+            print(f"Recorded {sum(r.bars_out for r in recorders)} 1 min bars "
+                  f"({sum(r.partial for r in recorders)} incomplete) into {store.root}")
+        end = time.perf_counter()
+        print(f"Finished fetching {len(symbols)} symbols in {end - start:.2f} seconds")
+        if executor is not None:
+            executor.shutdown(wait=False)
+        ib.disconnect()
 
 
 
@@ -162,8 +266,23 @@ if __name__ == "__main__":
     """
     
     p.add_argument("symbols", nargs="+", help="One or more ticker symbols, e.g. AAPL MSFT TSLA")
+    p.add_argument("--fake", nargs="?", const="", metavar="STORE_DIR",
+                   help="Use the offline FakeIB served from the bar store instead of TWS (no network)")
+    p.add_argument("--fake-rate", type=float, default=50.0,
+                   help="FakeIB real-time bars per second per symbol (0 = as fast as possible)")
+    p.add_argument("--queue-size", type=int, default=256, help="Bars queued per symbol before the policy kicks in")
+    p.add_argument("--policy", choices=POLICIES, default="coalesce", help="What to do with bars when a queue is full")
+    p.add_argument("--threads", type=int, default=0, help="Run the engines in a thread pool of this size (0 = event loop)")
+    p.add_argument("--report-every", type=float, default=60.0, help="Seconds between pipeline reports")
+    p.add_argument("--replay", metavar="START", help="Replay stored bars from this day through the live code (uses FakeIB)")
+    p.add_argument("--replay-end", metavar="END", help="Stop the replay here (default: end of the store)")
+    p.add_argument("--speed", type=float, default=1000.0,
+                   help="Replay speed: 1 = real time, 1000 = accelerated, 0 = as fast as possible")
+    p.add_argument("--record", nargs="?", const="", metavar="STORE_DIR",
+                   help="Build 1 min bars from the live 5s bars and append them to the bar store")
     
     args = p.parse_args()
 
     #Starts the main process with the user’s chosen symbols.
-    asyncio.run(main(args.symbols))
\ No newline at end of file
+    asyncio.run(main(args.symbols, args.fake, args.queue_size, args.policy, args.threads, args.report_every,
+                     args.record, args.replay, args.replay_end, args.speed, realtime_rate=args.fake_rate))
\ No newline at end of file
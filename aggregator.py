@@ -0,0 +1,129 @@
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from bar_store import BAR_DTYPE, NY, BarStore
+from trading_calendar import default_calendar
+
+"""
+Streaming aggregator: 5-second real-time bars -> 1-minute (or N-minute) bars, as they arrive.
+
+Bins are anchored at the session open and the last one is cut at the close (early closes
+included), the same bins resample.resample_bars() makes from stored 1-min bars. A bar is
+finished as soon as its last 5-second bar arrives (no waiting for the next one); if that one
+never comes, the bar is finished when a bar from a later bin shows up, or by finish().
+Bars outside the session are ignored, and so are late or repeated bars for a bin that is already
+finished (they would otherwise start a fragment of that minute and overwrite the stored bar).
+
+Finished bars are kept in a small batch and appended to the bar store every flush_bars bars,
+every flush_seconds seconds, or at the session close, so live collection ends up in the same
+day files as the historical backfill:
+
+    agg = BarAggregator("AAPL", minutes=1, store=BarStore())
+    bar = agg.update(ts_ns, open, high, low, close, volume)   # a BAR_DTYPE row when a minute is done
+    ...
+    agg.finish()                                              # close the open bar, write the batch
+"""
+
+NS = 1_000_000_000
+
+class BarAggregator():
+    def __init__(self, symbol: str, minutes=1, store: BarStore = None, bar_seconds=5, flush_bars=5,
+                 flush_seconds=60.0, on_bar=None):
+        self.symbol = symbol
+        self.width = minutes * 60 * NS
+        self.sub_ns = bar_seconds * NS
+        self.store = store
+        self.flush_bars = flush_bars
+        self.flush_seconds = flush_seconds
+        self.on_bar = on_bar  # called with every finished bar
+
+        self.day = None
+        self.day_start_ns = self.day_end_ns = None
+        self.open_ns = self.close_ns = None
+        self.current = None  # [start_ns, end_ns, open, high, low, close, volume] of the bar being built
+        self.done_ns = 0     # end of the last finished bin, nothing before it is taken any more
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+        self.bars_in = 0
+        self.bars_out = 0
+        self.ignored = 0   # outside the session, or older than the bar being built / the last finished bin
+        self.partial = 0   # bars finished without their last 5-second bar
+        self.flushes = 0
+
+    def update(self, ts_ns: int, open: float, high: float, low: float, close: float, volume: float):
+        """Add one small bar (ts_ns = its start). Returns the finished BAR_DTYPE row, or None."""
+        self.bars_in += 1
+        if ts_ns < self.done_ns:
+            self.ignored += 1  # late / duplicate bar for a bin that is finished (and maybe stored)
+            return None
+        if self.day is None or not self.day_start_ns <= ts_ns < self.day_end_ns:
+            self._new_day(ts_ns)
+        if self.open_ns is None or not self.open_ns <= ts_ns < self.close_ns:
+            self.ignored += 1
+            return None
+
+        done = None
+        bar = self.current
+        if bar is not None and ts_ns >= bar[1]:
+            self.partial += 1
+            done = self._finish_bar()  # the previous bin never got its last small bar
+            bar = None
+        if bar is None:
+            start = self.open_ns + (ts_ns - self.open_ns) // self.width * self.width
+            self.current = bar = [start, min(start + self.width, self.close_ns), open, high, low, close, volume]
+        elif ts_ns < bar[0]:
+            self.ignored += 1
+            return done
+        else:
+            bar[3] = max(bar[3], high)
+            bar[4] = min(bar[4], low)
+            bar[5] = close
+            bar[6] += volume
+
+        # the last small bar of the bin has arrived: the bar is complete now
+        if ts_ns + self.sub_ns >= bar[1]:
+            done = self._finish_bar()
+        return done
+
+    def _new_day(self, ts_ns):
+        self.finish()
+        # NY midnight to midnight in UTC ns, so update() only looks the session up once per day
+        local = datetime.fromtimestamp(ts_ns / NS, NY)
+        midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+        self.day_start_ns = int(midnight.timestamp()) * NS
+        self.day_end_ns = int((midnight + timedelta(days=1)).timestamp()) * NS
+        self.day = (midnight.date() - date(1970, 1, 1)).days
+        session = default_calendar().session(self.day)
+        self.open_ns, self.close_ns = session if session is not None else (None, None)
+
+    def _finish_bar(self):
+        start, end, o, h, l, c, v = self.current
+        self.current = None
+        self.done_ns = max(self.done_ns, end)
+        row = np.array([(start, o, h, l, c, v)], dtype=BAR_DTYPE)[0]
+        self.bars_out += 1
+        self._pending.append(row)
+        if self.on_bar is not None:
+            self.on_bar(self.symbol, row)
+        if (len(self._pending) >= self.flush_bars or end >= self.close_ns
+                or time.monotonic() - self._last_flush >= self.flush_seconds):
+            self.flush()
+        return row
+
+    def flush(self):
+        """Append the finished bars waiting in the batch to the store."""
+        if self._pending and self.store is not None:
+            self.store.append(self.symbol, np.array(self._pending, dtype=BAR_DTYPE))
+            self.flushes += 1
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+    def finish(self):
+        """Close the bar being built (even without its last small bar) and write everything."""
+        if self.current is not None:
+            self.partial += 1
+            self._finish_bar()
+        self.flush()
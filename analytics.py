@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+"""
+Performance numbers for one return series or a whole matrix of them (one strategy per row).
+
+    stats = performance(daily_returns)                                  # pandas Series
+    table = performance(returns_matrix, positions=positions_matrix)     # DataFrame, one row per strategy
+
+Everything is computed with array operations along the time axis (the last axis), so scoring
+thousands of sweep results is one call. Large matrices are processed a block of rows at a time
+to keep memory bounded.
+
+returns are simple returns per bar (log=True for log returns like SMABacktester's ret_strategy).
+positions (optional, same shape) are the positions held over each bar, used for hit rate,
+turnover and exposure; without them a bar counts as "in the market" when its return isn't 0.
+
+- cagr:              compound annual growth rate
+- volatility:        annualized standard deviation of the returns
+- sharpe / sortino:  annualized, excess over risk_free (annual rate); sortino uses downside deviation
+- max_drawdown:      worst fall from a running peak of the equity curve (negative number)
+- max_dd_duration:   longest stretch of bars spent below a previous peak
+- hit_rate:          share of in-market bars with a positive return
+- turnover:          average |position change| per year
+- exposure:          average |position|
+"""
+
+METRICS = ["total_return", "cagr", "volatility", "sharpe", "sortino", "max_drawdown",
+           "max_dd_duration", "hit_rate", "turnover", "exposure"]
+PERIODS_PER_YEAR = 252
+
+
+def periods_per_year(timeframe=None):
+    """Bars per year for a resample timeframe ('15m', '60m', '1d' or None for daily)."""
+    if timeframe in (None, "1d"):
+        return PERIODS_PER_YEAR
+    from resample import parse_timeframe
+    minutes = parse_timeframe(timeframe)
+    return PERIODS_PER_YEAR * -(-390 // minutes)  # bins per full session, rounded up
+
+
+def _block(r, pos, ppy, risk_free):
+    # metrics for a (rows, T) block of simple returns
+    t = r.shape[1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        equity = np.cumprod(1.0 + r, axis=1)
+        growth = equity[:, -1]
+        years = t / ppy
+        cagr = np.where(growth > 0, growth ** (1.0 / years) - 1.0, -1.0)
+
+        mean = r.mean(axis=1)
+        std = r.std(axis=1, ddof=1) if t > 1 else np.full(len(r), np.nan)
+        excess = mean - risk_free / ppy
+        downside = np.sqrt(np.mean(np.minimum(r, 0.0) ** 2, axis=1))
+        sharpe = np.where(std > 0, excess / std * np.sqrt(ppy), np.nan)
+        sortino = np.where(downside > 0, excess / downside * np.sqrt(ppy), np.nan)
+
+        # drawdowns against the running peak, the start value 1.0 counts as a peak
+        peak = np.maximum.accumulate(np.maximum(equity, 1.0), axis=1)
+        max_drawdown = (equity / peak - 1.0).min(axis=1)
+        # bars since the last new peak, longest stretch per row
+        steps = np.arange(1, t + 1)
+        at_peak = equity >= peak
+        last_peak = np.maximum.accumulate(np.where(at_peak, steps, 0), axis=1)
+        max_dd_duration = (steps - last_peak).max(axis=1)
+
+        if pos is None:
+            in_market = r != 0
+            turnover = np.full(len(r), np.nan)
+            exposure = in_market.mean(axis=1)
+        else:
+            in_market = pos != 0
+            change = np.abs(np.diff(pos, axis=1, prepend=0.0))
+            turnover = change.sum(axis=1) / years
+            exposure = np.abs(pos).mean(axis=1)
+        hit_rate = (in_market & (r > 0)).sum(axis=1) / in_market.sum(axis=1)
+
+    return np.column_stack([growth - 1.0, cagr, std * np.sqrt(ppy), sharpe, sortino, max_drawdown,
+                            max_dd_duration, hit_rate, turnover, exposure])
+
+
+def performance(returns, periods_per_year=PERIODS_PER_YEAR, log=False, positions=None, risk_free=0.0,
+                index=None, max_chunk_bytes=256 * 2**20):
+    """
+    returns: 1-D series of returns, or a 2-D (strategies x bars) matrix.
+    Returns a Series of METRICS for 1-D input, a DataFrame (one row per strategy) for 2-D input.
+    NaN returns are treated as 0 (flat).
+    """
+    if isinstance(returns, pd.DataFrame):
+        index = returns.index if index is None else index
+    r = np.asarray(returns, dtype=np.float64)
+    single = r.ndim == 1
+    r = np.nan_to_num(np.atleast_2d(r), nan=0.0)
+    if log:
+        r = np.expm1(r)
+    pos = None
+    if positions is not None:
+        pos = np.nan_to_num(np.atleast_2d(np.asarray(positions, dtype=np.float64)), nan=0.0)
+        if pos.shape != r.shape:
+            raise ValueError(f"positions shape {pos.shape} doesn't match returns {r.shape}")
+
+    if r.shape[1] == 0:
+        values = np.full((r.shape[0], len(METRICS)), np.nan)
+    else:
+        # a few rows at a time: the block needs several (rows, T) temporaries
+        rows = max(1, int(max_chunk_bytes // (8 * 6 * r.shape[1])))
+        values = np.vstack([
+            _block(r[i:i + rows], None if pos is None else pos[i:i + rows], periods_per_year, risk_free)
+            for i in range(0, len(r), rows)
+        ])
+    if single:
+        return pd.Series(values[0], index=METRICS)
+    return pd.DataFrame(values, columns=METRICS, index=index)
@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from bar_store import NY, BarStore, trading_days
+from trading_calendar import TradingCalendar, default_calendar
+
+"""
+Data audit of the bar store against the NYSE session grid (trading_calendar).
+
+Every symbol is read once and checked with array operations, no loop over bars or days:
+- missing_session:  a whole session with no bars
+- missing_minutes:  runs of minutes missing inside a session (one row per run)
+- duplicate:        the same timestamp stored more than once
+- out_of_session:   bars outside open..close (weekends, holidays, pre/post market, after an early close)
+- misaligned:       in-session bars not on a whole minute
+- zero_volume:      zero_volume_run or more bars in a row with no volume
+- spike:            a 1-min close-to-close move far outside the symbol's usual moves
+                    (|r - median| > spike_threshold x MAD scale)
+- bad_bar:          high below open/close, low above them, or a price <= 0 / NaN
+
+The gap list (sessions with missing_session / missing_minutes) goes straight to the backfill:
+
+    python audit.py AAPL MSFT --start 2020-01-01                 # report
+    python audit.py --all --out issues.csv                       # every stored symbol, issues to CSV
+    python audit.py AAPL --backfill                              # fetch the gap sessions from IB
+    python audit.py XYZ --backfill --fake                        # ... from FakeIB
+
+fetch_1min_data --backfill uses session_minutes() too, so a day only counts as complete when every
+minute of its session is there (not just when it has enough bars).
+"""
+
+NS_PER_MINUTE = 60 * 10**9
+GRID_MINUTES = 390  # longest session
+COLUMNS = ["symbol", "kind", "day", "start", "end", "bars", "value"]
+KINDS = ["missing_session", "missing_minutes", "duplicate", "out_of_session", "misaligned",
+         "zero_volume", "spike", "bad_bar"]
+
+
+def _runs(mask):
+    """(start, length) of every run of True in a 1-D bool array."""
+    edges = np.diff(np.concatenate(([False], mask, [False])).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    return starts, np.flatnonzero(edges == -1) - starts
+
+
+def _grid(bars, sessions):
+    # session position and minute column of every bar (-1 when not an in-session whole minute)
+    calendar = TradingCalendar(*sessions)
+    if len(calendar) == 0:  # e.g. only weekend / holiday bars: all of them are out of session
+        pos = np.full(len(bars), -1, dtype=np.int64)
+        return pos, pos.copy(), np.zeros(len(bars), dtype=bool)
+    pos = calendar.locate(bars["ts"])
+    offset = bars["ts"] - calendar.opens[np.maximum(pos, 0)]
+    aligned = (pos >= 0) & (offset % NS_PER_MINUTE == 0)
+    return pos, np.where(aligned, offset // NS_PER_MINUTE, -1), aligned
+
+
+def session_minutes(bars, sessions):
+    """Distinct whole minutes stored inside each session of sessions = (days, opens, closes)."""
+    pos, minute, aligned = _grid(bars, sessions)
+    present = np.zeros((len(sessions[0]), GRID_MINUTES), dtype=bool)
+    present[pos[aligned], minute[aligned]] = True
+    return present.sum(axis=1)
+
+
+def audit_bars(bars, sessions, zero_volume_run=5, spike_threshold=12.0):
+    """
+    Issues of one symbol's bars (BAR_DTYPE, sorted by ts) against sessions = (days, opens, closes).
+    Returns a dict of columns (kind, day, start_ns, end_ns, bars, value), one entry per issue.
+    """
+    days, opens, closes = sessions
+    out = {"kind": [], "day": [], "start_ns": [], "end_ns": [], "bars": [], "value": []}
+
+    def add(kind, day, start_ns, end_ns, count, value=None):
+        n = len(day)
+        out["kind"].append(np.full(n, kind, dtype=object))
+        out["day"].append(np.asarray(day, dtype=np.int64))
+        out["start_ns"].append(np.asarray(start_ns, dtype=np.int64))
+        out["end_ns"].append(np.asarray(end_ns, dtype=np.int64))
+        out["bars"].append(np.asarray(count, dtype=np.int64))
+        out["value"].append(np.full(n, np.nan) if value is None else np.asarray(value, dtype=np.float64))
+
+    ts = bars["ts"]
+    if len(ts):
+        # duplicates: one row per repeated timestamp
+        same = np.flatnonzero(ts[1:] == ts[:-1]) + 1
+        if len(same):
+            dup_ts, copies = np.unique(ts[same], return_counts=True)
+            add("duplicate", trading_days(dup_ts), dup_ts, dup_ts + NS_PER_MINUTE, copies)
+
+    pos, minute, aligned = _grid(bars, sessions)
+    # NY day of every bar: the session's day inside a session, worked out from the timestamp outside
+    bar_day = days[np.maximum(pos, 0)] if len(days) else np.zeros(len(ts), dtype=np.int64)
+    outside = np.flatnonzero(pos < 0)
+    if len(outside):
+        bar_day[outside] = trading_days(ts[outside])
+
+    # out of session / misaligned: one row per day
+    for kind, mask in (("out_of_session", pos < 0), ("misaligned", (pos >= 0) & ~aligned)):
+        if mask.any():
+            day, first, count = np.unique(bar_day[mask], return_index=True, return_counts=True)
+            last = np.cumsum(count) - 1
+            add(kind, day, ts[mask][first], ts[mask][last] + NS_PER_MINUTE, count)
+
+    # missing minutes: (sessions x 390) grid of present minutes, runs of holes inside each session
+    expected = (closes - opens + NS_PER_MINUTE - 1) // NS_PER_MINUTE
+    present = np.zeros((len(days), GRID_MINUTES + 1), dtype=bool)  # last column: always-present stopper
+    present[pos[aligned], minute[aligned]] = True
+    in_session_minutes = int(present.sum())
+    present[np.arange(GRID_MINUTES + 1)[None, :] >= expected[:, None]] = True
+    start, length = _runs(~present.ravel())
+    row, col = np.divmod(start, GRID_MINUTES + 1)
+    whole = length == expected[row]
+    for kind, pick in (("missing_session", whole), ("missing_minutes", ~whole)):
+        r, c, n = row[pick], col[pick], length[pick]
+        first = opens[r] + c * NS_PER_MINUTE
+        add(kind, days[r], first, first + n * NS_PER_MINUTE, n)
+
+    if len(ts):
+        # zero volume runs inside a session (a run never crosses into the next session)
+        zero = (bars["volume"] == 0) & (pos >= 0)
+        new_session = np.concatenate(([True], pos[1:] != pos[:-1]))
+        run_start = zero & (new_session | ~np.concatenate(([False], zero[:-1])))
+        run_id = np.cumsum(run_start) - 1
+        lengths = np.bincount(run_id[zero], minlength=int(run_start.sum()))
+        long = np.flatnonzero(lengths >= zero_volume_run)
+        if len(long):
+            first = np.flatnonzero(run_start)[long]
+            last = first + lengths[long] - 1
+            add("zero_volume", bar_day[first], ts[first], ts[last] + NS_PER_MINUTE, lengths[long])
+
+        # spikes: 1-min log returns inside a session against a robust scale of the symbol's moves
+        o, h, l, c = (bars[col] for col in ("open", "high", "low", "close"))
+        bad = ~((c > 0) & (o > 0) & (l > 0) & (h >= np.maximum(o, c)) & (l <= np.minimum(o, c)))
+        if bad.any():
+            i = np.flatnonzero(bad)
+            add("bad_bar", bar_day[i], ts[i], ts[i] + NS_PER_MINUTE, np.ones(len(i)), c[i])
+        pair = (pos[1:] >= 0) & (pos[1:] == pos[:-1]) & ~bad[1:] & ~bad[:-1]
+        r = np.log(c[1:][pair] / c[:-1][pair])
+        if len(r) > 10:
+            center = np.median(r)
+            scale = 1.4826 * np.median(np.abs(r - center))
+            if scale > 0:
+                hit = np.abs(r - center) > spike_threshold * scale
+                i = np.flatnonzero(pair)[hit] + 1
+                add("spike", bar_day[i], ts[i], ts[i] + NS_PER_MINUTE, np.ones(len(i)), r[hit])
+
+    columns = {name: np.concatenate(parts) if parts else np.empty(0) for name, parts in out.items()}
+    summary = {
+        "sessions": len(days),
+        "expected_bars": int(expected.sum()),
+        "stored_bars": len(ts),
+        "in_session_minutes": in_session_minutes,
+    }
+    return columns, summary
+
+
+def audit_symbol(symbol, store_root=None, start=None, end=None, zero_volume_run=5, spike_threshold=12.0):
+    """(issues DataFrame, summary dict) for one symbol, over start..end or all its stored days."""
+    store = BarStore(store_root)
+    bars = store.read_array(symbol, start, end)
+    # sessions from start (or the first stored bar) to end (or the last stored bar)
+    first_day = last_day = None
+    if len(bars):
+        first_day, last_day = (int(day) for day in trading_days(bars["ts"][[0, -1]]))
+    if start is not None:
+        first_day = start
+    if end is not None:
+        last_day = pd.Timestamp(end) - pd.Timedelta(microseconds=1)
+    if first_day is None or last_day is None:
+        sessions = (np.empty(0, dtype=np.int64),) * 3
+    else:
+        sessions = default_calendar().sessions_in_range(first_day, last_day)
+    columns, summary = audit_bars(bars, sessions, zero_volume_run, spike_threshold)
+
+    issues = pd.DataFrame({
+        "symbol": symbol,
+        "kind": columns["kind"],
+        "day": (columns["day"].astype(np.int64)).astype("datetime64[D]"),
+        "start": pd.DatetimeIndex(columns["start_ns"].astype(np.int64), tz="UTC").tz_convert(NY),
+        "end": pd.DatetimeIndex(columns["end_ns"].astype(np.int64), tz="UTC").tz_convert(NY),
+        "bars": columns["bars"].astype(np.int64),
+        "value": columns["value"],
+    }, columns=COLUMNS)
+    issues = issues.sort_values(["start", "kind"], kind="stable").reset_index(drop=True)
+
+    counts = issues.groupby("kind")["bars"].sum()
+    summary = {"symbol": symbol, **summary}
+    for kind in KINDS:
+        summary[kind] = int(counts.get(kind, 0))
+    summary["coverage"] = summary["in_session_minutes"] / summary["expected_bars"] if summary["expected_bars"] else 1.0
+    return issues, summary
+
+
+def audit(symbols, store_root=None, start=None, end=None, processes=None, **options):
+    """(all issues, one summary row per symbol), symbols spread over a process pool if processes > 1."""
+    jobs = [(symbol, store_root, start, end) for symbol in symbols]
+    if processes and processes > 1 and len(symbols) > 1:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_audit_job, jobs, [options] * len(jobs)))
+    else:
+        results = [_audit_job(job, options) for job in jobs]
+    issues = [r[0] for r in results if len(r[0])]
+    issues = pd.concat(issues, ignore_index=True) if issues else pd.DataFrame(columns=COLUMNS)
+    return issues, pd.DataFrame([r[1] for r in results]).set_index("symbol") if results else pd.DataFrame()
+
+
+def _audit_job(job, options):
+    return audit_symbol(*job, **options)
+
+
+def gap_days(issues):
+    """{symbol: sorted datetime.date list} of the sessions the backfill has to fetch again."""
+    gaps = issues[issues["kind"].isin(["missing_session", "missing_minutes"])]
+    return {symbol: sorted(set(pd.DatetimeIndex(group["day"]).date)) for symbol, group in gaps.groupby("symbol")}
+
+
+# start program
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Audit stored 1-min bars against the NYSE session grid")
+    p.add_argument("symbols", nargs="*")
+    p.add_argument("--all", action="store_true", help="Every symbol in the store")
+    p.add_argument("--start", default=None)
+    p.add_argument("--end", default=None)
+    p.add_argument("--store", default=None, help="Bar store folder")
+    p.add_argument("--zero-volume-run", type=int, default=5, help="Shortest zero volume run to report")
+    p.add_argument("--spike-threshold", type=float, default=12.0, help="Spike size in robust standard deviations")
+    p.add_argument("--processes", type=int, default=None)
+    p.add_argument("--out", default=None, help="Write every issue to this CSV file")
+    p.add_argument("--show", type=int, default=20, help="Issues to print per symbol")
+    p.add_argument("--backfill", action="store_true", help="Fetch the sessions with gaps again (fetch_1min_data)")
+    p.add_argument("--fake", nargs="?", const="", metavar="STORE_DIR",
+                   help="Backfill from the offline FakeIB instead of TWS")
+    args = p.parse_args()
+
+    symbols = BarStore(args.store).symbols() if args.all else args.symbols
+    if not symbols:
+        p.error("give symbols or --all")
+
+    timer = time.perf_counter()
+    issues, summary = audit(symbols, args.store, args.start, args.end, args.processes,
+                            zero_volume_run=args.zero_volume_run, spike_threshold=args.spike_threshold)
+    seconds = time.perf_counter() - timer
+
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(summary.to_string())
+        for symbol, group in issues.groupby("symbol") if args.show else ():
+            print(f"\n=== {symbol}: {len(group)} issues ===")
+            print(group.drop(columns="symbol").head(args.show).to_string(index=False))
+    print(f"\nAudited {summary['stored_bars'].sum():,} bars of {len(symbols)} symbols in {seconds:.2f} seconds")
+    if args.out:
+        issues.to_csv(args.out, index=False)
+        print(f"Wrote {len(issues)} issues to {args.out}")
+
+    if args.backfill:
+        from fetch_1min_data import main as fetch_main
+
+        if args.store:
+            os.environ["BAR_STORE_DIR"] = args.store  # fetch_1min_data writes to the default store
+        gaps = gap_days(issues)
+        if not gaps:
+            print("No gaps to backfill")
+        else:
+            # one backfill run over the span of all gaps, it only requests the incomplete sessions
+            first = min(days[0] for days in gaps.values())
+            last = max(days[-1] for days in gaps.values())
+            print(f"Backfilling {sum(len(d) for d in gaps.values())} sessions of {len(gaps)} symbols, {first} to {last}")
+            asyncio.run(fetch_main(list(gaps), datetime(first.year, first.month, first.day, tzinfo=NY),
+                                   datetime(last.year, last.month, last.day, tzinfo=NY) + timedelta(days=1),
+                                   True, args.fake))
@@ -0,0 +1,267 @@
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from bar_store import NY, BarStore
+from indicators import SMA
+from trading_calendar import default_calendar
+
+"""
+Event-driven backtest engine over the local 1-minute bar store.
+
+The engine streams each symbol one session at a time (BarStore.iter_days reads one day file into
+memory at a time, so only one session is held per symbol) through a strategy object. The strategy sees the whole session as arrays
+and answers with a target position for every bar (-1 short, 0 flat, +1 long), keeping whatever
+state it needs between sessions. The engine turns target changes into fills, costs, positions
+and an equity curve with array operations, so nothing loops over individual bars in Python.
+
+Fills: fill="close" trades at the close of the bar that changed the target,
+fill="next_open" trades at the open of the following bar (carried over to the next session).
+Each symbol trades a fixed slice of the starting cash (cash / number of symbols).
+
+Speed target: at least 1,000,000 bars per second per symbol stream on one core for the SMA and
+ORB strategies below (about 0.1 s per year of 1-minute bars), printed after every run.
+
+    python backtest.py sma AAPL MSFT --fast 50 --slow 200
+    python backtest.py orb AAPL --minutes 15 --target 2
+"""
+
+NS = 1_000_000_000
+
+
+class Strategy():
+    """Base class. on_bars() gets one session of bars (BAR_DTYPE array) and returns target positions."""
+    name = "strategy"
+
+    def on_start(self, symbol):
+        """Called before the first session of every symbol, reset state here."""
+
+    def on_bars(self, bars):
+        raise NotImplementedError
+
+
+class SMAStrategy(Strategy):
+    """Long while SMA(fast) > SMA(slow) of the closes, flat otherwise (same rule as SMABacktester)."""
+    name = "sma"
+
+    def __init__(self, fast=50, slow=200):
+        self.fast = fast
+        self.slow = slow
+
+    def on_start(self, symbol):
+        # streaming SMAs fed one session at a time: exactly indicators.sma() of the whole series,
+        # so the signals are the same as the sweeps and the live engine
+        self.fast_sma = SMA(self.fast)
+        self.slow_sma = SMA(self.slow)
+
+    def on_bars(self, bars):
+        closes = bars["close"]
+        return (self.fast_sma.update_many(closes) > self.slow_sma.update_many(closes)).astype(np.float64)
+
+
+class ORBStrategy(Strategy):
+    """
+    Opening range breakout, same rules as OpeningRangeBreakout / orb_backtest:
+    long above the range high, short below the range low, out at the stop (other side of the range),
+    the target (target_multiple x range size) or the last bar of the session.
+    Levels are checked on each bar's high/low, the engine fills at its fill price.
+    """
+    name = "orb"
+
+    def __init__(self, opening_range_minutes=15, target_multiple=2.0):
+        self.opening_range_minutes = opening_range_minutes
+        self.target_multiple = target_multiple
+
+    def on_bars(self, bars):
+        n = len(bars)
+        target = np.zeros(n)
+        ts, high, low = bars["ts"], bars["high"], bars["low"]
+
+        session = default_calendar().session(datetime.fromtimestamp(int(ts[0]) / NS, NY).date())
+        if session is None:  # bars on a day the market was closed
+            return target
+        open_ns = session[0]
+        in_range = (ts >= open_ns) & (ts < open_ns + self.opening_range_minutes * 60 * NS)
+        if not in_range.any():
+            return target
+        range_high, range_low = high[in_range].max(), low[in_range].min()
+
+        after = ts >= open_ns + self.opening_range_minutes * 60 * NS
+        up = np.flatnonzero(after & (high > range_high))
+        down = np.flatnonzero(after & (low < range_low))
+        first_up = up[0] if len(up) else n
+        first_down = down[0] if len(down) else n
+        if first_up == first_down:  # no breakout, or both sides in one bar
+            return target
+        direction = 1.0 if first_up < first_down else -1.0
+        entry = min(first_up, first_down)
+
+        entry_price = range_high if direction > 0 else range_low
+        stop = range_low if direction > 0 else range_high
+        goal = entry_price + direction * self.target_multiple * (range_high - range_low)
+        rest = slice(entry + 1, n)
+        if direction > 0:
+            hit = (low[rest] <= stop) | (high[rest] >= goal)
+        else:
+            hit = (high[rest] >= stop) | (low[rest] <= goal)
+        exits = np.flatnonzero(hit)
+        exit_idx = entry + 1 + exits[0] if len(exits) else n - 1
+
+        target[entry:exit_idx] = direction  # flat again from the exit bar, and always on the last bar
+        return target
+
+
+class BacktestResult():
+    def __init__(self, equity, fills, stats):
+        self.equity = equity  # DataFrame: one equity column per symbol + total, indexed by time
+        self.fills = fills    # DataFrame: ts, symbol, shares, price, cost
+        self.stats = stats    # dict
+
+    def summary(self):
+        s = self.stats
+        print(
+            f"{s['strategy']}: {s['bars']} bars, {s['sessions']} sessions, {s['fills']} fills | "
+            f"start {s['start_equity']:.2f} -> end {s['end_equity']:.2f} ({s['total_return']:.2%}) | "
+            f"{s['seconds']:.2f} s, {s['bars_per_second']:,.0f} bars/s"
+        )
+
+
+class BacktestEngine():
+    def __init__(self, store: BarStore = None, cash=100_000.0, commission_per_share=0.0,
+                 slippage_bps=0.0, fill="close"):
+        if fill not in ("close", "next_open"):
+            raise ValueError("fill must be 'close' or 'next_open'")
+        self.store = store or BarStore()
+        self.cash = cash
+        self.commission_per_share = commission_per_share
+        self.slippage_bps = slippage_bps
+        self.fill = fill
+
+    def _run_symbol(self, strategy, symbol, capital, start, end):
+        strategy.on_start(symbol)
+        cash = capital
+        shares = 0.0        # position carried between sessions
+        position = 0.0      # last target that was filled
+        pending = None      # next_open: target waiting for the next bar
+        ts_parts, equity_parts, fill_parts = [], [], []
+        bars_seen = sessions = 0
+
+        for bars in self.store.iter_days(symbol, start, end):
+            n = len(bars)
+            bars_seen += n
+            sessions += 1
+            target = np.asarray(strategy.on_bars(bars), dtype=np.float64)
+
+            if self.fill == "close":
+                effective = target
+                price = bars["close"]
+            else:
+                # the decision at bar i is traded at the open of bar i+1
+                effective = np.concatenate(([position if pending is None else pending], target[:-1]))
+                pending = target[-1]
+                price = bars["open"]
+
+            # bars where the position changes
+            previous = np.concatenate(([position], effective[:-1]))
+            change = np.flatnonzero(effective != previous)
+            # new share count at each change: fixed capital slice divided by the fill price
+            new_shares = effective[change] * capital / price[change]
+            if len(change):
+                # forward-fill the share count from each change point
+                marker = np.zeros(n, dtype=np.int64)
+                marker[change] = np.arange(1, len(change) + 1)
+                shares_path = np.concatenate(([shares], new_shares))[np.maximum.accumulate(marker)]
+
+                traded = new_shares - np.concatenate(([shares], new_shares[:-1]))
+                fill_price = price[change]
+                cost = np.abs(traded) * (self.commission_per_share + fill_price * self.slippage_bps / 1e4)
+                cash_flow = np.zeros(n)
+                cash_flow[change] = -traded * fill_price - cost
+                cash_path = cash + np.cumsum(cash_flow)
+                fill_parts.append((bars["ts"][change], traded, fill_price, cost))
+            else:
+                shares_path = np.full(n, shares)
+                cash_path = np.full(n, cash)
+
+            equity_parts.append(cash_path + shares_path * bars["close"])
+            ts_parts.append(np.asarray(bars["ts"]))
+            cash = cash_path[-1]
+            shares = shares_path[-1]
+            position = effective[-1]
+
+        equity = pd.Series(np.concatenate(equity_parts) if equity_parts else np.empty(0),
+                           index=pd.DatetimeIndex(np.concatenate(ts_parts) if ts_parts else np.empty(0, dtype=np.int64),
+                                                  tz="UTC").tz_convert(NY),
+                           name=symbol)
+        if fill_parts:
+            fills = pd.DataFrame({
+                "ts": pd.DatetimeIndex(np.concatenate([f[0] for f in fill_parts]), tz="UTC").tz_convert(NY),
+                "symbol": symbol,
+                "shares": np.concatenate([f[1] for f in fill_parts]),
+                "price": np.concatenate([f[2] for f in fill_parts]),
+                "cost": np.concatenate([f[3] for f in fill_parts]),
+            })
+        else:
+            fills = pd.DataFrame(columns=["ts", "symbol", "shares", "price", "cost"])
+        return equity, fills, bars_seen, sessions
+
+    def run(self, strategy: Strategy, symbols, start=None, end=None):
+        timer = time.perf_counter()
+        capital = self.cash / len(symbols)
+        curves, fills = [], []
+        bars = sessions = 0
+        for symbol in symbols:
+            equity, symbol_fills, n, days = self._run_symbol(strategy, symbol, capital, start, end)
+            curves.append(equity)
+            fills.append(symbol_fills)
+            bars += n
+            sessions += days
+        seconds = time.perf_counter() - timer
+
+        # symbols that have no bar at some minute keep their last equity
+        equity = pd.concat(curves, axis=1).sort_index().ffill().fillna(capital)
+        equity["total"] = equity.sum(axis=1)
+        fills = pd.concat(fills, ignore_index=True)
+        end_equity = equity["total"].iloc[-1] if len(equity) else self.cash
+        stats = {
+            "strategy": strategy.name,
+            "symbols": len(symbols),
+            "bars": bars,
+            "sessions": sessions,
+            "fills": len(fills),
+            "start_equity": self.cash,
+            "end_equity": end_equity,
+            "total_return": end_equity / self.cash - 1.0,
+            "seconds": seconds,
+            "bars_per_second": bars / seconds if seconds > 0 else float("inf"),
+        }
+        return BacktestResult(equity, fills, stats)
+
+
+# start program
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Event-driven backtest over the local 1-min bar store")
+    p.add_argument("strategy", choices=["sma", "orb"])
+    p.add_argument("symbols", nargs="+", help="Symbols in the bar store, e.g. AAPL MSFT")
+    p.add_argument("--fast", type=int, default=50, help="sma: short window in bars")
+    p.add_argument("--slow", type=int, default=200, help="sma: long window in bars")
+    p.add_argument("--minutes", type=int, default=15, help="orb: opening range minutes")
+    p.add_argument("--target", type=float, default=2.0, help="orb: target as a multiple of the range")
+    p.add_argument("--start", help="First day, e.g. 2022-01-01")
+    p.add_argument("--end", help="Last day (exclusive)")
+    p.add_argument("--cash", type=float, default=100_000.0)
+    p.add_argument("--commission", type=float, default=0.0, help="Commission per share")
+    p.add_argument("--slippage", type=float, default=0.0, help="Slippage in basis points")
+    p.add_argument("--fill", choices=["close", "next_open"], default="close")
+    p.add_argument("--store", default=None, help="Bar store folder")
+    args = p.parse_args()
+
+    if args.strategy == "sma":
+        strategy = SMAStrategy(args.fast, args.slow)
+    else:
+        strategy = ORBStrategy(args.minutes, args.target)
+    engine = BacktestEngine(BarStore(args.store), args.cash, args.commission, args.slippage, args.fill)
+    engine.run(strategy, args.symbols, args.start, args.end).summary()
@@ -0,0 +1,394 @@
+import argparse
+import io
+import os
+import time
+from contextlib import contextmanager
+from datetime import date
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+"""
+On-disk store for 1-minute bars, one file per symbol per trading day:
+
+    bar_store/AAPL/2022/20220103.npy
+
+Every file is a NumPy structured array (BAR_DTYPE) sorted by ts, so reading is just a binary
+read (or np.load with mmap_mode="r"), no text parsing. ts is int64 UTC nanoseconds since epoch.
+
+Writers merge new bars into the day file under a lock file and swap the result in
+with os.replace, so several symbols (or several processes) can write at the same time.
+Live bars that only extend a day go through append(), which adds the rows to the end of
+the file in place instead of rewriting the day: the rows are written and synced to disk first,
+then the row count in the .npy header. Readers take the number of bars from the header's shape
+(never from the file size), so during an append they see the day as it was before it, and a
+crash half way leaves the old day readable (the next append writes over the stray bytes).
+
+Import the old CSV files:
+    python bar_store.py import AAPL 20220101_20220629_data.csv 20220630_20230217_data.csv
+"""
+
+NY = ZoneInfo("America/New_York")
+NS_PER_DAY = 86_400 * 10**9
+
+BAR_DTYPE = np.dtype([
+    ("ts", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+])
+PRICE_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+
+def to_timestamp_ns(value):
+    """Anything pandas understands -> UTC epoch nanoseconds. Naive times are New York time."""
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize(NY)
+    return int(ts.tz_convert("UTC").value)
+
+
+def trading_days(ts):
+    """New York calendar day (days since epoch) of every UTC nanosecond timestamp."""
+    local = pd.DatetimeIndex(ts, tz="UTC").tz_convert(NY).tz_localize(None)
+    return local.as_unit("ns").asi8 // NS_PER_DAY
+
+
+def to_bar_array(df):
+    """DataFrame with date/open/high/low/close/volume columns (like the old CSVs) -> BAR_DTYPE array."""
+    bars = np.empty(len(df), dtype=BAR_DTYPE)
+    dates = pd.to_datetime(df["date"], utc=True)
+    bars["ts"] = pd.DatetimeIndex(dates).as_unit("ns").asi8
+    for col in PRICE_COLUMNS:
+        bars[col] = df[col].to_numpy(dtype=np.float64)
+    return bars
+
+
+def to_frame(bars):
+    """BAR_DTYPE array -> DataFrame with a New York time 'date' column, same layout as the old CSVs."""
+    df = pd.DataFrame({col: bars[col] for col in PRICE_COLUMNS})
+    df.insert(0, "date", pd.DatetimeIndex(bars["ts"], tz="UTC").tz_convert(NY))
+    return df
+
+
+def merge_bars(old, new):
+    """Union of two bar arrays sorted by ts. If a timestamp is in both, the new bar wins."""
+    both = np.concatenate([old, new])
+    order = np.argsort(both["ts"], kind="stable")[::-1]
+    _, first = np.unique(both["ts"][order], return_index=True)
+    return both[order[first]]
+
+
+def bars_from_ib(bars):
+    """List of ib_async BarData -> BAR_DTYPE array, without keeping the BarData objects around."""
+    return np.fromiter(
+        ((int(bar.date.timestamp()) * 10**9, bar.open, bar.high, bar.low, bar.close, bar.volume) for bar in bars),
+        dtype=BAR_DTYPE,
+        count=len(bars),
+    )
+
+
+class BarBuilder():
+    """
+    Collects chunks of bars into one growable BAR_DTYPE array.
+    The buffer doubles when full, so appending n bars in total costs O(n) copies,
+    instead of O(n^2) for list prepending (all_bars = chunk + all_bars).
+    Chunks can arrive in any order, finish() sorts them once at the end.
+    """
+    def __init__(self, capacity=8192):
+        self._bars = np.empty(capacity, dtype=BAR_DTYPE)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, bars, start_ns=None, end_ns=None):
+        """Add a chunk (BAR_DTYPE array or ib_async bars), keeping only start_ns <= ts < end_ns."""
+        if not isinstance(bars, np.ndarray):
+            bars = bars_from_ib(bars)
+        if start_ns is not None or end_ns is not None:
+            keep = np.ones(len(bars), dtype=bool)
+            if start_ns is not None:
+                keep &= bars["ts"] >= start_ns
+            if end_ns is not None:
+                keep &= bars["ts"] < end_ns
+            bars = bars[keep]
+
+        n = len(bars)
+        if self._size + n > len(self._bars):
+            grown = np.empty(max(2 * len(self._bars), self._size + n), dtype=BAR_DTYPE)
+            grown[:self._size] = self._bars[:self._size]
+            self._bars = grown
+        self._bars[self._size:self._size + n] = bars
+        self._size += n
+        return n
+
+    def finish(self):
+        """All bars sorted by ts, duplicates (overlapping chunks) removed."""
+        bars = self._bars[:self._size]
+        ts, first = np.unique(bars["ts"], return_index=True)
+        if len(ts) == len(bars) and np.all(first == np.arange(len(bars))):
+            return bars  # already sorted and unique, no copy needed
+        return bars[first]
+
+    def to_frame(self):
+        return to_frame(self.finish())
+
+
+def _read_header(f):
+    # (shape, fortran_order, dtype) from the .npy header, leaves f at the start of the data
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(f)
+    if version == (2, 0):
+        return np.lib.format.read_array_header_2_0(f)
+    raise ValueError(f"Unsupported .npy version {version}")
+
+
+def _bar_header(f, path):
+    # number of bars in a day file, checked to really be a 1-D BAR_DTYPE array
+    shape, fortran_order, dtype = _read_header(f)
+    if dtype != BAR_DTYPE or fortran_order or len(shape) != 1:
+        raise ValueError(f"{path} is not a bar file (dtype {dtype}, shape {shape})")
+    return shape[0]
+
+
+def _load_day(path):
+    # Day files are small, so reading the bytes after the header is much faster than np.load's
+    # memory-mapping. The row count comes from the header's shape, not the file size: append()
+    # writes the rows before it updates the header, so anything past shape isn't part of the day yet.
+    with open(path, "rb") as f:
+        count = _bar_header(f, path)
+        raw = f.read(count * BAR_DTYPE.itemsize)
+    if len(raw) != count * BAR_DTYPE.itemsize:
+        raise ValueError(f"{path} is truncated ({len(raw) // BAR_DTYPE.itemsize} of {count} bars)")
+    return np.frombuffer(raw, dtype=BAR_DTYPE)
+
+
+def _day_length(path):
+    # number of bars in a day file from its .npy header, without reading the data
+    with open(path, "rb") as f:
+        return _bar_header(f, path)
+
+
+@contextmanager
+def _file_lock(path, timeout=60.0, stale_after=120.0):
+    # O_EXCL lock file works the same on Windows and Linux
+    lock_path = path + ".lock"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)  # left behind by a crashed writer
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Could not lock {path}")
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+
+class BarStore():
+    def __init__(self, root=None):
+        self.root = root or os.environ.get("BAR_STORE_DIR", "bar_store")
+
+    def _day_path(self, symbol, day):
+        d = date.fromordinal(date(1970, 1, 1).toordinal() + int(day))
+        return os.path.join(self.root, symbol.upper(), f"{d:%Y}", f"{d:%Y%m%d}.npy")
+
+    def symbols(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def _day_files(self, symbol):
+        # {day number: path} for every stored day of this symbol
+        files = {}
+        symbol_dir = os.path.join(self.root, symbol.upper())
+        if not os.path.isdir(symbol_dir):
+            return files
+        for year in os.listdir(symbol_dir):
+            year_dir = os.path.join(symbol_dir, year)
+            if not os.path.isdir(year_dir):
+                continue
+            for name in os.listdir(year_dir):
+                if name.endswith(".npy") and len(name) == 12:
+                    d = date(int(name[:4]), int(name[4:6]), int(name[6:8]))
+                    files[d.toordinal() - date(1970, 1, 1).toordinal()] = os.path.join(year_dir, name)
+        return dict(sorted(files.items()))
+
+    def days(self, symbol):
+        """Sorted list of the trading days (datetime.date) stored for a symbol."""
+        epoch = date(1970, 1, 1).toordinal()
+        return [date.fromordinal(epoch + day) for day in self._day_files(symbol)]
+
+    def day_counts(self, symbol):
+        """{datetime.date: number of bars} for every stored day, only reads the file headers."""
+        epoch = date(1970, 1, 1).toordinal()
+        return {date.fromordinal(epoch + day): _day_length(path) for day, path in self._day_files(symbol).items()}
+
+    def day_versions(self, symbol):
+        """
+        {datetime.date: (bars, file size, mtime_ns)} for every stored day. Any write or append
+        changes the size or the mtime, so this tells when a day changed even if its count didn't.
+        """
+        epoch = date(1970, 1, 1).toordinal()
+        versions = {}
+        for day, path in self._day_files(symbol).items():
+            info = os.stat(path)
+            versions[date.fromordinal(epoch + day)] = (_day_length(path), info.st_size, info.st_mtime_ns)
+        return versions
+
+    def write(self, symbol, bars):
+        """Add bars (BAR_DTYPE array or DataFrame) for a symbol, merging with what's already stored."""
+        if isinstance(bars, pd.DataFrame):
+            bars = to_bar_array(bars)
+        if len(bars) == 0:
+            return 0
+        if np.any(np.diff(bars["ts"]) < 0):
+            bars = bars[np.argsort(bars["ts"], kind="stable")]
+        days = trading_days(bars["ts"])
+        # bars are sorted, so each day is one contiguous slice
+        starts = np.flatnonzero(np.diff(days, prepend=days[0] - 1))
+        ends = np.append(starts[1:], len(bars))
+        for s, e in zip(starts, ends):
+            self._write_day(symbol, days[s], bars[s:e])
+        return len(bars)
+
+    def _write_day(self, symbol, day, bars):
+        path = self._day_path(symbol, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with _file_lock(path):
+            if os.path.exists(path):
+                bars = merge_bars(np.load(path), bars)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, bars)
+            os.replace(tmp, path)
+
+    def append(self, symbol, bars):
+        """
+        Add bars that come after everything already stored for their day, like live bars arriving
+        a few at a time. The rows are written at the end of the day file and the .npy header's
+        row count is updated after them, so the day is not rewritten. Anything else goes through write().
+        """
+        if len(bars) == 0:
+            return 0
+        days = trading_days(bars["ts"])
+        starts = np.flatnonzero(np.diff(days, prepend=days[0] - 1))
+        ends = np.append(starts[1:], len(bars))
+        for s, e in zip(starts, ends):
+            if not self._append_day(symbol, days[s], bars[s:e]):
+                self._write_day(symbol, days[s], bars[s:e])
+        return len(bars)
+
+    def _append_day(self, symbol, day, bars):
+        # True if the bars were appended in place, False if the caller has to merge them instead
+        path = self._day_path(symbol, day)
+        if not os.path.exists(path) or np.any(np.diff(bars["ts"]) <= 0):
+            return False
+        with _file_lock(path):
+            with open(path, "r+b") as f:
+                count = _bar_header(f, path)
+                offset = f.tell()
+                if count == 0:
+                    return False
+                f.seek(offset + (count - 1) * BAR_DTYPE.itemsize)
+                if np.frombuffer(f.read(BAR_DTYPE.itemsize), dtype=BAR_DTYPE)["ts"][0] >= bars["ts"][0]:
+                    return False  # overlaps what's stored, needs a merge
+                header = io.BytesIO()
+                np.lib.format.write_array_header_1_0(header, {
+                    "descr": np.lib.format.dtype_to_descr(BAR_DTYPE),
+                    "fortran_order": False,
+                    "shape": (count + len(bars),),
+                })
+                if header.tell() != offset:
+                    return False  # header would change size (very rare), rewrite the file instead
+                # rows first (over anything a crashed append left past the header's count), synced,
+                # then the count: a reader going by the header never sees a half-written row
+                f.seek(offset + count * BAR_DTYPE.itemsize)
+                f.write(np.ascontiguousarray(bars, dtype=BAR_DTYPE).tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+                f.seek(0)
+                f.write(header.getvalue())
+                f.flush()
+                os.fsync(f.fileno())
+        return True
+
+    def iter_days(self, symbol, start=None, end=None):
+        """Yield one (read-only) BAR_DTYPE array per stored day, limited to start <= ts < end."""
+        start_ns = to_timestamp_ns(start) if start is not None else None
+        end_ns = to_timestamp_ns(end) if end is not None else None
+        first_day = trading_days([start_ns])[0] if start_ns is not None else None
+        last_day = trading_days([end_ns])[0] if end_ns is not None else None
+
+        for day, path in self._day_files(symbol).items():
+            if first_day is not None and day < first_day:
+                continue
+            if last_day is not None and day > last_day:
+                break
+            bars = _load_day(path)
+            # only the first and last day can be partly outside the range
+            if start_ns is not None and day == first_day:
+                bars = bars[np.searchsorted(bars["ts"], start_ns, side="left"):]
+            if end_ns is not None and day == last_day:
+                bars = bars[:np.searchsorted(bars["ts"], end_ns, side="left")]
+            if len(bars):
+                yield bars
+
+    def read_array(self, symbol, start=None, end=None):
+        """Bars with start <= ts < end as one BAR_DTYPE array (start/end: anything pd.Timestamp takes)."""
+        parts = list(self.iter_days(symbol, start, end))
+        if not parts:
+            return np.empty(0, dtype=BAR_DTYPE)
+        return np.concatenate(parts)
+
+    def read(self, symbol, start=None, end=None):
+        """Same as read_array() but as a DataFrame laid out like the old CSV files."""
+        return to_frame(self.read_array(symbol, start, end))
+
+
+# start program
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Local 1-min bar store")
+    p.add_argument("--root", default=None, help="Store folder (default: $BAR_STORE_DIR or ./bar_store)")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    imp = sub.add_parser("import", help="Import CSV files written by the old fetch_1min_data")
+    imp.add_argument("symbol")
+    imp.add_argument("files", nargs="+")
+
+    info = sub.add_parser("info", help="Show stored days for symbols")
+    info.add_argument("symbols", nargs="*")
+
+    args = p.parse_args()
+    store = BarStore(args.root)
+
+    if args.command == "import":
+        from csv_loader import load_csv  # imported here, csv_loader itself imports bar_store
+
+        for file in args.files:
+            start = time.perf_counter()
+            n = store.write(args.symbol, load_csv(file))
+            print(f"Imported {n} bars from {file} into {args.symbol} in {time.perf_counter() - start:.2f} seconds")
+    else:
+        for symbol in args.symbols or store.symbols():
+            days = store.days(symbol)
+            if days:
+                print(f"{symbol}: {len(days)} days, {days[0]} to {days[-1]}")
+            else:
+                print(f"{symbol}: no data")
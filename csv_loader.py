@@ -0,0 +1,173 @@
+import argparse
+import hashlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from bar_store import BAR_DTYPE, PRICE_COLUMNS, to_frame
+
+"""
+Fast loader for the minute-bar CSV files (20220101_20220629_data.csv, ...):
+
+    date,open,high,low,close,volume
+    2022-01-03 09:30:00-05:00,83.92,84.38,83.88,84.3,728458.0
+
+pd.read_csv + pd.to_datetime parses every timezone string on its own, which is most of the load time.
+Here the prices are read with fixed float dtypes and the dates, which always have the same
+25 character layout, are turned into UTC int64 nanoseconds with array math on the characters.
+Anything that doesn't match that layout goes through pd.to_datetime like before.
+
+Every file gets a binary sidecar (<file>.bars.npz) with the parsed bars. It is used as long as the
+file's size and mtime are unchanged; if only the mtime changed (copied / touched file) the content hash
+decides. So only the first load pays for the parsing.
+
+    bars = load_csvs(["20220101_20220629_data.csv", "20220630_20230217_data.csv"])   # BAR_DTYPE array
+    df = load_frame([...])                                                           # old DataFrame layout
+"""
+
+TIMESTAMP_LENGTH = len("2022-01-03 09:30:00-05:00")
+CACHE_SUFFIX = ".bars.npz"
+
+
+def _days_from_civil(year, month, day):
+    # days since 1970-01-01 for proleptic Gregorian dates, works on whole arrays
+    year = year - (month <= 2)
+    era = np.floor_divide(year, 400)
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def parse_timestamps(values):
+    """
+    Strings like '2022-01-03 09:30:00-05:00' -> UTC epoch nanoseconds (int64 array).
+    Falls back to pd.to_datetime when the strings are not all in exactly that format.
+    """
+    text = np.asarray(values).astype(str)
+    if text.dtype.itemsize != TIMESTAMP_LENGTH * 4 or len(text) == 0:
+        return pd.DatetimeIndex(pd.to_datetime(text, utc=True, format="mixed")).as_unit("ns").asi8
+
+    # one row of character codes per timestamp (numpy stores str as 4 byte code points)
+    chars = text.view(np.uint32).reshape(len(text), TIMESTAMP_LENGTH).astype(np.int64)
+    layout_ok = (
+        np.all(chars[:, [4, 7]] == ord("-")) & np.all(chars[:, 10] == ord(" "))
+        & np.all(chars[:, [13, 16, 22]] == ord(":")) & np.all(np.isin(chars[:, 19], [ord("+"), ord("-")]))
+    )
+    digits = chars[:, [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18, 20, 21, 23, 24]] - ord("0")
+    if not layout_ok or digits.min() < 0 or digits.max() > 9:
+        return pd.DatetimeIndex(pd.to_datetime(text, utc=True, format="mixed")).as_unit("ns").asi8
+
+    def number(*cols):
+        out = np.zeros(len(text), dtype=np.int64)
+        for col in cols:
+            out = out * 10 + digits[:, col]
+        return out
+
+    days = _days_from_civil(number(0, 1, 2, 3), number(4, 5), number(6, 7))
+    seconds = days * 86400 + number(8, 9) * 3600 + number(10, 11) * 60 + number(12, 13)
+    sign = np.where(chars[:, 19] == ord("-"), -1, 1)
+    seconds -= sign * (number(14, 15) * 3600 + number(16, 17) * 60)  # local - offset = UTC
+    return seconds * 10**9
+
+
+def read_csv_bars(path):
+    """Parse one CSV file into a BAR_DTYPE array (no cache)."""
+    dtypes = {"date": str, **{col: np.float64 for col in PRICE_COLUMNS}}
+    df = pd.read_csv(path, usecols=["date"] + PRICE_COLUMNS, dtype=dtypes, engine="c")
+    bars = np.empty(len(df), dtype=BAR_DTYPE)
+    bars["ts"] = parse_timestamps(df["date"].to_numpy())
+    for col in PRICE_COLUMNS:
+        bars[col] = df[col].to_numpy()
+    return bars
+
+
+def _file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cache_path(path, cache_dir):
+    if cache_dir is None:
+        return path + CACHE_SUFFIX
+    return os.path.join(cache_dir, os.path.basename(path) + CACHE_SUFFIX)
+
+
+def load_csv(path, use_cache=True, cache_dir=None):
+    """One CSV file -> BAR_DTYPE array, using (and refreshing) the binary sidecar cache."""
+    if not use_cache:
+        return read_csv_bars(path)
+
+    info = os.stat(path)
+    cache = _cache_path(path, cache_dir)
+    digest = None
+    if os.path.exists(cache):
+        with np.load(cache) as saved:
+            size, mtime_ns = saved["meta"].tolist()
+            if size == info.st_size and mtime_ns == info.st_mtime_ns:
+                return saved["bars"]
+            if size == info.st_size:
+                # touched or copied: same content is still fine
+                digest = _file_hash(path)
+                if str(saved["sha1"]) == digest:
+                    bars = saved["bars"]
+                    _write_cache(cache, bars, info, digest)
+                    return bars
+
+    bars = read_csv_bars(path)
+    _write_cache(cache, bars, info, digest or _file_hash(path))
+    return bars
+
+
+def _write_cache(cache, bars, info, digest):
+    os.makedirs(os.path.dirname(cache) or ".", exist_ok=True)
+    tmp = f"{cache}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, bars=bars, meta=np.array([info.st_size, info.st_mtime_ns], dtype=np.int64), sha1=np.array(digest))
+    os.replace(tmp, cache)
+
+
+def load_csvs(paths, use_cache=True, cache_dir=None):
+    """
+    Several CSV files (e.g. consecutive date ranges) -> one BAR_DTYPE array sorted by ts.
+    Overlapping timestamps keep the bar from the later file in the list.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    parts = [load_csv(os.fspath(path), use_cache, cache_dir) for path in paths]
+    if not parts:
+        return np.empty(0, dtype=BAR_DTYPE)
+    bars = np.concatenate(parts)
+    if len(parts) == 1 and np.all(np.diff(bars["ts"]) > 0):
+        return bars
+    # newest file first, so np.unique's first index picks the later file's bar
+    order = np.argsort(bars["ts"], kind="stable")[::-1]
+    _, first = np.unique(bars["ts"][order], return_index=True)
+    return bars[order[first]]
+
+
+def load_frame(paths, use_cache=True, cache_dir=None):
+    """Same as load_csvs() but as a DataFrame with a New York time 'date' column."""
+    return to_frame(load_csvs(paths, use_cache, cache_dir))
+
+
+# start program
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Load minute-bar CSV files (with sidecar cache) and time it")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--no-cache", action="store_true", help="Always parse the CSV text")
+    p.add_argument("--cache-dir", default=None, help="Folder for the .bars.npz files (default: next to the CSVs)")
+    args = p.parse_args()
+
+    start = time.perf_counter()
+    bars = load_csvs(args.files, not args.no_cache, args.cache_dir)
+    seconds = time.perf_counter() - start
+    df = to_frame(bars[[0, -1]]) if len(bars) else None
+    print(f"Loaded {len(bars)} bars from {len(args.files)} files in {seconds:.3f} seconds")
+    if df is not None:
+        print(f"{df['date'].iloc[0]} to {df['date'].iloc[-1]}")
@@ -0,0 +1,190 @@
+import asyncio
+import random
+import re
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+from eventkit import Event
+from ib_async.objects import BarData, BarDataList
+
+from bar_store import BAR_DTYPE, NY, BarStore, to_timestamp_ns, trading_days
+from replay import ReplayFeed
+
+"""
+Offline stand-in for ib_async.IB, served from the local bar store.
+
+Use it anywhere the scripts create IB():
+
+    ib = FakeIB(BarStore(), latency=0.2, pacing_error_rate=0.05, realtime_rate=50)
+    await ib.connectAsync("127.0.0.1", 7497, clientId=1)   # does nothing
+    bars = await ib.reqHistoricalDataAsync(Stock("AAPL", "SMART", "USD"), "", "5 D", "1 min", "TRADES", True)
+
+or from the command line:  python fetch_multi_async.py AAPL --fake
+
+- reqHistoricalDataAsync answers "N D" / "N W" / "N S" requests for 1 min bars from the stored days,
+  after `latency` (+ random jitter) seconds.
+- Pacing errors: a random share of requests (pacing_error_rate) and anything over
+  max_requests_per_window in window_seconds gets IB's error 162 and an empty list, like the real thing.
+- reqRealTimeBars replays stored minutes as 5 second bars (12 per minute) through replay.ReplayFeed,
+  at realtime_rate bars per second per symbol or realtime_speed x real time (None = as fast as
+  possible), from the last stored day or from realtime_start to realtime_end. With realtime_start
+  set, historical requests ending "now" end there, so they don't see the replayed bars.
+
+Everything random comes from one seeded generator so runs are repeatable.
+"""
+
+PACING_MESSAGE = "Historical Market Data Service error message:Historical data request pacing violation"
+NO_DATA_MESSAGE = "Historical Market Data Service error message:HMDS query returned no data"
+
+
+def parse_end_datetime(value):
+    """endDateTime as IB takes it -> UTC ns, or None for "now"."""
+    if value in ("", None):
+        return None
+    if isinstance(value, datetime):
+        return to_timestamp_ns(value)
+    text = str(value).strip()
+    if re.fullmatch(r"\d{8}-\d{2}:\d{2}:\d{2}", text):  # 20230217-21:00:00 is UTC
+        return to_timestamp_ns(pd.Timestamp(datetime.strptime(text, "%Y%m%d-%H:%M:%S"), tz="UTC"))
+    parts = text.split(" ")
+    stamp = datetime.strptime(" ".join(parts[:2]), "%Y%m%d %H:%M:%S")
+    if len(parts) > 2:  # "20230217 16:00:00 US/Eastern"
+        return to_timestamp_ns(pd.Timestamp(stamp, tz=parts[2]))
+    return to_timestamp_ns(stamp)  # no zone: New York, which is what the scripts assume
+
+
+class FakeIB():
+    def __init__(self, store: BarStore = None, latency=0.05, latency_jitter=0.0, pacing_error_rate=0.0,
+                 max_requests_per_window=None, window_seconds=600.0, realtime_rate=None,
+                 realtime_start=None, realtime_end=None, realtime_speed=None, seed=0):
+        self.store = store or BarStore()
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.pacing_error_rate = pacing_error_rate
+        self.max_requests_per_window = max_requests_per_window
+        self.window_seconds = window_seconds
+        self.realtime_rate = realtime_rate
+        self.realtime_start = realtime_start
+        self.realtime_end = realtime_end
+        self.realtime_speed = realtime_speed
+        self.random = random.Random(seed)
+
+        self.errorEvent = Event("errorEvent")
+        self._connected = False
+        self._next_req_id = 1
+        self._request_times = []
+        self._replay = None  # ReplayFeed serving reqRealTimeBars
+        self.requests = 0
+
+    # --- connection ---------------------------------------------------------
+    async def connectAsync(self, host="127.0.0.1", port=7497, clientId=1, **kwargs):
+        self._connected = True
+        return self
+
+    def isConnected(self):
+        return self._connected
+
+    def disconnect(self):
+        if self._replay is not None:
+            self._replay.disconnect()
+        self._connected = False
+
+    def _req_id(self):
+        req_id = self._next_req_id
+        self._next_req_id += 1
+        return req_id
+
+    # --- historical data ----------------------------------------------------
+    def _select_bars(self, symbol, end_ns, duration):
+        count, unit = duration.split()
+        count = int(count)
+        if unit == "S":
+            start_ns = end_ns - count * 10**9
+            return self.store.read_array(symbol, pd.Timestamp(start_ns, tz="UTC"), pd.Timestamp(end_ns, tz="UTC"))
+
+        # D and W are trading days, like the scripts assume
+        days = count * 5 if unit == "W" else count
+        end_day = trading_days([end_ns - 1])[0]
+        stored = [d for d in self.store.days(symbol) if (d - date(1970, 1, 1)).days <= end_day]
+        if not stored:
+            return np.empty(0, dtype=BAR_DTYPE)
+        first_day = stored[-days] if len(stored) >= days else stored[0]
+        return self.store.read_array(symbol, pd.Timestamp(first_day, tz=NY), pd.Timestamp(end_ns, tz="UTC"))
+
+    def _paced(self):
+        now = time.monotonic()
+        if self.max_requests_per_window is not None:
+            self._request_times = [t for t in self._request_times if now - t < self.window_seconds]
+            self._request_times.append(now)
+            if len(self._request_times) > self.max_requests_per_window:
+                return True
+        return self.random.random() < self.pacing_error_rate
+
+    async def reqHistoricalDataAsync(self, contract, endDateTime, durationStr, barSizeSetting, whatToShow,
+                                     useRTH, formatDate=1, keepUpToDate=False, chartOptions=[], timeout=60):
+        req_id = self._req_id()
+        self.requests += 1
+        result = BarDataList()
+        result.reqId = req_id
+        result.contract = contract
+        result.endDateTime = endDateTime
+        result.durationStr = durationStr
+        result.barSizeSetting = barSizeSetting
+        result.whatToShow = whatToShow
+        result.useRTH = useRTH
+        result.formatDate = formatDate
+        result.keepUpToDate = keepUpToDate
+        result.chartOptions = chartOptions
+
+        paced = self._paced()
+        await asyncio.sleep(self.latency + self.random.uniform(0, self.latency_jitter))
+        if paced:
+            self.errorEvent.emit(req_id, 162, PACING_MESSAGE, contract)
+            return result
+        if barSizeSetting != "1 min":
+            self.errorEvent.emit(req_id, 321, f"FakeIB only serves 1 min bars, not {barSizeSetting}", contract)
+            return result
+
+        end_ns = parse_end_datetime(endDateTime)
+        if end_ns is None:
+            # when replaying, "now" is where the replay starts, so history never sees the replayed bars
+            now = self.realtime_start if self.realtime_start is not None else pd.Timestamp.now(tz="UTC")
+            end_ns = to_timestamp_ns(now)
+        bars = self._select_bars(contract.symbol, end_ns, durationStr)
+        if len(bars) == 0:
+            self.errorEvent.emit(req_id, 162, NO_DATA_MESSAGE, contract)
+            return result
+
+        dates = pd.DatetimeIndex(bars["ts"], tz="UTC").tz_convert(NY).to_pydatetime()
+        result.extend(
+            BarData(date=d, open=o, high=h, low=l, close=c, volume=v)
+            for d, o, h, l, c, v in zip(dates, bars["open"].tolist(), bars["high"].tolist(),
+                                        bars["low"].tolist(), bars["close"].tolist(), bars["volume"].tolist())
+        )
+        return result
+
+    # --- real-time bars -----------------------------------------------------
+    def _replay_feed(self):
+        # one ReplayFeed for all subscriptions, so the symbols share its clock
+        if self._replay is None:
+            if self.realtime_speed is not None:
+                speed = self.realtime_speed
+            else:
+                speed = 5 * self.realtime_rate if self.realtime_rate else None  # 5 s of market per bar
+            self._replay = ReplayFeed(self.store, self.realtime_start, self.realtime_end, speed,
+                                      errorEvent=self.errorEvent)
+        return self._replay
+
+    @property
+    def replay(self):
+        """The ReplayFeed behind reqRealTimeBars (None before the first subscription), for wait() and report()."""
+        return self._replay
+
+    def reqRealTimeBars(self, contract, barSize, whatToShow, useRTH, realTimeBarsOptions=[]):
+        return self._replay_feed().reqRealTimeBars(contract, barSize, whatToShow, useRTH, realTimeBarsOptions)
+
+    def cancelRealTimeBars(self, bars):
+        if self._replay is not None:
+            self._replay.cancelRealTimeBars(bars)
@@ -5,8 +5,7 @@ from ib_async.contract import Stock
 import asyncio
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-import pandas as pd
-import pandas_market_calendars as mcal
+from trading_calendar import default_calendar
 
 tz = ZoneInfo("America/New_York") #Convert to US timezone
 #======================BELOW IS Async VERSION, use command line to control========================
@@ -18,9 +17,8 @@ async def fetch_data(ib: IB, symbol: str):
 
     start = time.perf_counter() 
 
-    start_date = datetime(2016, 1, 5, 9, 30, 0, tzinfo=tz)
-    end_date = datetime(2016, 1, 10, 18, 00, 0, tzinfo=tz)
-    current_end = end_date
+    start_date = datetime(2016, 1, 5, tzinfo=tz)
+    end_date = datetime(2016, 1, 11, tzinfo=tz) # not included
 
     all_bars = []
 
@@ -31,10 +29,12 @@ async def fetch_data(ib: IB, symbol: str):
         useRTH = True
         
         window_days = 1
-        
-        while current_end > start_date:
-            # Always request 1 D, but clamp to start_date if less than 1 day left
-            chunk_start = max(current_end - timedelta(days=window_days), start_date)
+
+        # One request per NYSE session, newest first: from its open to its close (early closes included)
+        _, opens, closes = default_calendar().sessions_in_range(start_date, end_date - timedelta(microseconds=1))
+        for open_ns, close_ns in zip(opens[::-1].tolist(), closes[::-1].tolist()):
+            chunk_start = datetime.fromtimestamp(open_ns / 1e9, tz)
+            current_end = datetime.fromtimestamp(close_ns / 1e9, tz)
             duration_str = f"{window_days} D"
             endDateTime = current_end.strftime("%Y%m%d %H:%M:%S")
 
@@ -67,8 +67,6 @@ async def fetch_data(ib: IB, symbol: str):
                 all_bars = filtered_bars + all_bars #not using append coz need older data comes first
                 print(f"After: {len(all_bars)} bars")
 
-            current_end = chunk_start  # Move window back
-
         print(f"\n=== DONE! Total bars collected for {symbol}: {len(all_bars)} ===")
         print("\nFirst 2 bars:")
         for bar in all_bars[:2]:
@@ -5,32 +5,66 @@ from ib_async.contract import Stock
 import asyncio
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-import pandas as pd
-import pandas_market_calendars as mcal
+import numpy as np
+from bar_store import BarBuilder, BarStore, to_timestamp_ns
+from trading_calendar import default_calendar
+from audit import audit_bars, session_minutes
+from ib_scheduler import HistoricalScheduler
+from fake_ib import FakeIB
+
+tz = ZoneInfo("America/New_York") #Convert to US timezone
+
+# Default range for a full (non-backfill) download, start included, end not
+DEFAULT_START = datetime(2021, 1, 1, tzinfo=tz)
+DEFAULT_END = datetime(2023, 1, 1, tzinfo=tz)
+
+
+def missing_sessions(sessions, bars):
+    """
+    Positions (0, 1, 2...) in sessions = (days, opens, closes) of sessions that are not stored, or
+    miss any minute of the session (e.g. a crash mid-download, a day saved while still open, or a
+    chunk edge that cut bars off). Counting distinct in-session minutes (audit.session_minutes)
+    means duplicates and pre/post market bars can't make an incomplete day look complete.
+    """
+    days, opens, closes = sessions
+    expected = (closes - opens + 60 * 10**9 - 1) // (60 * 10**9)
+    return np.flatnonzero(session_minutes(bars, sessions) < expected)
+
+
+def coalesce_sessions(positions, window_days):
+    """
+    Group sorted schedule positions into (first, last) request windows.
+    Back-to-back sessions share a request, and no request is longer than window_days.
+    Windows are cut from the newest session backwards, same as the full download.
+    """
+    windows = []
+    if len(positions) == 0:
+        return windows
+    # a new run starts wherever the next missing session isn't the very next trading day
+    breaks = np.flatnonzero(np.diff(positions) != 1) + 1
+    for run in np.split(np.asarray(positions), breaks):
+        first, last = int(run[0]), int(run[-1])
+        for chunk_end_idx in range(last, first - 1, -window_days):
+            windows.append((max(first, chunk_end_idx - window_days + 1), chunk_end_idx))
+    return windows
+
 
 #======================BELOW IS Async VERSION, use command line to control========================
 # Fucntions that fetches data for a single symbol
 # symbol: str -> this is a hint that symbol should be a string only
-async def fetch_data(ib: IB, symbol: str):
-
+# backfill=True only requests the sessions that are missing (or incomplete) in the store
+async def fetch_data(ib: IB, symbol: str, store: BarStore, scheduler: HistoricalScheduler, start_date=DEFAULT_START, end_date=DEFAULT_END, backfill=False):
 
-    tz = ZoneInfo("America/New_York") #Convert to US timezone
     start = time.perf_counter() 
-    start_date = datetime(2021, 1, 1, 9, 30, 0, tzinfo=tz)
-    # start_date = datetime(2016, 1, 5, 9, 30, 0, tzinfo=tz)
-    # end_date = datetime(2023, 2, 17, 18, 00, 0, tzinfo=tz)
-    end_date = datetime(2022, 12, 31, 18, 00, 0, tzinfo=tz)
-
-    # Get NYSE trading sessions (market open times)
-    # Set up NYSE calendar and get the schedule of trading days
-    nyse = mcal.get_calendar('NYSE')
-    schedule = nyse.schedule(start_date=start_date.date(), end_date=end_date.date())
-    # Convert schedule to your Amer/New York timezone
-    schedule['market_open'] = schedule['market_open'].dt.tz_convert(tz)
-    schedule['market_close'] = schedule['market_close'].dt.tz_convert(tz)
-
-    all_bars = []
-    
+
+    # NYSE sessions (open / close in UTC ns, early closes included) from the precomputed calendar
+    calendar = default_calendar()
+    days, trading_opens, trading_closes = calendar.sessions_in_range(start_date, end_date - timedelta(microseconds=1))
+    start_ns, end_ns = to_timestamp_ns(start_date), to_timestamp_ns(end_date)
+
+    # every chunk goes straight into one growable NumPy array, no BarData objects kept around
+    builder = BarBuilder()
+    saved_bars = None
     
     try:
         contract = Stock(symbol, "SMART", "USD")
@@ -38,58 +72,49 @@ async def fetch_data(ib: IB, symbol: str):
         whatToShow = "TRADES"
         useRTH = True
         
-        MARKET_OPEN_HOUR = 9
-        MARKET_OPEN_MIN = 30
-        MARKET_CLOSE_HOUR = 18
-        MARKET_CLOSE_MIN = 0
         window_days = 30
-        trading_opens = schedule['market_open']
-        num_trading_days = len(trading_opens)
-        
-        for chunk_end_idx in range(num_trading_days - 1, -1, -window_days):
-            # Figure out window start for this chunk
-            chunk_start_idx = max(0, chunk_end_idx - window_days + 1)
-
-            # Get the trading day datetimes for this chunk's boundaries
-            start_of_chunk_day = trading_opens.iloc[chunk_start_idx]
-            end_of_chunk_day = trading_opens.iloc[chunk_end_idx]
-
-            # Build the exact datetimes for the API call window
-            chunk_start_time = start_of_chunk_day.replace(
-                hour=MARKET_OPEN_HOUR, 
-                minute=MARKET_OPEN_MIN, 
-                second=0
-            )
-            chunk_end_time = end_of_chunk_day.replace(
-                hour=MARKET_CLOSE_HOUR, 
-                minute=MARKET_CLOSE_MIN, 
-                second=0
-            )
-
-            # Clamp to user-requested global range
-            chunk_start_time = max(chunk_start_time, start_date)
-            chunk_end_time = min(chunk_end_time, end_date)
+        num_trading_days = len(days)
+
+        if backfill:
+            stored = store.read_array(symbol, start_date, end_date)
+            sessions = missing_sessions((days, trading_opens, trading_closes), stored)
+            print(f"{symbol}: {len(sessions)} of {num_trading_days} sessions missing or incomplete")
+        else:
+            sessions = np.arange(num_trading_days)
+        windows = coalesce_sessions(sessions, window_days)
+
+        # 3. Fetch one chunk of trading days, only keeping bars actually in this chunk window
+        async def fetch_window(chunk_start_idx, chunk_end_idx):
+            chunk_days = chunk_end_idx - chunk_start_idx + 1
+
+            # The API call window: open of the first session to close of the last one,
+            # clamped to the user-requested global range
+            chunk_start_ns = max(int(trading_opens[chunk_start_idx]), start_ns)
+            chunk_end_ns = min(int(trading_closes[chunk_end_idx]), end_ns)
+            chunk_start_time = datetime.fromtimestamp(chunk_start_ns / 1e9, tz)
+            chunk_end_time = datetime.fromtimestamp(chunk_end_ns / 1e9, tz)
 
             # Explain what we're fetching
-            print(f"Requesting {window_days} trading days: {chunk_start_time} to {chunk_end_time}")
-
-            # 3. Fetch data
+            print(f"Requesting {chunk_days} trading days: {chunk_start_time} to {chunk_end_time}")
 
-            bars = await ib.reqHistoricalDataAsync(
-                contract=contract,
+            # The scheduler keeps as many requests in flight as IB's pacing rules allow
+            bars = await scheduler.request(
+                contract,
                 endDateTime=chunk_end_time.strftime("%Y%m%d %H:%M:%S"),
-                durationStr=f"{window_days} D",
+                durationStr=f"{chunk_days} D",
                 barSizeSetting=barSizeSetting,
                 whatToShow=whatToShow,
                 useRTH=useRTH
             )
 
-            # 4. Only keep bars actually in this chunk window
-            filtered_bars = [bar for bar in bars if chunk_start_time <= bar.date < chunk_end_time]
-            if not filtered_bars:
-                print("  No bars received for this chunk!")
-            else:
-                all_bars = filtered_bars + all_bars  # Prepend for chronological order
+            # window filter is done on the timestamp column in one go
+            kept = builder.append(bars, chunk_start_ns, chunk_end_ns)
+            if not kept:
+                print(f"  No bars received for {symbol} {chunk_start_time} to {chunk_end_time}!")
+
+        # 4. Send all chunks at once, the builder sorts them into chronological order at the end
+        await asyncio.gather(*[fetch_window(s, e) for s, e in windows])
+        all_bars = builder.finish()
 
         print(f"\n=== DONE! Total bars collected for {symbol}: {len(all_bars)} ===")
 
@@ -99,34 +124,38 @@ async def fetch_data(ib: IB, symbol: str):
         Output of 1 bar:
         TYPE OF all_bars: BarData(date=datetime.datetime(2025, 9, 2, 9, 31, tzinfo=zoneinfo.ZoneInfo(key='US/Eastern')), open=84.59, high=84.59, low=84.25, close=84.44, volume=894442.0, average=84.412, barCount=2976)
         """
-        # Put each bar into a dictionary, then create a DataFrame from the list of dictionaries
-        # and create a CSV file
-        df = pd.DataFrame(
-            [(bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume) for bar in all_bars],
-            columns=['date', 'open', 'high', 'low', 'close', 'volume']
-        )
-
-        # df = pd.DataFrame(all_bars_data)
-        # print(df.head())
-        safe_start = start_date.strftime('%Y%m%d')
-        safe_end = end_date.strftime('%Y%m%d')
-        filename = f'{safe_start}_{safe_end}_data.csv'
-        df.to_csv(filename, index=False)
+        # all_bars is already a typed array (int64 timestamps, float64 OHLCV),
+        # the store writes it as-is into one file per symbol per trading day
+        store.write(symbol, all_bars)
+        print(f"Saved {len(all_bars)} bars for {symbol} to {store.root}")
+        saved_bars = all_bars
 
     except Exception as e:
         print(f"Error fetching {symbol}: {e}")
 
+    # check what came back against the sessions that were asked for (chunk edges, gaps in IB's data),
+    # the bars are saved already, so a problem here is an audit error and not a failed fetch
+    if saved_bars is not None:
+        try:
+            issues, _ = audit_bars(saved_bars, (days[sessions], trading_opens[sessions], trading_closes[sessions]))
+            found = {kind: int(issues["bars"][issues["kind"] == kind].sum()) for kind in np.unique(issues["kind"].astype(str))}
+            print(f"Audit {symbol}: " + (", ".join(f"{kind} {n}" for kind, n in found.items()) or "no issues"))
+        except Exception as e:
+            print(f"Error auditing {symbol}: {e}")
+
     end = time.perf_counter()
     print(f"Finished fetching {symbol} in {end - start:.2f} seconds\n")
 
 
 # Main function that connects once and launches all requests concurrently
 # symbols is provided by user in the command line
-async def main(symbols):
+async def main(symbols, start_date=DEFAULT_START, end_date=DEFAULT_END, backfill=False, fake_store=None, **fake_options):
     #Creates and connects an IB API client (only once).
-    ib = IB()
+    ib = IB() if fake_store is None else FakeIB(BarStore(fake_store or None), **fake_options)
     # await ib.connectAsync("127.0.0.1", 7496, clientId=1) #live
     await ib.connectAsync("127.0.0.1", 7497, clientId=1)
+    store = BarStore()
+    scheduler = HistoricalScheduler(ib) #shared by all symbols so pacing limits hold overall
 
     # start = time.perf_counter()
 
@@ -134,7 +163,7 @@ async def main(symbols):
     # This is like setting up all the chess boards.
     tasks = []
     for symbol in symbols:
-        task = fetch_data(ib, symbol)
+        task = fetch_data(ib, symbol, store, scheduler, start_date, end_date, backfill)
         tasks.append(task)
 
     # 2. Run all tasks concurrently and wait for them all to complete.
@@ -147,6 +176,7 @@ async def main(symbols):
     
     # end = time.perf_counter()
     # print(f"Finished fetching {len(symbols)} symbols in {end - start:.2f} seconds")
+    scheduler.report()
     
     ib.disconnect()
 
@@ -167,8 +197,24 @@ if __name__ == "__main__":
     help=... provides a description that will show up in the help message.
     """
     p.add_argument("symbols", nargs="+", help="One or more ticker symbols, e.g. AAPL MSFT TSLA")
+    p.add_argument("--fake", nargs="?", const="", metavar="STORE_DIR",
+                   help="Use the offline FakeIB served from the bar store instead of TWS (no network)")
+    p.add_argument("--start", help="First day to fetch, e.g. 2021-01-01")
+    p.add_argument("--end", help="Last day to fetch, e.g. 2022-12-31 (backfill default: today)")
+    p.add_argument("--backfill", action="store_true",
+                   help="Only fetch sessions that are missing or incomplete in the bar store (nightly update)")
     
     args = p.parse_args()
 
+    start_date = DEFAULT_START
+    end_date = DEFAULT_END
+    # whole days: from midnight of --start to midnight after --end, the calendar knows the sessions
+    if args.start:
+        start_date = datetime.strptime(args.start, "%Y-%m-%d").replace(tzinfo=tz)
+    if args.end:
+        end_date = datetime.strptime(args.end, "%Y-%m-%d").replace(tzinfo=tz) + timedelta(days=1)
+    elif args.backfill:
+        end_date = datetime.now(tz).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
     #Starts the main process with the user’s chosen symbols.
-    asyncio.run(main(args.symbols))
\ No newline at end of file
+    asyncio.run(main(args.symbols, start_date, end_date, args.backfill, args.fake))
\ No newline at end of file
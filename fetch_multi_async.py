@@ -3,13 +3,16 @@ import time
 from ib_async import IB
 from ib_async.contract import Stock
 import asyncio
+from ib_scheduler import HistoricalScheduler
+from bar_store import BarStore
+from fake_ib import FakeIB
 
 
 #======================BELOW IS Async VERSION, use command line to control========================
 
 # Fucntions that fetches data for a single symbol
 # symbol: str -> this is a hint that symbol should be a string only
-async def fetch_data(ib: IB, symbol: str):
+async def fetch_data(ib: IB, symbol: str, scheduler: HistoricalScheduler):
     print(f"== Requesting data for {symbol} ==")
 
     #Starts a timer to measure how long fetching takes.
@@ -33,7 +36,8 @@ async def fetch_data(ib: IB, symbol: str):
             f"barSizeSetting='{barSizeSetting}', whatToShow='{whatToShow}', useRTH={useRTH}"
         )
         
-        bars = await ib.reqHistoricalDataAsync(
+        # goes through the shared scheduler so many symbols don't trip IB's pacing limits
+        bars = await scheduler.request(
             contract,
             endDateTime=endDateTime,
             durationStr=durationStr,
@@ -61,10 +65,11 @@ async def fetch_data(ib: IB, symbol: str):
 
 # Main function that connects once and launches all requests concurrently
 # symbols is provided by user in the command line
-async def main(symbols):
+async def main(symbols, fake_store=None, **fake_options):
     #Creates and connects an IB API client (only once).
-    ib = IB()
+    ib = IB() if fake_store is None else FakeIB(BarStore(fake_store or None), **fake_options)
     await ib.connectAsync("127.0.0.1", 7497, clientId=1)
+    scheduler = HistoricalScheduler(ib)
 
     start = time.perf_counter()
 
@@ -72,7 +77,7 @@ async def main(symbols):
     # This is like setting up all the chess boards.
     tasks = []
     for symbol in symbols:
-        task = fetch_data(ib, symbol)
+        task = fetch_data(ib, symbol, scheduler)
         tasks.append(task)
 
     # 2. Run all tasks concurrently and wait for them all to complete.
@@ -85,6 +90,7 @@ async def main(symbols):
     
     end = time.perf_counter()
     print(f"Finished fetching {len(symbols)} symbols in {end - start:.2f} seconds")
+    scheduler.report()
     
     ib.disconnect()
 
@@ -106,8 +112,10 @@ if __name__ == "__main__":
     
     """
     p.add_argument("symbols", nargs="+", help="One or more ticker symbols, e.g. AAPL MSFT TSLA")
+    p.add_argument("--fake", nargs="?", const="", metavar="STORE_DIR",
+                   help="Use the offline FakeIB served from the bar store instead of TWS (no network)")
     
     args = p.parse_args()
 
     #Starts the main process with the user’s chosen symbols.
-    asyncio.run(main(args.symbols))
\ No newline at end of file
+    asyncio.run(main(args.symbols, args.fake))
\ No newline at end of file
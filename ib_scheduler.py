@@ -0,0 +1,168 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+
+from ib_async import IB
+
+"""
+Shared scheduler for IB historical data requests.
+
+IB pacing rules for historical data (small bars like 1 min):
+- at most 50 requests open at the same time
+- at most 60 requests in any 10 minute window
+- at most 6 requests for the same contract in 2 seconds
+- no identical request within 15 seconds
+Breaking them gives error 162 "pacing violation" and an empty bar list.
+
+All fetchers (fetch_1min_data, fetch_multi_async, ORB_strategy) send their requests through one
+HistoricalScheduler, so every symbol shares the same limits and the pipe stays as full as allowed.
+
+    scheduler = HistoricalScheduler(ib)
+    bars = await scheduler.request(contract, endDateTime="", durationStr="1 D", barSizeSetting="1 min",
+                                   whatToShow="TRADES", useRTH=True)
+    scheduler.report()
+"""
+
+
+class HistoricalScheduler():
+    def __init__(self, ib: IB, max_in_flight=50, max_per_window=60, window_seconds=600.0,
+                 max_per_contract=5, contract_window_seconds=2.0, identical_cooldown=15.0,
+                 max_retries=5, backoff_seconds=10.0):
+        self.ib = ib
+        self.max_in_flight = max_in_flight
+        self.max_per_window = max_per_window
+        self.window_seconds = window_seconds
+        self.max_per_contract = max_per_contract
+        self.contract_window_seconds = contract_window_seconds
+        self.identical_cooldown = identical_cooldown
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._slot_lock = asyncio.Lock()
+        self._sent = deque()  # send times of all requests in the sliding window
+        self._sent_by_contract = defaultdict(deque)
+        self._last_identical = {}  # request key -> last send time
+        self._pacing_errors = {}  # contract key -> time of last pacing violation
+        self._paused_until = 0.0
+
+        # throughput stats
+        self.started = time.monotonic()
+        self.requests = 0
+        self.retries = 0
+        self.pacing_violations = 0
+        self.bars = 0
+        self.in_flight = 0
+        self.max_seen_in_flight = 0
+        self.request_seconds = 0.0
+
+        ib.errorEvent += self._on_error
+
+    @staticmethod
+    def _contract_key(contract):
+        if contract is None:
+            return None
+        return (contract.symbol, contract.secType, contract.exchange)
+
+    def _on_error(self, reqId, errorCode, errorString, contract):
+        if errorCode == 162 and "pacing" in errorString.lower():
+            now = time.monotonic()
+            self.pacing_violations += 1
+            self._pacing_errors[self._contract_key(contract)] = now
+            # back off everyone, not just this contract
+            self._paused_until = max(self._paused_until, now + self.backoff_seconds)
+
+    def _prune(self, now):
+        while self._sent and now - self._sent[0] >= self.window_seconds:
+            self._sent.popleft()
+        for key in list(self._sent_by_contract):
+            times = self._sent_by_contract[key]
+            while times and now - times[0] >= self.contract_window_seconds:
+                times.popleft()
+            if not times:
+                del self._sent_by_contract[key]
+
+    async def _wait_for_slot(self, contract_key, request_key):
+        # Reserve a send time that keeps every sliding-window rule happy, sleeping until one opens up.
+        while True:
+            async with self._slot_lock:
+                now = time.monotonic()
+                self._prune(now)
+                wait = self._paused_until - now
+                if len(self._sent) >= self.max_per_window:
+                    wait = max(wait, self._sent[0] + self.window_seconds - now)
+                times = self._sent_by_contract.get(contract_key)
+                if times and len(times) >= self.max_per_contract:
+                    wait = max(wait, times[0] + self.contract_window_seconds - now)
+                last = self._last_identical.get(request_key)
+                if last is not None:
+                    wait = max(wait, last + self.identical_cooldown - now)
+                if wait <= 0:
+                    self._sent.append(now)
+                    self._sent_by_contract[contract_key].append(now)
+                    self._last_identical[request_key] = now
+                    return
+            await asyncio.sleep(wait)
+
+    async def request(self, contract, endDateTime="", durationStr="1 D", barSizeSetting="1 min",
+                      whatToShow="TRADES", useRTH=True, **kwargs):
+        """Same arguments as ib.reqHistoricalDataAsync, but paced and retried on pacing violations."""
+        contract_key = self._contract_key(contract)
+        request_key = (contract_key, str(endDateTime), durationStr, barSizeSetting, whatToShow, useRTH)
+
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                await self._wait_for_slot(contract_key, request_key)
+                self.requests += 1
+                self.in_flight += 1
+                self.max_seen_in_flight = max(self.max_seen_in_flight, self.in_flight)
+                sent = time.monotonic()
+                try:
+                    bars = await self.ib.reqHistoricalDataAsync(
+                        contract,
+                        endDateTime=endDateTime,
+                        durationStr=durationStr,
+                        barSizeSetting=barSizeSetting,
+                        whatToShow=whatToShow,
+                        useRTH=useRTH,
+                        **kwargs
+                    )
+                finally:
+                    self.in_flight -= 1
+                    self.request_seconds += time.monotonic() - sent
+
+            # IB answers a pacing violation with an error event and an empty list
+            paced = max(self._pacing_errors.get(contract_key, 0.0), self._pacing_errors.get(None, 0.0))
+            if not bars and paced >= sent and attempt < self.max_retries:
+                self.retries += 1
+                delay = self.backoff_seconds * 2 ** attempt
+                print(f"Pacing violation for {contract.symbol}, retrying in {delay:.1f} seconds")
+                await asyncio.sleep(delay)
+                continue
+
+            self.bars += len(bars) if bars else 0
+            return bars
+        return bars
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            "elapsed_seconds": elapsed,
+            "requests": self.requests,
+            "retries": self.retries,
+            "pacing_violations": self.pacing_violations,
+            "bars": self.bars,
+            "max_in_flight": self.max_seen_in_flight,
+            "requests_per_second": self.requests / elapsed if elapsed > 0 else 0.0,
+            "bars_per_second": self.bars / elapsed if elapsed > 0 else 0.0,
+            "avg_request_seconds": self.request_seconds / self.requests if self.requests else 0.0,
+        }
+
+    def report(self):
+        s = self.stats()
+        print(
+            f"Scheduler: {s['requests']} requests ({s['retries']} retries, {s['pacing_violations']} pacing violations), "
+            f"{s['bars']} bars in {s['elapsed_seconds']:.2f} seconds -> "
+            f"{s['requests_per_second']:.2f} req/s, {s['bars_per_second']:.0f} bars/s, "
+            f"avg latency {s['avg_request_seconds']:.2f} s, max {s['max_in_flight']} in flight"
+        )
@@ -0,0 +1,438 @@
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from bar_store import NY, trading_days
+from trading_calendar import default_calendar
+
+"""
+Indicators with two forms that give exactly the same numbers (bit for bit):
+
+    batch (backtests):   sma(closes, 20)            -> array, vectorized where the math allows
+    streaming (live):    s = SMA(20); s.update(x)   -> latest value, O(1) work per bar
+
+Both forms do the same floating point operations in the same order, so a backtest and the live
+engine never drift apart:
+- SMA:  a running sum of (x - first value) and the difference of two sums, like np.cumsum
+        (NaN values are skipped in the sums and blank the next `window` averages)
+- EMA / ATR: a recursion, so the batch form is the same loop over the values
+- VWAP: running sums of typical price x volume and volume, restarted every New York day
+- rolling high / low: exact max / min (monotonic deque when streaming)
+- opening range: high / low of the bars between the session open and open + minutes, known from the
+  first bar after (opens come from the trading calendar, days without a session have no range)
+
+Warm-up values are NaN. Run this file to check that every pair matches:
+
+    python indicators.py
+"""
+
+NS = 1_000_000_000
+NAN = float("nan")
+
+# Bump when the numbers sma() / SMA give change (even in the last bit), cached backtest results
+# keyed on it (smabacktestv1.SMABacktester) are then computed again
+SMA_VERSION = 2
+
+
+def _session_times(ts_ns, opening_range_minutes=0):
+    # Session open (from the trading calendar), open + minutes and next midnight for the New York day
+    # of ts_ns, in UTC ns. A day without a session gets next midnight as its open, so no bar is in it.
+    # Only called once per day by the streaming forms.
+    local = datetime.fromtimestamp(ts_ns / NS, NY)
+    midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    next_day = int((midnight + timedelta(days=1)).timestamp()) * NS
+    session = default_calendar().session(midnight.date())
+    session_open = session[0] if session is not None else next_day
+    return session_open, session_open + opening_range_minutes * 60 * NS, next_day
+
+
+# --- SMA ---------------------------------------------------------------------------------
+
+def sma(values, window):
+    """
+    Simple moving average down axis 0: a 1-D series, or a (time x symbol) array column by column.
+    The sums are taken of (x - first valid value) to keep them small. NaN where any of the last
+    `window` values is NaN, like pandas rolling(window).mean(), so a gap in the data only blanks
+    the `window` bars after it.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    out = np.full(x.shape, np.nan)
+    if len(x) == 0 or window > len(x):
+        return out
+    valid = ~np.isnan(x)
+    base = x[valid.argmax(axis=0)] if x.ndim == 1 else x[valid.argmax(axis=0), np.arange(x.shape[1])]
+    base = np.where(valid.any(axis=0), base, 0.0)
+    zero = np.zeros((1,) + x.shape[1:])
+    csum = np.concatenate((zero, np.cumsum(np.where(valid, x - base, 0.0), axis=0)))
+    count = np.concatenate((zero.astype(np.int64), np.cumsum(valid, axis=0)))
+    full = (count[window:] - count[:-window]) == window
+    out[window - 1:] = np.where(full, (csum[window:] - csum[:-window]) / window + base, np.nan)
+    return out
+
+
+class SMA():
+    __slots__ = ("window", "base", "total", "valid", "sums", "counts", "count", "value")
+
+    def __init__(self, window):
+        self.window = window
+        self.base = None
+        self.total = 0.0
+        self.valid = 0               # running count of non-NaN values
+        self.sums = [0.0] * window   # the last `window` running sums, sums[k % window]
+        self.counts = [0] * window   # and running counts
+        self.count = 0
+        self.value = NAN
+
+    def update(self, x):
+        if x == x:  # not NaN
+            if self.base is None:
+                self.base = x
+            self.total = self.total + (x - self.base)
+            self.valid += 1
+        else:
+            self.total = self.total + 0.0  # same additions as the batch form
+        self.count += 1
+        slot = self.count % self.window
+        old, old_valid = self.sums[slot], self.counts[slot]  # running sum / count from `window` bars ago
+        self.sums[slot], self.counts[slot] = self.total, self.valid
+        if self.count >= self.window:
+            full = self.valid - old_valid == self.window
+            self.value = (self.total - old) / self.window + self.base if full else NAN
+        return self.value
+
+    def update_many(self, values):
+        """
+        update() for a whole chunk of values at once (e.g. one session in the backtest engine),
+        returns the array of values. Going on from the running sums, so calling it chunk by chunk
+        gives exactly sma() of the whole series.
+        """
+        x = np.asarray(values, dtype=np.float64)
+        n, w = len(x), self.window
+        if n == 0:
+            return np.empty(0)
+        valid = ~np.isnan(x)
+        gaps = not valid.all()
+        if self.base is None and valid.any():
+            self.base = float(x[valid.argmax()])
+        base = 0.0 if self.base is None else self.base
+        # running sums / counts of the last w updates (oldest first), then the new ones
+        slots = np.arange(self.count - w + 1, self.count + 1) % w
+        steps = np.empty(n + 1)
+        steps[0] = self.total
+        steps[1:] = x - base
+        if gaps:
+            steps[1:][~valid] = 0.0
+        sums = np.concatenate((np.asarray(self.sums)[slots], np.cumsum(steps)[1:]))
+        counts = np.concatenate((np.asarray(self.counts)[slots], self.valid + np.cumsum(valid)))
+        out = (sums[w:] - sums[:-w]) / w + base
+        if gaps or self.valid < self.count or self.count < w:  # warm-up or NaNs in the window
+            full = (counts[w:] - counts[:-w] == w) & (np.arange(self.count + 1, self.count + n + 1) >= w)
+            out[~full] = np.nan
+
+        self.count += n
+        self.total, self.valid = float(sums[-1]), int(counts[-1])
+        slots = np.arange(self.count - w + 1, self.count + 1) % w
+        ring_sums, ring_counts = np.empty(w), np.empty(w, dtype=np.int64)
+        ring_sums[slots], ring_counts[slots] = sums[-w:], counts[-w:]
+        self.sums, self.counts = ring_sums.tolist(), ring_counts.tolist()
+        if self.count >= w:
+            self.value = float(out[-1])
+        return out
+
+
+# --- EMA ---------------------------------------------------------------------------------
+
+def ema(values, span):
+    """Exponential moving average, alpha = 2 / (span + 1), starting at the first value."""
+    alpha = 2.0 / (span + 1)
+    out = np.empty(len(values))
+    e = None
+    for i, x in enumerate(np.asarray(values, dtype=np.float64).tolist()):
+        e = x if e is None else e + alpha * (x - e)
+        out[i] = e
+    return out
+
+
+class EMA():
+    __slots__ = ("alpha", "value")
+
+    def __init__(self, span):
+        self.alpha = 2.0 / (span + 1)
+        self.value = None
+
+    def update(self, x):
+        e = self.value
+        self.value = x if e is None else e + self.alpha * (x - e)
+        return self.value
+
+
+# --- ATR ---------------------------------------------------------------------------------
+
+def true_range(high, low, close):
+    high, low, close = (np.asarray(a, dtype=np.float64) for a in (high, low, close))
+    tr = high - low
+    if len(tr) > 1:
+        prev = close[:-1]
+        tr[1:] = np.maximum(np.maximum(tr[1:], np.abs(high[1:] - prev)), np.abs(low[1:] - prev))
+    return tr
+
+
+def atr(high, low, close, window=14):
+    """Wilder's average true range: mean of the first `window` true ranges, then smoothed."""
+    out = np.full(len(high), np.nan)
+    total = 0.0
+    value = NAN
+    for i, tr in enumerate(true_range(high, low, close).tolist()):
+        if i < window:
+            total = total + tr
+            if i == window - 1:
+                value = total / window
+        else:
+            value = (value * (window - 1) + tr) / window
+        out[i] = value
+    return out
+
+
+class ATR():
+    __slots__ = ("window", "prev_close", "count", "total", "value")
+
+    def __init__(self, window=14):
+        self.window = window
+        self.prev_close = None
+        self.count = 0
+        self.total = 0.0
+        self.value = NAN
+
+    def update(self, high, low, close):
+        tr = high - low
+        if self.prev_close is not None:
+            tr = max(max(tr, abs(high - self.prev_close)), abs(low - self.prev_close))
+        self.prev_close = close
+        if self.count < self.window:
+            self.total = self.total + tr
+            if self.count == self.window - 1:
+                self.value = self.total / self.window
+        else:
+            self.value = (self.value * (self.window - 1) + tr) / self.window
+        self.count += 1
+        return self.value
+
+
+# --- VWAP --------------------------------------------------------------------------------
+
+def vwap(ts_ns, high, low, close, volume):
+    """Session VWAP of the typical price (high + low + close) / 3, restarting every New York day."""
+    price = (np.asarray(high, dtype=np.float64) + low + close) / 3
+    volume = np.asarray(volume, dtype=np.float64)
+    out = np.full(len(price), np.nan)
+    if len(price) == 0:
+        return out
+    day = trading_days(ts_ns)
+    starts = np.flatnonzero(np.diff(day, prepend=day[0] - 1))
+    ends = np.append(starts[1:], len(price))
+    for s, e in zip(starts, ends):  # one cumsum per session, a few hundred per year
+        pv = np.cumsum(price[s:e] * volume[s:e])
+        v = np.cumsum(volume[s:e])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[s:e] = np.where(v > 0, pv / v, np.nan)
+    return out
+
+
+class VWAP():
+    __slots__ = ("next_day_ns", "pv", "v", "value")
+
+    def __init__(self):
+        self.next_day_ns = -1
+        self.pv = 0.0
+        self.v = 0.0
+        self.value = NAN
+
+    def update(self, ts_ns, high, low, close, volume):
+        if ts_ns >= self.next_day_ns:
+            self.next_day_ns = _session_times(ts_ns)[2]
+            self.pv = 0.0
+            self.v = 0.0
+        self.pv = self.pv + (high + low + close) / 3 * volume
+        self.v = self.v + volume
+        self.value = self.pv / self.v if self.v > 0 else NAN
+        return self.value
+
+
+# --- rolling high / low ------------------------------------------------------------------
+
+def rolling_high(values, window):
+    x = np.asarray(values, dtype=np.float64)
+    out = np.full(len(x), np.nan)
+    if window <= len(x):
+        out[window - 1:] = sliding_window_view(x, window).max(axis=1)
+    return out
+
+
+def rolling_low(values, window):
+    x = np.asarray(values, dtype=np.float64)
+    out = np.full(len(x), np.nan)
+    if window <= len(x):
+        out[window - 1:] = sliding_window_view(x, window).min(axis=1)
+    return out
+
+
+class RollingHigh():
+    """Max of the last `window` values. A monotonic deque keeps only values that can still be the max."""
+    __slots__ = ("window", "items", "count", "sign")
+
+    def __init__(self, window):
+        self.window = window
+        self.items = deque()  # (index, value), values decreasing
+        self.count = 0
+        self.sign = 1.0
+
+    def update(self, x):
+        items = self.items
+        key = self.sign * x
+        while items and self.sign * items[-1][1] <= key:
+            items.pop()
+        items.append((self.count, x))
+        if items[0][0] <= self.count - self.window:
+            items.popleft()
+        self.count += 1
+        return items[0][1] if self.count >= self.window else NAN
+
+
+class RollingLow(RollingHigh):
+    __slots__ = ()
+
+    def __init__(self, window):
+        super().__init__(window)
+        self.sign = -1.0
+
+
+# --- opening range -----------------------------------------------------------------------
+
+def opening_range(ts_ns, high, low, minutes=15):
+    """
+    Per bar: the day's opening range high / low (bars from the session open to open + minutes),
+    NaN until the first bar at or after 9:30 + minutes, and on days with no bar inside the range.
+    """
+    ts = np.asarray(ts_ns, dtype=np.int64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    range_high = np.full(len(ts), np.nan)
+    range_low = np.full(len(ts), np.nan)
+    if len(ts) == 0:
+        return range_high, range_low
+    day = trading_days(ts)
+    days, first, row = np.unique(day, return_index=True, return_inverse=True)
+    # session open of every day, looked up from the first bar of that day
+    opens = np.array([_session_times(int(ts[i]))[0] for i in first], dtype=np.int64)
+    start = opens[row]
+    end = start + minutes * 60 * NS
+
+    inside = (ts >= start) & (ts < end)
+    day_high = np.full(len(days), -np.inf)
+    day_low = np.full(len(days), np.inf)
+    np.maximum.at(day_high, row[inside], high[inside])
+    np.minimum.at(day_low, row[inside], low[inside])
+    ready = (ts >= end) & np.isfinite(day_high[row])
+    range_high[ready] = day_high[row][ready]
+    range_low[ready] = day_low[row][ready]
+    return range_high, range_low
+
+
+class OpeningRange():
+    """Streaming opening range, update() returns True once the range is complete for the day."""
+    __slots__ = ("minutes", "session_open_ns", "range_end_ns", "next_day_ns", "high", "low")
+
+    def __init__(self, minutes=15):
+        self.minutes = minutes
+        self.next_day_ns = -1  # forces a new session on the first bar
+        self.session_open_ns = self.range_end_ns = 0
+        self.high = float("-inf")
+        self.low = float("inf")
+
+    def start_session(self, ts_ns):
+        self.session_open_ns, self.range_end_ns, self.next_day_ns = _session_times(ts_ns, self.minutes)
+        self.high = float("-inf")
+        self.low = float("inf")
+
+    def update(self, ts_ns, high, low):
+        if ts_ns >= self.next_day_ns:
+            self.start_session(ts_ns)
+        if ts_ns < self.session_open_ns:
+            return False
+        if ts_ns < self.range_end_ns:
+            if high > self.high:
+                self.high = high
+            if low < self.low:
+                self.low = low
+            return False
+        return True
+
+    @property
+    def value(self):
+        """(high, low) once complete, (nan, nan) before or on days without bars in the range."""
+        if self.high == float("-inf"):
+            return NAN, NAN
+        return self.high, self.low
+
+
+def _check():
+    # batch vs streaming on random walks, has to be bit for bit equal
+    rng = np.random.default_rng(0)
+    n = 50_000
+    close = 100 + np.cumsum(rng.normal(0, 0.1, n))
+    high = close + rng.uniform(0, 0.2, n)
+    low = close - rng.uniform(0, 0.2, n)
+    volume = rng.integers(0, 5000, n).astype(np.float64)
+    # 1-minute bars 9:30-16:00 over several New York days (2022-01-03 09:30 EST = 14:30 UTC)
+    minute = np.arange(n)
+    ts = (1641220200 + (minute // 390) * 86400 + (minute % 390) * 60) * NS
+
+    def stream(indicator, *columns):
+        return np.array([indicator.update(*row) for row in zip(*(c.tolist() for c in columns))])
+
+    checks = {}
+    for w in (1, 20, 200):
+        checks[f"sma({w})"] = (sma(close, w), stream(SMA(w), close))
+        checks[f"rolling_high({w})"] = (rolling_high(high, w), stream(RollingHigh(w), high))
+        checks[f"rolling_low({w})"] = (rolling_low(low, w), stream(RollingLow(w), low))
+    checks["ema(20)"] = (ema(close, 20), stream(EMA(20), close))
+    checks["atr(14)"] = (atr(high, low, close, 14), stream(ATR(14), high, low, close))
+    checks["vwap"] = (vwap(ts, high, low, close, volume), stream(VWAP(), ts, high, low, close, volume))
+    # gaps in the closes (e.g. yfinance): NaN first value and NaN in the middle, has to match pandas too
+    gappy = close.copy()
+    gappy[[0, 1000, 1001, 30_000]] = NAN
+    for w in (1, 20):
+        checks[f"sma({w}) with NaN"] = (sma(gappy, w), stream(SMA(w), gappy))
+    # chunk by chunk (the backtest engine feeds one session at a time), chunks shorter and longer than w
+    for w in (1, 20, 200):
+        chunked = SMA(w)
+        cuts = np.cumsum(rng.integers(1, 400, n // 50))
+        checks[f"sma({w}) chunks"] = (sma(gappy, w), np.concatenate([chunked.update_many(part) for part in np.split(gappy, cuts[cuts < n])]))
+    rolling = pd.Series(gappy).rolling(20).mean().to_numpy()
+    rh, rl = opening_range(ts, high, low, 15)
+    orb = OpeningRange(15)
+    live = np.array([orb.value if orb.update(t, h, l) else (NAN, NAN) for t, h, l in zip(ts.tolist(), high.tolist(), low.tolist())])
+    checks["opening_range(15)"] = (np.column_stack([rh, rl]), live)
+
+    ok = True
+    for name, (batch, live) in checks.items():
+        same = np.array_equal(batch, live, equal_nan=True)
+        ok &= same
+        print(f"{name:20} {'identical' if same else 'DIFFERENT'}")
+    # pandas sums in another order, so only equal to rounding (but NaN in exactly the same places)
+    same = np.allclose(sma(gappy, 20), rolling, rtol=0, atol=1e-9, equal_nan=True)
+    ok &= same
+    print(f"{'sma(20) vs pandas':20} {'matches' if same else 'DIFFERENT'}")
+    return ok
+
+
+# start program
+if __name__ == "__main__":
+    start = time.perf_counter()
+    ok = _check()
+    print(f"{'All indicators match' if ok else 'MISMATCH'} ({time.perf_counter() - start:.2f} seconds)")
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,194 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from bar_store import NY, BarStore
+from trading_calendar import default_calendar
+
+"""
+Vectorized opening-range-breakout backtest over stored 1-minute bars.
+
+Every session is laid out as one row of a (days x 390 minutes) grid, so the opening range,
+first breakout bar, stop/target exit and end-of-day flattening for every day (and for many
+opening_range_minutes values at once) are NumPy operations over that grid, no per-bar loop.
+
+Rules (same as OpeningRangeBreakout in ORB_strategy.py):
+- range = high/low of the first `k` minutes after the session open
+- the first later bar trading above the range goes long, below goes short (a bar doing both: no trade)
+- entry at the range level (or the bar's open if it gapped through)
+- stop at the other side of the range, target at entry +/- target_multiple * range size
+- anything still open is closed at the last bar of the session (half days included)
+
+    python orb_backtest.py AAPL MSFT --minutes 5 60 5 --target 2
+"""
+
+SESSION_MINUTES = 390  # longest NYSE session, 9:30 - 16:00
+
+
+def session_grid(bars):
+    """
+    Put bars into (days, 390) grids of open/high/low/close, NaN where there is no bar.
+    Column 0 is the session open from the trading calendar, half days just end early.
+    Returns (days as datetime64[D], dict of grids). Bars outside the sessions are ignored.
+    """
+    calendar = default_calendar()
+    pos = calendar.locate(bars["ts"])
+    inside = pos >= 0
+    pos = pos[inside]
+    minute = (bars["ts"][inside] - calendar.opens[pos]) // (60 * 10**9)
+
+    sessions, row = np.unique(pos, return_inverse=True)
+    grids = {}
+    for col in ("open", "high", "low", "close"):
+        grid = np.full((len(sessions), SESSION_MINUTES), np.nan)
+        grid[row, minute] = bars[col][inside]
+        grids[col] = grid
+    return calendar.days[sessions].astype("datetime64[D]"), grids
+
+
+def _first_true(mask, default):
+    """Index of the first True along the last axis, `default` where there is none."""
+    return np.where(mask.any(axis=-1), mask.argmax(axis=-1), default)
+
+
+def simulate(grids, minutes, target_multiple=2.0, max_cells=30_000_000):
+    """
+    Run the ORB rules for every opening range length in `minutes` and every day.
+    Returns a dict of (len(minutes), days) arrays:
+    direction (+1 long, -1 short, 0 no trade), entry_idx, entry_price, exit_idx, exit_price,
+    reason (0 none, 1 stop, 2 target, 3 end of day), ret (simple return of the trade)
+    """
+    o, h, l, c = grids["open"], grids["high"], grids["low"], grids["close"]
+    n_days, n_min = h.shape
+    minutes = np.asarray(list(minutes), dtype=np.int64)
+    n_k = len(minutes)
+    cols = np.arange(n_min)
+
+    # running range over the session, the range for k minutes is column k-1
+    run_high = np.fmax.accumulate(h, axis=1)
+    run_low = np.fmin.accumulate(l, axis=1)
+    # last bar of each session, for end-of-day exits
+    valid = ~np.isnan(c)
+    last_idx = n_min - 1 - np.argmax(valid[:, ::-1], axis=1)
+    last_close = c[np.arange(n_days), last_idx]
+
+    out = {name: np.zeros((n_k, n_days), dtype=dtype) for name, dtype in [
+        ("direction", np.int8), ("entry_idx", np.int64), ("entry_price", np.float64),
+        ("exit_idx", np.int64), ("exit_price", np.float64), ("reason", np.int8), ("ret", np.float64)]}
+
+    # a few k values at a time, so the (k, days, minutes) blocks stay within max_cells
+    step = max(1, max_cells // max(1, n_days * n_min))
+    for k0 in range(0, n_k, step):
+        ks = minutes[k0:k0 + step]
+        rh = run_high[:, ks - 1].T[:, :, None]  # (k, days, 1)
+        rl = run_low[:, ks - 1].T[:, :, None]
+        after = cols[None, None, :] >= ks[:, None, None]
+
+        # first breakout bar either way
+        up = _first_true(after & (h[None] > rh), n_min)
+        down = _first_true(after & (l[None] < rl), n_min)
+        traded = (np.minimum(up, down) < n_min) & (up != down) & ~np.isnan(rh[..., 0])
+        direction = np.where(traded, np.where(up < down, 1, -1), 0)
+        entry_idx = np.where(direction > 0, up, np.where(direction < 0, down, 0))
+
+        rh, rl = rh[..., 0], rl[..., 0]
+        entry_open = np.take_along_axis(np.broadcast_to(o, (len(ks),) + o.shape), entry_idx[..., None], axis=2)[..., 0]
+        entry_price = np.where(direction > 0, np.fmax(entry_open, rh), np.fmin(entry_open, rl))
+        stop = np.where(direction > 0, rl, rh)
+        target = entry_price + direction * target_multiple * (rh - rl)
+
+        # exits only from the bar after entry
+        later = cols[None, None, :] > entry_idx[..., None]
+        long = (direction > 0)[..., None]
+        stop_hit = later & np.where(long, l[None] <= stop[..., None], h[None] >= stop[..., None])
+        target_hit = later & np.where(long, h[None] >= target[..., None], l[None] <= target[..., None])
+        stop_idx = _first_true(stop_hit, n_min)
+        target_idx = _first_true(target_hit, n_min)
+
+        # same bar hits both: assume the stop came first
+        by_stop = (stop_idx < n_min) & (stop_idx <= target_idx)
+        by_target = (target_idx < n_min) & ~by_stop
+        exit_idx = np.where(by_stop, stop_idx, np.where(by_target, target_idx, last_idx[None, :]))
+        exit_open = np.take_along_axis(np.broadcast_to(o, (len(ks),) + o.shape),
+                                       np.minimum(exit_idx, n_min - 1)[..., None], axis=2)[..., 0]
+        # gaps through a level fill at the open: worse for stops, better for targets
+        stop_fill = np.where(direction > 0, np.fmin(exit_open, stop), np.fmax(exit_open, stop))
+        target_fill = np.where(direction > 0, np.fmax(exit_open, target), np.fmin(exit_open, target))
+        exit_price = np.where(by_stop, stop_fill, np.where(by_target, target_fill, last_close[None, :]))
+        reason = np.where(by_stop, 1, np.where(by_target, 2, 3))
+
+        sl = slice(k0, k0 + len(ks))
+        out["direction"][sl] = direction
+        out["entry_idx"][sl] = np.where(traded, entry_idx, -1)
+        out["entry_price"][sl] = np.where(traded, entry_price, np.nan)
+        out["exit_idx"][sl] = np.where(traded, exit_idx, -1)
+        out["exit_price"][sl] = np.where(traded, exit_price, np.nan)
+        out["reason"][sl] = np.where(traded, reason, 0)
+        out["ret"][sl] = np.where(traded, direction * (exit_price - entry_price) / entry_price, 0.0)
+    return out
+
+
+def orb_sweep(bars, minutes=range(5, 61, 5), target_multiple=2.0):
+    """One row of stats per opening_range_minutes value."""
+    days, grids = session_grid(bars)
+    sim = simulate(grids, minutes, target_multiple)
+    direction, ret = sim["direction"], sim["ret"]
+    trades = (direction != 0).sum(axis=1)
+    wins = ((direction != 0) & (ret > 0)).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.DataFrame({
+            "opening_range_minutes": np.asarray(list(minutes)),
+            "days": len(days),
+            "trades": trades,
+            "long": (direction > 0).sum(axis=1),
+            "short": (direction < 0).sum(axis=1),
+            "win_rate": wins / trades,
+            "avg_return": ret.sum(axis=1) / trades,
+            "total_return": np.prod(1.0 + ret, axis=1) - 1.0,
+            "stops": (sim["reason"] == 1).sum(axis=1),
+            "targets": (sim["reason"] == 2).sum(axis=1),
+            "eod_exits": (sim["reason"] == 3).sum(axis=1),
+        })
+
+
+def orb_trades(bars, opening_range_minutes=15, target_multiple=2.0):
+    """Trade list (one row per traded day) for a single opening range length."""
+    days, grids = session_grid(bars)
+    sim = {name: values[0] for name, values in simulate(grids, [opening_range_minutes], target_multiple).items()}
+    traded = sim["direction"] != 0
+    calendar = default_calendar()
+    opens = calendar.opens[np.searchsorted(calendar.days, days[traded].astype(np.int64))]
+    day_start = pd.DatetimeIndex(opens, tz="UTC").tz_convert(NY)
+    return pd.DataFrame({
+        "day": days[traded],
+        "direction": np.where(sim["direction"][traded] > 0, "LONG", "SHORT"),
+        "entry_time": day_start + pd.to_timedelta(sim["entry_idx"][traded], unit="min"),
+        "entry_price": sim["entry_price"][traded],
+        "exit_time": day_start + pd.to_timedelta(sim["exit_idx"][traded], unit="min"),
+        "exit_price": sim["exit_price"][traded],
+        "exit_reason": np.array(["", "stop", "target", "eod"])[sim["reason"][traded]],
+        "return": sim["ret"][traded],
+    })
+
+
+# start program
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Vectorized ORB backtest over stored 1-min bars")
+    p.add_argument("symbols", nargs="+", help="Symbols in the bar store, e.g. AAPL MSFT")
+    p.add_argument("--minutes", nargs=3, type=int, default=[5, 61, 5], metavar=("START", "STOP", "STEP"),
+                   help="opening_range_minutes values to sweep, like range(START, STOP, STEP)")
+    p.add_argument("--target", type=float, default=2.0, help="Target as a multiple of the range size")
+    p.add_argument("--start", help="First day, e.g. 2022-01-01")
+    p.add_argument("--end", help="Last day (exclusive), e.g. 2023-01-01")
+    p.add_argument("--store", default=None, help="Bar store folder")
+    args = p.parse_args()
+
+    store = BarStore(args.store)
+    for symbol in args.symbols:
+        start = time.perf_counter()
+        bars = store.read_array(symbol, args.start, args.end)
+        result = orb_sweep(bars, range(*args.minutes), args.target)
+        print(f"\n=== {symbol}: {len(bars)} bars, {len(result)} range lengths in {time.perf_counter() - start:.2f} seconds ===")
+        print(result.to_string(index=False))
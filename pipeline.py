@@ -0,0 +1,253 @@
+import asyncio
+import time
+import traceback
+from collections import deque, namedtuple
+
+import numpy as np
+from ib_async import IB, RealTimeBar
+from ib_async.contract import Stock
+
+"""
+Pipeline stage between ib.reqRealTimeBars and the strategy code.
+
+ib_async calls updateEvent handlers on the event loop, so anything slow in a handler stalls
+every other subscription. Here the handler only turns the newest RealTimeBar into a small Bar
+tuple and puts it in that symbol's bounded queue; one worker task per symbol takes bars out and
+runs the strategy on them, inline or in an executor (thread / process pool) for heavy signals.
+
+What happens when a queue is full (policy):
+- "drop_oldest": the oldest queued bar is thrown away, the newest is kept
+- "coalesce":    the new bar is merged into the newest queued one (high = max, low = min,
+                 close = last, volume added) as long as both start in the same coalesce_ns
+                 bucket (1 minute by default), otherwise the oldest is dropped
+- "block":       nothing is lost. Async producers (await queue.put) wait for room; ib's
+                 callbacks can't wait, so their bars stay queued past maxsize (counted as overflow)
+
+Per symbol metrics (pipeline.stats() / pipeline.report()): queue depth and its max, bars in,
+handled, dropped, coalesced, overflow, errors, and lag = seconds from the bar arriving to the
+handler finishing with it (queue wait + compute).
+
+A handler (or on_result) that raises is printed with its symbol and counted in errors, and the
+worker goes on with the next bar. If a worker task stops anyway, run() raises instead of letting
+that symbol's queue fill up unnoticed.
+
+    pipeline = Pipeline(maxsize=256, policy="coalesce")
+    pipeline.subscribe(ib, "AAPL", engine_handler, on_result=print_signal)
+    await pipeline.run(report_every=60)
+
+With a process pool the handler runs in another process: it has to be a module level function
+and can't keep state between bars (thread pools and inline handlers can).
+"""
+
+NS = 1_000_000_000
+POLICIES = ("drop_oldest", "coalesce", "block")
+
+Bar = namedtuple("Bar", "symbol ts_ns open high low close volume wap received")
+
+
+def bar_from_realtime(symbol: str, bar: RealTimeBar):
+    return Bar(symbol, int(bar.time.timestamp()) * NS, bar.open_, bar.high, bar.low, bar.close,
+               bar.volume, bar.wap, time.monotonic())
+
+
+def merge_bars(old: Bar, new: Bar):
+    """One bar covering both: keeps the first open and arrival time, so lag still counts from the older bar."""
+    return Bar(old.symbol, old.ts_ns, old.open, max(old.high, new.high), min(old.low, new.low), new.close,
+               old.volume + new.volume, new.wap, old.received)
+
+
+class BarQueue():
+    """Bounded FIFO of bars for one symbol with a backpressure policy."""
+
+    def __init__(self, symbol: str, maxsize=256, policy="drop_oldest", coalesce_ns=60 * NS):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}, not {policy!r}")
+        self.symbol = symbol
+        self.maxsize = maxsize
+        self.policy = policy
+        self.coalesce_ns = coalesce_ns
+        self._items = deque()
+        self._ready = asyncio.Event()  # set while there is something to take
+        self._room = asyncio.Event()   # set while there is room (for blocking producers)
+        self._room.set()
+
+        self.received = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.overflow = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put_nowait(self, bar: Bar):
+        """Add a bar without waiting, applying the policy when full. Safe to call from ib callbacks."""
+        self.received += 1
+        items = self._items
+        if len(items) >= self.maxsize:
+            if self.policy == "coalesce" and items[-1].ts_ns // self.coalesce_ns == bar.ts_ns // self.coalesce_ns:
+                items[-1] = merge_bars(items[-1], bar)
+                self.coalesced += 1
+                return
+            if self.policy == "block":
+                self.overflow += 1
+            else:
+                items.popleft()
+                self.dropped += 1
+        items.append(bar)
+        self.max_depth = max(self.max_depth, len(items))
+        if len(items) >= self.maxsize:
+            self._room.clear()
+        self._ready.set()
+
+    async def put(self, bar: Bar):
+        """Add a bar; with the "block" policy this waits until the worker makes room."""
+        if self.policy == "block":
+            while len(self._items) >= self.maxsize:
+                await self._room.wait()
+        self.put_nowait(bar)
+
+    async def get(self):
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        bar = self._items.popleft()
+        if len(self._items) < self.maxsize:
+            self._room.set()
+        return bar
+
+
+class Pipeline():
+    def __init__(self, maxsize=256, policy="drop_oldest", executor=None, coalesce_ns=60 * NS):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.executor = executor  # None = run handlers on the event loop
+        self.coalesce_ns = coalesce_ns
+        self.queues = {}    # symbol -> BarQueue
+        self._workers = {}  # symbol -> task
+        self._subscriptions = []  # (ib, RealTimeBarList)
+        self._lag = {}      # symbol -> [count, total seconds, max seconds]
+        self._errors = {}   # symbol -> bars whose handler raised
+        self.started = time.perf_counter()
+
+    def add(self, symbol: str, handler, on_result=None):
+        """
+        Queue + worker for one symbol. handler(bar) runs for every bar taken from the queue,
+        on_result(bar, result) runs back on the event loop when the result is not None.
+        Returns the BarQueue, producers put bars into it.
+        """
+        queue = BarQueue(symbol, self.maxsize, self.policy, self.coalesce_ns)
+        self.queues[symbol] = queue
+        self._lag[symbol] = [0, 0.0, 0.0]
+        self._errors[symbol] = 0
+        self._workers[symbol] = asyncio.ensure_future(self._work(queue, handler, on_result))
+        return queue
+
+    def subscribe(self, ib: IB, symbol: str, handler, on_result=None, barSize=5, whatToShow="TRADES", useRTH=True):
+        """reqRealTimeBars for symbol, its bars go through a queue to handler."""
+        queue = self.add(symbol, handler, on_result)
+        bars = ib.reqRealTimeBars(Stock(symbol, "SMART", "USD"), barSize=barSize, whatToShow=whatToShow, useRTH=useRTH)
+
+        # only the newest bar is new, the handler stays this cheap
+        def on_bar(bars: list[RealTimeBar], hasNewBar: bool):
+            if hasNewBar:
+                queue.put_nowait(bar_from_realtime(symbol, bars[-1]))
+
+        bars.updateEvent += on_bar
+        self._subscriptions.append((ib, bars))
+        return queue
+
+    async def _work(self, queue: BarQueue, handler, on_result):
+        loop = asyncio.get_running_loop()
+        lag = self._lag[queue.symbol]
+        while True:
+            bar = await queue.get()
+            try:
+                if self.executor is None:
+                    result = handler(bar)
+                else:
+                    result = await loop.run_in_executor(self.executor, handler, bar)
+                if result is not None and on_result is not None:
+                    on_result(bar, result)
+            except Exception as e:
+                # one bad bar must not stop this symbol's worker, log it and take the next one
+                self._errors[queue.symbol] += 1
+                print(f"Pipeline: handler failed for {queue.symbol} on bar {bar.ts_ns}: {e!r}")
+                if self._errors[queue.symbol] == 1:
+                    traceback.print_exc()  # full traceback only for the first error of a symbol
+            seconds = time.monotonic() - bar.received
+            lag[0] += 1
+            lag[1] += seconds
+            lag[2] = max(lag[2], seconds)
+
+    async def drain(self):
+        """Wait until every queue is empty (the last bar may still be in its handler)."""
+        while any(len(queue) for queue in self.queues.values()):
+            self._check_workers({task for task in self._workers.values() if task.done()})  # else this never ends
+            await asyncio.sleep(0.001)
+
+    async def run(self, report_every=None):
+        """
+        Keep the workers going, printing report() every report_every seconds (None = never).
+        Workers only stop when something went badly wrong: run() then raises RuntimeError.
+        """
+        try:
+            while self._workers:
+                done, _ = await asyncio.wait(list(self._workers.values()), timeout=report_every or None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                self._check_workers(done)
+                self.report()
+        finally:
+            self.close()
+
+    def _check_workers(self, done):
+        # a finished worker means a symbol no longer gets its bars handled
+        for symbol, task in self._workers.items():
+            if task in done:
+                error = None if task.cancelled() else task.exception()
+                raise RuntimeError(f"Pipeline worker for {symbol} stopped") from error
+
+    def close(self):
+        for ib, bars in self._subscriptions:
+            ib.cancelRealTimeBars(bars)
+        self._subscriptions.clear()
+        for task in self._workers.values():
+            task.cancel()
+
+    def stats(self):
+        """One dict per symbol: depth, max_depth, received, handled, dropped, coalesced, overflow, errors, lag."""
+        rows = []
+        for symbol, queue in self.queues.items():
+            count, total, worst = self._lag[symbol]
+            rows.append({
+                "symbol": symbol,
+                "depth": len(queue),
+                "max_depth": queue.max_depth,
+                "received": queue.received,
+                "handled": count,
+                "dropped": queue.dropped,
+                "coalesced": queue.coalesced,
+                "overflow": queue.overflow,
+                "errors": self._errors[symbol],
+                "lag_ms_avg": total / count * 1e3 if count else 0.0,
+                "lag_ms_max": worst * 1e3,
+            })
+        return rows
+
+    def report(self):
+        rows = self.stats()
+        if not rows:
+            return
+        elapsed = time.perf_counter() - self.started
+        handled = sum(row["handled"] for row in rows)
+        worst = max(rows, key=lambda row: row["lag_ms_max"])
+        depths = np.array([row["depth"] for row in rows])
+        print(
+            f"Pipeline ({self.policy}): {len(rows)} symbols, {sum(row['received'] for row in rows)} bars in, "
+            f"{handled} handled ({handled / elapsed if elapsed > 0 else 0.0:,.0f}/s), "
+            f"{sum(row['dropped'] for row in rows)} dropped, {sum(row['coalesced'] for row in rows)} coalesced, "
+            f"{sum(row['overflow'] for row in rows)} overflow, {sum(row['errors'] for row in rows)} errors | depth now avg {depths.mean():.1f} max {depths.max()}, "
+            f"peak {max(row['max_depth'] for row in rows)} | "
+            f"lag avg {sum(row['lag_ms_avg'] * row['handled'] for row in rows) / max(handled, 1):.3f} ms, "
+            f"max {worst['lag_ms_max']:.3f} ms ({worst['symbol']})"
+        )
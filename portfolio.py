@@ -0,0 +1,173 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from indicators import sma
+from price_cache import default_cache
+
+"""
+SMA crossover for a whole universe at once.
+
+All closes are held as one (time x symbol) array. Rolling means, signals, positions, weights,
+trading costs and portfolio returns are whole-array operations, so 500 symbols x 20 years
+(about 5000 x 500 values, 20 MB per float64 array) is one pass of a few array operations
+instead of 500 SMABacktester objects.
+
+- a symbol can trade from the first bar where its SMA_L exists; NaN closes (not listed yet,
+  delisted, holidays of that symbol) mean no position
+- signal at the close of bar t, held over bar t+1 (same as SMABacktester)
+- weights: "equal"   each symbol gets 1/N of the portfolio, unused slices stay in cash
+           "active"  the portfolio is split evenly between the symbols that are long
+           "inverse_vol" like "active" but scaled by 1 / rolling volatility
+- portfolio return = sum(weight * simple return) - cost_bps * turnover (sum of |weight change|)
+  simple returns, not log returns, because those are what add up across symbols
+- weights are reset to the target every bar
+
+    python portfolio.py AAPL MSFT NVDA AMZN --sma 50 200 --start 2005-01-01 --end 2025-01-01 --cost 5
+    python portfolio.py --symbols-file sp500.txt --weighting active
+"""
+
+WEIGHTINGS = ("equal", "active", "inverse_vol")
+
+
+def load_closes(symbols, start, end, cache=None, timeframe=None):
+    """(time x symbol) DataFrame of closes, dates of all symbols united, NaN where a symbol has no bar."""
+    if timeframe is None:
+        frames = (cache or default_cache()).get_many(symbols, start, end)
+    else:
+        from resample import ResampleCache
+        cache = cache or ResampleCache()
+        frames = {symbol: cache.get(symbol, start, end, timeframe) for symbol in symbols}
+    return pd.DataFrame({symbol: frames[symbol]["Close"] for symbol in symbols}).sort_index()
+
+
+def sma_portfolio(closes, SMA_S, SMA_L, weighting="equal", cost_bps=0.0, vol_window=60):
+    """
+    closes: (time x symbol) array or DataFrame.
+    Returns a dict of arrays: position, weights (time x symbol), turnover, cost,
+    returns (net portfolio return per bar), benchmark (equal weight buy & hold, rebalanced every bar).
+    """
+    if weighting not in WEIGHTINGS:
+        raise ValueError(f"weighting must be one of {WEIGHTINGS}")
+    values = np.asarray(closes, dtype=np.float64)
+    t, n = values.shape
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # simple return from bar t-1 to bar t, 0 where either close is missing
+        returns = np.zeros((t, n))
+        returns[1:] = values[1:] / values[:-1] - 1.0
+        returns[~np.isfinite(returns)] = 0.0
+
+        sma_s = sma(values, SMA_S)
+        sma_l = sma(values, SMA_L)
+        position = (sma_s > sma_l) & ~np.isnan(values)  # NaN compares as False: no position in the warm-up
+
+        if weighting == "equal":
+            weights = position / n
+        elif weighting == "active":
+            weights = position / np.maximum(position.sum(axis=1, keepdims=True), 1)
+        else:
+            log_returns = np.log1p(returns)
+            vol = np.sqrt(np.maximum(sma(log_returns ** 2, vol_window)
+                                     - sma(log_returns, vol_window) ** 2, 0.0))
+            raw = np.where(position & (vol > 0), 1.0 / vol, 0.0)
+            weights = raw / np.where(raw.sum(axis=1, keepdims=True) > 0, raw.sum(axis=1, keepdims=True), 1.0)
+
+    # the weights set at the close of bar t earn the returns of bar t+1
+    held = np.vstack([np.zeros((1, n)), weights[:-1]])
+    turnover = np.abs(np.diff(weights, axis=0, prepend=np.zeros((1, n)))).sum(axis=1)
+    cost = turnover * cost_bps / 1e4
+    portfolio = (held * returns).sum(axis=1) - cost
+
+    listed = ~np.isnan(values)
+    listed[1:] &= ~np.isnan(values[:-1])
+    benchmark = np.where(listed.any(axis=1), (returns * listed).sum(axis=1) / np.maximum(listed.sum(axis=1), 1), 0.0)
+    return {
+        "position": position,
+        "weights": weights,
+        "turnover": turnover,
+        "cost": cost,
+        "returns": portfolio,
+        "benchmark": benchmark,
+    }
+
+
+class PortfolioBacktester():
+    def __init__(self, symbols, SMA_S, SMA_L, start, end, weighting="equal", cost_bps=0.0, cache=None, timeframe=None):
+        self.symbols = list(symbols)
+        self.SMA_S = SMA_S
+        self.SMA_L = SMA_L
+        self.start = start
+        self.end = end
+        self.weighting = weighting
+        self.cost_bps = cost_bps
+        self.cache = cache
+        self.timeframe = timeframe  # None: daily from yfinance, "15m"/"60m"/"1d": from the bar store
+        self.results = None
+        self.get_data()
+
+    def get_data(self):
+        self.closes = load_closes(self.symbols, self.start, self.end, self.cache, self.timeframe)
+        return self.closes
+
+    def test_results(self):
+        out = sma_portfolio(self.closes, self.SMA_S, self.SMA_L, self.weighting, self.cost_bps)
+        # start where the first symbol can trade, like the dropna in SMABacktester
+        first = np.flatnonzero(~np.isnan(sma(self.closes.to_numpy(), self.SMA_L)).any(axis=1))
+        start = first[0] + 1 if len(first) else len(self.closes)
+        index = self.closes.index[start:]
+        data = pd.DataFrame({
+            "returns": out["benchmark"][start:],
+            "ret_strategy": out["returns"][start:],
+            "turnover": out["turnover"][start:],
+            "cost": out["cost"][start:],
+            "exposure": out["weights"][start:].sum(axis=1),
+        }, index=index)
+        data["returnsbh"] = (1.0 + data["returns"]).cumprod()
+        data["strategybh"] = (1.0 + data["ret_strategy"]).cumprod()
+        self.weights = pd.DataFrame(out["weights"], index=self.closes.index, columns=self.closes.columns)
+        self.results = data
+        if data.empty:
+            return np.nan, np.nan
+        perf = data["strategybh"].iloc[-1]
+        outperf = perf - data["returnsbh"].iloc[-1]
+        return round(perf, 6), round(outperf, 6)
+
+    def Plot_result(self):
+        if self.results is None:
+            print("No results to plot yet. Run test_results() first.")
+        else:
+            self.results[["returnsbh", "strategybh"]].plot(figsize=(12, 8), fontsize=15,
+                title=f"{len(self.symbols)} symbols | SMA{self.SMA_S} & SMA{self.SMA_L} | {self.weighting}")
+
+
+# start program
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Vectorized SMA crossover over a universe of symbols")
+    p.add_argument("symbols", nargs="*")
+    p.add_argument("--symbols-file", help="Text file with one symbol per line")
+    p.add_argument("--sma", nargs=2, type=int, default=[50, 200], metavar=("SMA_S", "SMA_L"))
+    p.add_argument("--start", default="2005-01-01")
+    p.add_argument("--end", default=pd.Timestamp.today().strftime("%Y-%m-%d"))
+    p.add_argument("--weighting", choices=WEIGHTINGS, default="equal")
+    p.add_argument("--cost", type=float, default=0.0, help="Trading cost in basis points of turnover")
+    p.add_argument("--timeframe", default=None, help="Use bars from the 1-min store (5m, 15m, 60m, 1d) instead of yfinance")
+    args = p.parse_args()
+
+    symbols = list(args.symbols)
+    if args.symbols_file:
+        with open(args.symbols_file) as f:
+            symbols += [line.strip().upper() for line in f if line.strip()]
+    if not symbols:
+        p.error("give at least one symbol or --symbols-file")
+
+    timer = time.perf_counter()
+    tester = PortfolioBacktester(symbols, args.sma[0], args.sma[1], args.start, args.end,
+                                 args.weighting, args.cost, timeframe=args.timeframe)
+    loaded = time.perf_counter()
+    perf, outperf = tester.test_results()
+    done = time.perf_counter()
+    print(f"{len(symbols)} symbols x {len(tester.closes)} bars: perf {perf}, outperf {outperf} "
+          f"(load {loaded - timer:.2f} s, backtest {done - loaded:.3f} s)")
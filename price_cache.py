@@ -0,0 +1,220 @@
+import os
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from trading_calendar import default_calendar
+
+"""
+Local cache for daily prices from yfinance.
+
+Each ticker is stored as one .npz file in the cache folder holding
+- dates:  int64 nanoseconds (the DatetimeIndex yfinance returns)
+- values: float64 (n, 5) Open/High/Low/Close/Volume
+- spans:  int64 (k, 2) [start, end) day numbers that were already downloaded
+
+Only the part of a requested date range that is not inside a stored span gets downloaded.
+A gap only becomes a span when data came back for it, or when the trading calendar says it
+has no sessions (a weekend, a holiday): yfinance returns an empty frame instead of raising on
+network or ticker errors, and that must not hide the dates from every later get().
+Recently used tickers stay in memory (LRU), so a notebook re-running cells never touches disk.
+
+Offline mode (for CI): set PRICE_CACHE_OFFLINE=1 and point PRICE_CACHE_DIR at a seeded cache folder.
+Anything not already in the cache then raises instead of downloading.
+"""
+
+COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+NS_PER_DAY = 86_400 * 10**9
+
+
+def _day_number(value):
+    # days since 1970-01-01, works for "2020-01-01" strings, dates and Timestamps
+    return int(pd.Timestamp(value).normalize().value // NS_PER_DAY)
+
+
+def _day_string(day):
+    return pd.Timestamp(day * NS_PER_DAY).strftime("%Y-%m-%d")
+
+
+def missing_spans(spans, start, end):
+    """Parts of [start, end) (day numbers) not covered by the sorted, merged spans."""
+    gaps = []
+    cursor = start
+    for s, e in spans:
+        if e <= cursor:
+            continue
+        if s >= end:
+            break
+        if s > cursor:
+            gaps.append((cursor, s))
+        cursor = max(cursor, e)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def _has_sessions(start, end):
+    # True if [start, end) (day numbers) has NYSE sessions, or the calendar can't tell (outside its range)
+    if end <= start:
+        return False
+    try:
+        return len(default_calendar().sessions_in_range(start, end - 1)[0]) > 0
+    except ValueError:
+        return True
+
+
+def merge_spans(spans):
+    merged = []
+    for s, e in sorted(spans):
+        if merged and s <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    return [(s, e) for s, e in merged]
+
+
+class PriceCache():
+    def __init__(self, cache_dir=None, offline=None, max_memory_items=32):
+        self.cache_dir = cache_dir or os.environ.get("PRICE_CACHE_DIR", "price_cache")
+        if offline is None:
+            offline = os.environ.get("PRICE_CACHE_OFFLINE", "") not in ("", "0")
+        self.offline = offline
+        self.max_memory_items = max_memory_items
+        self._memory = OrderedDict()  # ticker -> (dates, values, spans)
+
+    def _path(self, ticker):
+        return os.path.join(self.cache_dir, f"{ticker.upper()}.npz")
+
+    def _load(self, ticker):
+        key = ticker.upper()
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+        path = self._path(ticker)
+        if os.path.exists(path):
+            with np.load(path) as f:
+                entry = (f["dates"], f["values"], [tuple(s) for s in f["spans"].tolist()])
+        else:
+            entry = (np.empty(0, dtype=np.int64), np.empty((0, len(COLUMNS))), [])
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _save(self, ticker, dates, values, spans):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(ticker)
+        # write to a temp file and swap it in, so a crash never leaves half a file behind
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, dates=dates, values=values,
+                 spans=np.asarray(spans, dtype=np.int64).reshape(-1, 2))
+        os.replace(tmp, path)
+        self._remember(ticker.upper(), (dates, values, spans))
+
+    def _download(self, ticker, start_day, end_day):
+        return self._download_many([ticker], start_day, end_day)[ticker]
+
+    def _download_many(self, tickers, start_day, end_day):
+        # one yf.download call for several tickers -> {ticker: (dates, values)}
+        import yfinance as yf
+
+        df = yf.download(list(tickers), start=_day_string(start_day), end=_day_string(end_day))
+        out = {}
+        for ticker in tickers:
+            part = df
+            if part is not None and isinstance(part.columns, pd.MultiIndex):
+                part = part.xs(ticker, axis=1, level=-1) if ticker in part.columns.get_level_values(-1) else None
+            if part is not None:
+                part = part.dropna(how="all")  # days where only the other tickers traded
+            if part is None or part.empty:
+                out[ticker] = (np.empty(0, dtype=np.int64), np.empty((0, len(COLUMNS))))
+                continue
+            index = part.index if part.index.tz is None else part.index.tz_localize(None)
+            out[ticker] = (index.as_unit("ns").asi8.astype(np.int64), part[COLUMNS].to_numpy(dtype=np.float64))
+        return out
+
+    def get_many(self, tickers, start, end):
+        """
+        {ticker: DataFrame} like get() for every ticker, but tickers missing the same dates are
+        downloaded together in one yf.download call instead of one call each.
+        """
+        start_day, end_day = _day_number(start), _day_number(end)
+        if not self.offline:
+            groups = {}
+            for ticker in tickers:
+                gaps = missing_spans(self._load(ticker)[2], start_day, end_day)
+                if gaps:
+                    groups.setdefault(tuple(gaps), []).append(ticker)
+            for gaps, group in groups.items():
+                if len(group) < 2:
+                    continue  # get() below downloads it on its own
+                downloads = [(s, e, self._download_many(group, s, e)) for s, e in gaps]
+                print(f"Downloaded {len(group)} tickers in {len(gaps)} batch(es)")
+                for ticker in group:
+                    dates, values, spans = self._load(ticker)
+                    self._add_downloads(ticker, dates, values, spans, list(gaps),
+                                        [(d[ticker][0], d[ticker][1]) for _, _, d in downloads])
+        return {ticker: self.get(ticker, start, end) for ticker in tickers}
+
+    def _add_downloads(self, ticker, dates, values, spans, gaps, downloads):
+        # merge downloaded (dates, values) into the cached arrays and mark the gaps as done
+        dates = np.concatenate([dates] + [d for d, _ in downloads])
+        values = np.concatenate([values] + [v for _, v in downloads])
+        # keep the newest copy of any date that came back twice
+        order = np.argsort(dates, kind="stable")[::-1]
+        _, first = np.unique(dates[order], return_index=True)
+        keep = order[first]
+        dates, values = dates[keep], values[keep]
+        # never mark today or the future as downloaded, those bars can still change
+        today = _day_number(date.today())
+        done = [(s, min(e, today)) for (s, e), (d, _) in zip(gaps, downloads)
+                if s < today and (len(d) or not _has_sessions(s, min(e, today)))]
+        for (s, e), (d, _) in zip(gaps, downloads):
+            if len(d) == 0 and s < today and (s, min(e, today)) not in done:
+                print(f"No data for {ticker} {_day_string(s)} to {_day_string(e)}, will try again next time")
+        spans = merge_spans(spans + done)
+        self._save(ticker, dates, values, spans)
+        return dates, values, spans
+
+    def get(self, ticker, start, end):
+        """Daily Open/High/Low/Close/Volume for start <= date < end (same range rule as yf.download)."""
+        start_day, end_day = _day_number(start), _day_number(end)
+        dates, values, spans = self._load(ticker)
+
+        gaps = missing_spans(spans, start_day, end_day)
+        if gaps and self.offline:
+            # a seeded cache can't know about days after it was made, only complain about the past
+            today = _day_number(date.today())
+            past_gaps = [(s, min(e, today)) for s, e in gaps if s < today]
+            if past_gaps:
+                missing = ", ".join(f"{_day_string(s)}..{_day_string(e)}" for s, e in past_gaps)
+                raise LookupError(f"{ticker} not in offline price cache {self.cache_dir} for {missing}")
+        elif gaps:
+            downloads = []
+            for s, e in gaps:
+                print(f"Downloading {ticker} {_day_string(s)} to {_day_string(e)}")
+                downloads.append(self._download(ticker, s, e))
+            dates, values, spans = self._add_downloads(ticker, dates, values, spans, gaps, downloads)
+
+        lo = np.searchsorted(dates, start_day * NS_PER_DAY, side="left")
+        hi = np.searchsorted(dates, end_day * NS_PER_DAY, side="left")
+        index = pd.DatetimeIndex(dates[lo:hi], name="Date")
+        return pd.DataFrame(values[lo:hi], index=index, columns=COLUMNS)
+
+
+_default_cache = None
+
+
+def default_cache():
+    """One shared cache per process so the in-memory layer survives between SMABacktester objects."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PriceCache()
+    return _default_cache
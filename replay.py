@@ -0,0 +1,248 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from eventkit import Event
+from ib_async.objects import RealTimeBar, RealTimeBarList
+
+from bar_store import BAR_DTYPE, NY, BarStore
+
+"""
+Replay stored bars through the same interface as ib.reqRealTimeBars, for many symbols at once.
+
+    feed = ReplayFeed(BarStore(), start="2023-02-17", speed=1000)
+    bars = feed.reqRealTimeBars(Stock("AAPL", "SMART", "USD"), 5, "TRADES", True)
+    bars.updateEvent += on_bar          # same handler as live: on_bar(bars, hasNewBar)
+    await feed.wait()
+    feed.report()
+
+speed: 1 = real time, 1000 = a trading day in ~23 seconds, None (or 0) = as fast as possible.
+
+All subscribed symbols share one clock: their bars are merged by time and sent in time order,
+bar time t at wall time (t - first bar time) / speed, so symbols interleave the way they do
+live. Stored 1-minute bars are split into 12 x 5-second bars (split_minute_bars); a store that
+holds 5-second bars can be replayed as it is with source_seconds=5.
+
+Subscribe every symbol before giving the event loop a turn (the clock starts on the next loop
+iteration); later subscriptions get error 162 like a request IB can't serve.
+
+stats() / report(): bars sent, wall seconds, replayed seconds, the speed actually reached, and
+how late the clock ran behind its schedule (slip). With pipeline.py in front of the strategy,
+pipeline.report() gives the end-to-end lag per symbol.
+"""
+
+NS = 1_000_000_000
+NO_DATA_MESSAGE = "Historical Market Data Service error message:HMDS query returned no data"
+
+
+def split_minute_bars(bars, parts=12):
+    """
+    Split each 1-min bar into `parts` smaller bars (12 x 5 seconds by default).
+    The price walks open -> first extreme -> second extreme -> close, so the small bars
+    add back up to exactly the same open/high/low/close. Volume is split evenly.
+    Returns a BAR_DTYPE array of len(bars) * parts.
+    """
+    n = len(bars)
+    o, h, l, c = (bars[col].astype(np.float64) for col in ("open", "high", "low", "close"))
+    # up bars visit the low first, down bars the high first
+    up = c >= o
+    first = np.where(up, l, h)
+    second = np.where(up, h, l)
+
+    # price at each of the parts+1 boundaries: linear between the 4 anchor points
+    anchors = np.stack([o, first, second, c], axis=1)
+    knots = np.array([0.0, parts / 3, 2 * parts / 3, parts])
+    steps = np.arange(parts + 1)
+    seg = np.clip(np.searchsorted(knots, steps, side="right") - 1, 0, 2)
+    frac = (steps - knots[seg]) / (knots[seg + 1] - knots[seg])
+    path = anchors[:, seg] + (anchors[:, seg + 1] - anchors[:, seg]) * frac
+    path[:, knots.astype(int)] = anchors  # hit the anchors exactly, no rounding
+
+    out = np.empty(n * parts, dtype=BAR_DTYPE)
+    step_ns = 60 * 10**9 // parts
+    out["ts"] = (bars["ts"][:, None] + np.arange(parts) * step_ns).ravel()
+    out["open"] = path[:, :-1].ravel()
+    out["close"] = path[:, 1:].ravel()
+    out["high"] = np.maximum(path[:, :-1], path[:, 1:]).ravel()
+    out["low"] = np.minimum(path[:, :-1], path[:, 1:]).ravel()
+    out["volume"] = np.repeat(bars["volume"] / parts, parts)
+    return out
+
+
+class ReplayFeed():
+    def __init__(self, store: BarStore = None, start=None, end=None, speed=None, source_seconds=60,
+                 keep_bars=1000, errorEvent: Event = None):
+        self.store = store or BarStore()
+        self.start = start  # None = each symbol's last stored day
+        self.end = end
+        self.speed = speed or None
+        self.source_seconds = source_seconds
+        self.keep_bars = keep_bars  # bars kept in each RealTimeBarList, handlers only need the newest
+        self.errorEvent = errorEvent if errorEvent is not None else Event("errorEvent")
+
+        self._next_req_id = 1
+        self._subscriptions = {}  # reqId -> RealTimeBarList
+        self._task = None
+        self._done = asyncio.Event()
+
+        self.bars_sent = 0
+        self.wall_seconds = 0.0
+        self.replayed_seconds = 0.0
+        self.slip_total = 0.0
+        self.slip_max = 0.0
+        self.ticks = 0
+
+    # --- the IB-like part -------------------------------------------------------
+    async def connectAsync(self, host="127.0.0.1", port=7497, clientId=1, **kwargs):
+        return self
+
+    def isConnected(self):
+        return True
+
+    def disconnect(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._subscriptions.clear()
+
+    def reqRealTimeBars(self, contract, barSize, whatToShow, useRTH, realTimeBarsOptions=[]):
+        bars = RealTimeBarList()
+        bars.reqId = self._next_req_id
+        self._next_req_id += 1
+        bars.contract = contract
+        bars.barSize = barSize
+        bars.whatToShow = whatToShow
+        bars.useRTH = useRTH
+        bars.realTimeBarsOptions = realTimeBarsOptions
+        if self._task is not None:
+            asyncio.get_running_loop().call_soon(self.errorEvent.emit, bars.reqId, 162,
+                                                 "Replay already started, subscribe every symbol first", contract)
+            return bars
+        self._subscriptions[bars.reqId] = bars
+        if len(self._subscriptions) == 1:
+            self._task = asyncio.ensure_future(self._run())  # runs after the caller's subscribe loop
+        return bars
+
+    def cancelRealTimeBars(self, bars):
+        self._subscriptions.pop(bars.reqId, None)
+
+    async def wait(self):
+        """Until every bar has been sent (or the replay was cancelled)."""
+        await self._done.wait()
+
+    # --- the clock ----------------------------------------------------------------
+    def _load(self):
+        # every subscription's bars merged into one time-ordered set of columns
+        parts, owners = [], []
+        for req_id, bars in self._subscriptions.items():
+            symbol = bars.contract.symbol
+            start = self.start
+            if start is None:
+                days = self.store.days(symbol)
+                start = pd.Timestamp(days[-1], tz=NY) if days else None
+            source = self.store.read_array(symbol, start, self.end) if start is not None else np.empty(0, BAR_DTYPE)
+            if len(source) == 0:
+                self.errorEvent.emit(req_id, 162, NO_DATA_MESSAGE, bars.contract)
+                continue
+            if self.source_seconds == 60:
+                source = split_minute_bars(source, 60 // bars.barSize)
+            parts.append(source)
+            owners.append(np.full(len(source), req_id, dtype=np.int64))
+        if not parts:
+            return np.empty(0, dtype=BAR_DTYPE), np.empty(0, dtype=np.int64)
+        rows, owner = np.concatenate(parts), np.concatenate(owners)
+        order = np.argsort(rows["ts"], kind="stable")
+        return rows[order], owner[order]
+
+    async def _run(self):
+        try:
+            await asyncio.sleep(0)  # let the caller finish subscribing
+            rows, owner = self._load()
+            if len(rows) == 0:
+                return
+            ts = rows["ts"]
+            # one tick = all bars with the same timestamp
+            ticks = np.flatnonzero(np.diff(ts, prepend=ts[0] - 1))
+            ends = np.append(ticks[1:], len(rows))
+            columns = [rows[col].tolist() for col in ("open", "high", "low", "close", "volume")]
+            ts_list, owner_list = ts.tolist(), owner.tolist()
+
+            first_ts = ts_list[0]
+            wall_start = time.monotonic()
+            for s, e in zip(ticks.tolist(), ends.tolist()):
+                if self.speed is not None:
+                    delay = wall_start + (ts_list[s] - first_ts) / NS / self.speed - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    else:
+                        self.slip_total -= delay
+                        self.slip_max = max(self.slip_max, -delay)
+                        await asyncio.sleep(0)  # late: still give the consumers a turn
+                else:
+                    await asyncio.sleep(0)
+
+                when = datetime.fromtimestamp(ts_list[s] / NS, timezone.utc)
+                for i in range(s, e):
+                    bars = self._subscriptions.get(owner_list[i])
+                    if bars is None:  # cancelled
+                        continue
+                    bars.append(RealTimeBar(time=when, endTime=-1, open_=columns[0][i], high=columns[1][i],
+                                            low=columns[2][i], close=columns[3][i], volume=columns[4][i],
+                                            wap=columns[3][i], count=0))
+                    if len(bars) > 2 * self.keep_bars:
+                        del bars[:-self.keep_bars]
+                    bars.updateEvent.emit(bars, True)
+                    self.bars_sent += 1
+                self.ticks += 1
+                self.wall_seconds = time.monotonic() - wall_start
+                self.replayed_seconds = (ts_list[s] - first_ts) / NS
+        finally:
+            self._done.set()
+
+    def stats(self):
+        return {
+            "bars": self.bars_sent,
+            "ticks": self.ticks,
+            "wall_seconds": self.wall_seconds,
+            "replayed_seconds": self.replayed_seconds,
+            "bars_per_second": self.bars_sent / self.wall_seconds if self.wall_seconds > 0 else 0.0,
+            "speed": self.replayed_seconds / self.wall_seconds if self.wall_seconds > 0 else 0.0,
+            "slip_ms_avg": self.slip_total / self.ticks * 1e3 if self.ticks else 0.0,
+            "slip_ms_max": self.slip_max * 1e3,
+        }
+
+    def report(self):
+        s = self.stats()
+        target = f"{self.speed:g}x" if self.speed else "max"
+        print(f"Replay ({target}): {s['bars']} bars in {s['ticks']} ticks, {s['wall_seconds']:.2f} s wall for "
+              f"{s['replayed_seconds'] / 3600:.2f} h of market ({s['speed']:,.0f}x, {s['bars_per_second']:,.0f} bars/s) | "
+              f"slip avg {s['slip_ms_avg']:.3f} ms, max {s['slip_ms_max']:.3f} ms")
+
+
+# start program
+if __name__ == "__main__":
+    # Throughput check: replay symbols through the pipeline with a do-nothing handler
+    from pipeline import Pipeline
+
+    p = argparse.ArgumentParser(description="Replay stored bars like reqRealTimeBars and measure throughput")
+    p.add_argument("symbols", nargs="+")
+    p.add_argument("--start", default=None, help="First day (default: each symbol's last stored day)")
+    p.add_argument("--end", default=None)
+    p.add_argument("--speed", type=float, default=0, help="1 = real time, 1000 = accelerated, 0 = as fast as possible")
+    p.add_argument("--store", default=None, help="Bar store folder")
+    args = p.parse_args()
+
+    async def run():
+        feed = ReplayFeed(BarStore(args.store), args.start, args.end, args.speed)
+        pipeline = Pipeline(maxsize=1024)
+        for symbol in args.symbols:
+            pipeline.subscribe(feed, symbol, lambda bar: None)
+        await feed.wait()
+        await pipeline.drain()
+        feed.report()
+        pipeline.report()
+        pipeline.close()
+
+    asyncio.run(run())
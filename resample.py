@@ -0,0 +1,197 @@
+import argparse
+import os
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from bar_store import BAR_DTYPE, NY, NS_PER_DAY, BarStore, to_timestamp_ns, trading_days
+from trading_calendar import default_calendar
+
+"""
+5m / 15m / 60m / daily bars built from the 1-minute bars in the bar store.
+
+Bins start at the session open (9:30) and never cross a session, so the 60m bars are
+9:30, 10:30, ... 15:30 (a 30 minute last bar), and on half days (13:00 close) the last bin is cut
+at the close. Daily bars are one bar per NYSE session. Minutes outside the session are left out.
+Every bar's ts is the start of its bin, like IB's bars.
+
+Results are cached per symbol and timeframe (resample_cache/AAPL/15m.npz) together with the version
+of each day file when it was resampled (bar count, file size and mtime, BarStore.day_versions).
+Later calls compare that with the store and only redo the days that changed (new days, a backfilled
+gap, a finished partial day, or corrected prices with the same number of bars).
+
+    cache = ResampleCache()
+    df = cache.get("AAPL", "2022-01-01", "2023-01-01", "15m")   # Open/High/Low/Close/Volume, like PriceCache
+
+    python resample.py AAPL MSFT --timeframes 5m 15m 60m 1d
+"""
+
+TIMEFRAMES = {"1m": 1, "5m": 5, "15m": 15, "30m": 30, "60m": 60, "1h": 60, "1d": None}
+COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+NS_PER_MINUTE = 60 * 10**9
+EPOCH = date(1970, 1, 1)
+
+
+def parse_timeframe(timeframe):
+    """'15m' -> 15 minutes, '1d' -> None (one bar per session)."""
+    if timeframe in TIMEFRAMES:
+        return TIMEFRAMES[timeframe]
+    if timeframe.endswith("m") and timeframe[:-1].isdigit() and int(timeframe[:-1]) > 0:
+        return int(timeframe[:-1])
+    raise ValueError(f"Unknown timeframe {timeframe!r}, use e.g. 5m, 15m, 60m or 1d")
+
+
+def session_bounds(first_day, last_day):
+    """
+    NYSE sessions between two day numbers (days since 1970-01-01, both included).
+    Returns (days, open_ns, close_ns) int64 arrays, half days have their early close.
+    """
+    return default_calendar().sessions_in_range(int(first_day), int(last_day))
+
+
+def resample_bars(bars, minutes, sessions=None):
+    """
+    1-minute BAR_DTYPE array (sorted by ts) -> bars of `minutes` (None = daily), same dtype.
+    sessions: (days, open_ns, close_ns) from session_bounds(), looked up when not given.
+    """
+    if len(bars) == 0:
+        return np.empty(0, dtype=BAR_DTYPE)
+    ts = bars["ts"]
+    day = trading_days(ts)
+    if sessions is None:
+        sessions = session_bounds(day[0], day[-1])
+    days, opens, closes = sessions
+
+    # which session every minute belongs to, and whether it is inside it
+    pos = np.clip(np.searchsorted(days, day), 0, max(len(days) - 1, 0))
+    if len(days) == 0:
+        return np.empty(0, dtype=BAR_DTYPE)
+    inside = (days[pos] == day) & (ts >= opens[pos]) & (ts < closes[pos])
+    bars, pos = bars[inside], pos[inside]
+    if len(bars) == 0:
+        return np.empty(0, dtype=BAR_DTYPE)
+    ts = bars["ts"]
+
+    # bin number inside the session, the key grows with ts because the bars are sorted
+    if minutes is None:
+        key = pos.astype(np.int64)
+        start_ns = opens[pos]
+    else:
+        width = minutes * NS_PER_MINUTE
+        slot = (ts - opens[pos]) // width
+        key = pos.astype(np.int64) * (NS_PER_DAY // width + 1) + slot
+        start_ns = opens[pos] + slot * width
+
+    starts = np.flatnonzero(np.diff(key, prepend=key[0] - 1))
+    ends = np.append(starts[1:], len(bars))
+    out = np.empty(len(starts), dtype=BAR_DTYPE)
+    out["ts"] = start_ns[starts]
+    out["open"] = bars["open"][starts]
+    out["high"] = np.maximum.reduceat(bars["high"], starts)
+    out["low"] = np.minimum.reduceat(bars["low"], starts)
+    out["close"] = bars["close"][ends - 1]
+    out["volume"] = np.add.reduceat(bars["volume"], starts)
+    return out
+
+
+class ResampleCache():
+    def __init__(self, store: BarStore = None, root=None):
+        self.store = store or BarStore()
+        self.root = root or os.environ.get("RESAMPLE_CACHE_DIR", "resample_cache")
+        self._memory = {}  # (symbol, timeframe) -> (bars, days, versions)
+        self.days_resampled = 0  # how many sessions were (re)computed, for checking the incremental path
+
+    def _path(self, symbol, timeframe):
+        return os.path.join(self.root, symbol.upper(), f"{timeframe}.npz")
+
+    def _load(self, symbol, timeframe):
+        key = (symbol.upper(), timeframe)
+        if key in self._memory:
+            return self._memory[key]
+        path = self._path(symbol, timeframe)
+        if os.path.exists(path):
+            with np.load(path) as saved:
+                if "versions" in saved.files:
+                    return saved["bars"], saved["days"], saved["versions"]
+                # cache from before versions were kept: every day counts as changed
+        return np.empty(0, dtype=BAR_DTYPE), np.empty(0, dtype=np.int64), np.empty((0, 3), dtype=np.int64)
+
+    def _save(self, symbol, timeframe, bars, days, versions):
+        path = self._path(symbol, timeframe)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, bars=bars, days=days, versions=versions)
+        os.replace(tmp, path)
+        self._memory[(symbol.upper(), timeframe)] = (bars, days, versions)
+
+    def bars(self, symbol, timeframe="1d"):
+        """All resampled bars for a symbol (BAR_DTYPE array), redoing only the days that changed."""
+        minutes = parse_timeframe(timeframe)
+        stored = self.store.day_versions(symbol)
+        days = np.array([(d - EPOCH).days for d in stored], dtype=np.int64)
+        versions = np.array(list(stored.values()), dtype=np.int64).reshape(-1, 3)
+
+        cached, cached_days, cached_versions = self._load(symbol, timeframe)
+        # a day needs work if it is new or its file changed (count, size or mtime) since it was resampled
+        pos = np.clip(np.searchsorted(cached_days, days), 0, max(len(cached_days) - 1, 0))
+        if len(cached_days):
+            same = (cached_days[pos] == days) & (cached_versions[pos] == versions).all(axis=1)
+        else:
+            same = np.zeros(len(days), bool)
+        changed = days[~same]
+        if len(changed) == 0 and len(cached_days) == len(days):
+            self._memory[(symbol.upper(), timeframe)] = (cached, cached_days, cached_versions)
+            return cached
+
+        # keep the cached bins of unchanged days, recompute the rest
+        keep = ~np.isin(trading_days(cached["ts"]), changed) & np.isin(trading_days(cached["ts"]), days)
+        parts = [cached[keep]]
+        if len(changed):
+            epoch_ts = pd.Timestamp(EPOCH, tz=NY)
+            minute_bars = self.store.read_array(symbol, epoch_ts + pd.Timedelta(days=int(changed[0])),
+                                                epoch_ts + pd.Timedelta(days=int(changed[-1]) + 1))
+            minute_bars = minute_bars[np.isin(trading_days(minute_bars["ts"]), changed)]
+            parts.append(resample_bars(minute_bars, minutes, session_bounds(changed[0], changed[-1])))
+            self.days_resampled += len(changed)
+        bars = np.concatenate(parts)
+        bars = bars[np.argsort(bars["ts"], kind="stable")]
+        self._save(symbol, timeframe, bars, days, versions)
+        return bars
+
+    def get(self, ticker, start=None, end=None, timeframe="1d"):
+        """
+        DataFrame with Open/High/Low/Close/Volume for start <= bar < end, the same columns as PriceCache.get().
+        Daily bars have a plain date index, intraday bars a New York time index, both named "Date".
+        """
+        bars = self.bars(ticker, timeframe)
+        ts = bars["ts"]
+        lo = np.searchsorted(ts, to_timestamp_ns(start)) if start is not None else 0
+        hi = np.searchsorted(ts, to_timestamp_ns(end)) if end is not None else len(ts)
+        bars = bars[lo:hi]
+        index = pd.DatetimeIndex(bars["ts"], tz="UTC").tz_convert(NY)
+        if parse_timeframe(timeframe) is None:
+            index = index.tz_localize(None).normalize()
+        values = np.column_stack([bars[col] for col in ("open", "high", "low", "close", "volume")])
+        return pd.DataFrame(values, index=index.rename("Date"), columns=COLUMNS)
+
+
+# start program
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Build / update resampled bars from the 1-min bar store")
+    p.add_argument("symbols", nargs="+")
+    p.add_argument("--timeframes", nargs="+", default=["5m", "15m", "60m", "1d"])
+    p.add_argument("--store", default=None, help="Bar store folder")
+    p.add_argument("--cache-dir", default=None, help="Resample cache folder (default: $RESAMPLE_CACHE_DIR or ./resample_cache)")
+    args = p.parse_args()
+
+    cache = ResampleCache(BarStore(args.store), args.cache_dir)
+    for symbol in args.symbols:
+        for timeframe in args.timeframes:
+            start = time.perf_counter()
+            before = cache.days_resampled
+            bars = cache.bars(symbol, timeframe)
+            print(f"{symbol} {timeframe}: {len(bars)} bars, {cache.days_resampled - before} days resampled "
+                  f"in {time.perf_counter() - start:.3f} seconds")
@@ -0,0 +1,215 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+"""
+Cache for backtest results, so re-running a notebook cell or a sweep only computes what is new.
+
+The key is a hash of everything the result depends on: the input prices (values and dates),
+the strategy name and its parameters. Same data + same parameters -> same key -> stored result.
+Change one price, one date or one parameter and the key changes, so nothing stale comes back.
+
+Two tiers:
+- memory: the most recently used results (LRU, max_memory_items). Arrays, Series and DataFrames
+          are copied going in and coming out, so a caller editing a result (res["x"] = ...,
+          dropna(inplace=True)) can't change what later calls get, same as a fresh disk read
+- disk:   one pickle file per result in RESULT_CACHE_DIR (default ./result_cache); when the folder
+          grows past max_disk_bytes the least recently used files are deleted
+
+    cache = default_result_cache()
+    perf = cache.get_or_compute(("sma.test_results", close, 50, 200), lambda: run_backtest(...))
+
+Bump CACHE_VERSION when the backtest math changes, so old results are not reused
+(the SMA kernel also has its own indicators.SMA_VERSION in the SMABacktester keys).
+"""
+
+CACHE_VERSION = 2
+
+
+def _feed(h, part):
+    # add one key part to the hash, with a type tag so "1" and 1 hash differently
+    if isinstance(part, pd.Series):
+        h.update(b"series")
+        _feed(h, part.name)
+        _feed(h, part.index)
+        _feed(h, part.to_numpy())
+    elif isinstance(part, pd.DataFrame):
+        h.update(b"frame")
+        _feed(h, list(part.columns))
+        _feed(h, part.index)
+        for col in part.columns:
+            _feed(h, part[col].to_numpy())
+    elif isinstance(part, pd.Index):
+        h.update(b"index")
+        values = part.as_unit("ns").asi8 if isinstance(part, pd.DatetimeIndex) else part.to_numpy()
+        if isinstance(part, pd.DatetimeIndex):
+            _feed(h, str(part.tz))
+        _feed(h, values)
+    elif isinstance(part, np.ndarray):
+        if part.dtype == object:
+            _feed(h, part.tolist())
+        else:
+            h.update(b"array" + str(part.dtype).encode() + str(part.shape).encode())
+            h.update(np.ascontiguousarray(part).data)
+    elif isinstance(part, (list, tuple, range)):
+        h.update(b"list%d" % len(part))
+        for item in part:
+            _feed(h, item)
+    elif isinstance(part, dict):
+        h.update(b"dict%d" % len(part))
+        for name in sorted(part, key=repr):
+            _feed(h, name)
+            _feed(h, part[name])
+    else:
+        h.update(type(part).__name__.encode() + b":" + repr(part).encode() + b";")
+
+
+def _copy(value):
+    # own copy of a result: arrays / pandas objects copied, also inside tuples, lists and dicts
+    if isinstance(value, (np.ndarray, pd.Series, pd.DataFrame, pd.Index)):
+        return value.copy()
+    if isinstance(value, (list, tuple)):
+        return type(value)(_copy(item) for item in value)
+    if isinstance(value, dict):
+        return {name: _copy(item) for name, item in value.items()}
+    return value
+
+
+def fingerprint(*parts):
+    """Hex hash of any mix of arrays, Series, DataFrames, lists, dicts and plain values."""
+    h = hashlib.blake2b(digest_size=16)
+    _feed(h, CACHE_VERSION)
+    for part in parts:
+        _feed(h, part)
+    return h.hexdigest()
+
+
+class ResultCache():
+    def __init__(self, cache_dir=None, max_memory_items=128, max_disk_bytes=512 * 2**20):
+        self.cache_dir = cache_dir or os.environ.get("RESULT_CACHE_DIR", "result_cache")
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()  # key -> result
+        self._disk_bytes = None       # running total, worked out on first write
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pkl")
+
+    def _remember(self, key, value):
+        if self.max_memory_items <= 0:
+            return
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key, default=None):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return _copy(self._memory[key])
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return default
+        os.utime(path)  # mtime = last use, that's what the disk eviction goes by
+        self.disk_hits += 1
+        self._remember(key, _copy(value))
+        return value
+
+    def put(self, key, value):
+        self._remember(key, _copy(value))  # the caller keeps value and may change it
+        if self.max_disk_bytes <= 0:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+        if self._disk_bytes is None:
+            self._disk_bytes = self.disk_usage()
+        else:
+            self._disk_bytes += os.path.getsize(path)
+        if self._disk_bytes > self.max_disk_bytes:
+            self.evict()
+
+    def get_or_compute(self, key_parts, compute):
+        """Cached result for key_parts (a tuple hashed with fingerprint), computed and stored if missing."""
+        key = fingerprint(*key_parts)
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def _files(self):
+        files = []
+        if not os.path.isdir(self.cache_dir):
+            return files
+        for folder in os.listdir(self.cache_dir):
+            folder = os.path.join(self.cache_dir, folder)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if name.endswith(".pkl"):
+                    path = os.path.join(folder, name)
+                    try:
+                        info = os.stat(path)
+                    except FileNotFoundError:  # another process evicted it
+                        continue
+                    files.append((info.st_mtime_ns, info.st_size, path))
+        return files
+
+    def disk_usage(self):
+        return sum(size for _, size, _ in self._files())
+
+    def evict(self, target=0.9):
+        """Delete least recently used files until the folder is under target x max_disk_bytes."""
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_disk_bytes * target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._disk_bytes = total
+
+    def clear(self):
+        self._memory.clear()
+        for _, _, path in self._files():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._disk_bytes = 0
+
+    def report(self):
+        print(f"ResultCache: {self.hits} memory hits, {self.disk_hits} disk hits, {self.misses} misses, "
+              f"{len(self._memory)} in memory, {self.disk_usage() / 2**20:.1f} MB on disk in {self.cache_dir}")
+
+
+_default_cache = None
+
+
+def default_result_cache():
+    """One shared cache per process, so results survive between SMABacktester objects."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResultCache()
+    return _default_cache
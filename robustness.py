@@ -0,0 +1,219 @@
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from analytics import METRICS, PERIODS_PER_YEAR, performance
+
+"""
+Is a backtest result skill or luck? Three Monte Carlo checks on strategy returns:
+
+- block_bootstrap:   rebuild the return series from random blocks of it (blocks keep the
+                     short-term autocorrelation), thousands of times
+- shuffle_trades:    same trades in a random order; the total return stays, the path
+                     (drawdown, drawdown duration) changes, so it shows how lucky the order was
+- perturb_sma / perturb_orb: run the strategy again with parameters close to the chosen ones,
+                     a robust result shouldn't fall apart one step away from the best pair
+
+Every simulation is one row of a (simulations x bars) matrix that goes through
+analytics.performance() in one call. Matrices are built chunk_size rows at a time to keep memory
+bounded, and the chunks can be spread over a process pool (processes=N). Each chunk has its own
+seed derived from `seed`, so the numbers are the same whatever the number of processes.
+
+Each function returns (intervals, samples): intervals has one row per metric with the observed
+value, the simulated mean and the lower / upper bound of the confidence interval.
+
+    python robustness.py sma SPY --sma 50 200 --start 2005-01-01 --end 2025-01-01
+    python robustness.py orb ABC --minutes 15 --target 2
+"""
+
+
+def confidence_intervals(samples, observed=None, level=0.95):
+    """One row per metric: observed, mean, lower and upper quantile of the simulated values."""
+    tail = (1.0 - level) / 2
+    with np.errstate(invalid="ignore"):
+        table = pd.DataFrame({
+            "observed": observed if observed is not None else np.nan,
+            "mean": samples.mean(),
+            "lower": samples.quantile(tail),
+            "upper": samples.quantile(1.0 - tail),
+            # share of simulations that did worse than what we observed
+            "pct_below_observed": (samples < observed).mean() if observed is not None else np.nan,
+        })
+    return table.loc[samples.columns]
+
+
+def _chunks(n_sims, chunk_size, seed):
+    # (rows, seed) for every chunk, seeds spawned from one SeedSequence
+    sizes = [min(chunk_size, n_sims - i) for i in range(0, n_sims, chunk_size)]
+    return list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+
+
+def _run(worker, chunks, args, processes):
+    if processes and processes > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(processes) as pool:
+            parts = list(pool.map(worker, *zip(*[(rows, seed) + args for rows, seed in chunks])))
+    else:
+        parts = [worker(rows, seed, *args) for rows, seed in chunks]
+    return pd.concat(parts, ignore_index=True)
+
+
+# --- block bootstrap ---------------------------------------------------------------------
+
+def _bootstrap_chunk(rows, seed, returns, positions, block_size, ppy, log):
+    rng = np.random.default_rng(seed)
+    t = len(returns)
+    n_blocks = -(-t // block_size)
+    # circular blocks: random start, block_size consecutive bars, wrapping around the end
+    starts = rng.integers(0, t, size=(rows, n_blocks))
+    index = (starts[:, :, None] + np.arange(block_size)).reshape(rows, -1)[:, :t] % t
+    # positions go through the same index, so turnover and exposure follow the resampled bars
+    # (the joins between blocks add a few position changes, so turnover reads a little high)
+    return performance(returns[index], ppy, log=log, positions=None if positions is None else positions[index])
+
+
+def block_bootstrap(returns, n_sims=10_000, block_size=20, periods_per_year=PERIODS_PER_YEAR, log=False,
+                    positions=None, level=0.95, seed=0, chunk_size=1000, processes=None):
+    """Confidence intervals of every metric from n_sims block-bootstrapped copies of `returns`."""
+    r = np.nan_to_num(np.asarray(returns, dtype=np.float64), nan=0.0)
+    held = None if positions is None else np.nan_to_num(np.asarray(positions, dtype=np.float64), nan=0.0)
+    samples = _run(_bootstrap_chunk, _chunks(n_sims, chunk_size, seed),
+                   (r, held, block_size, periods_per_year, log), processes)
+    observed = performance(r, periods_per_year, log=log, positions=held)
+    return confidence_intervals(samples, observed, level), samples
+
+
+# --- trade order shuffle -----------------------------------------------------------------
+
+def _shuffle_chunk(rows, seed, trades, ppy):
+    rng = np.random.default_rng(seed)
+    order = np.argsort(rng.random((rows, len(trades))), axis=1)  # one random permutation per row
+    return performance(trades[order], ppy)
+
+
+def shuffle_trades(trade_returns, n_sims=10_000, trades_per_year=PERIODS_PER_YEAR, level=0.95, seed=0,
+                   chunk_size=2000, processes=None):
+    """Same trades (simple returns, one per trade) in n_sims random orders."""
+    trades = np.asarray(trade_returns, dtype=np.float64)
+    samples = _run(_shuffle_chunk, _chunks(n_sims, chunk_size, seed), (trades, trades_per_year), processes)
+    observed = performance(trades, trades_per_year)
+    return confidence_intervals(samples, observed, level), samples
+
+
+# --- parameter perturbation --------------------------------------------------------------
+
+def _sma_chunk(rows, seed, close, sma_s, sma_l, spread, start, ppy):
+    from smabacktestv1 import sma_strategy_returns
+
+    rng = np.random.default_rng(seed)
+    # each window moves by up to +-spread (relative), SMA_S stays below SMA_L
+    s = np.maximum(1, np.rint(sma_s * (1 + rng.uniform(-spread, spread, rows)))).astype(np.int64)
+    l = np.maximum(s + 1, np.rint(sma_l * (1 + rng.uniform(-spread, spread, rows)))).astype(np.int64)
+    returns, held = sma_strategy_returns(close, np.column_stack([s, l]))
+    table = performance(returns[:, start:], ppy, log=True, positions=held[:, start:])
+    table.insert(0, "SMA_L", l)
+    table.insert(0, "SMA_S", s)
+    return table
+
+
+def perturb_sma(close, SMA_S, SMA_L, n_sims=2000, spread=0.2, periods_per_year=PERIODS_PER_YEAR, level=0.95,
+                seed=0, chunk_size=250, processes=None):
+    """SMA crossover re-run with n_sims random (SMA_S, SMA_L) pairs within +-spread of the chosen pair."""
+    prices = np.asarray(close, dtype=np.float64)
+    # every pair is scored from the same bar on: the first one where the longest possible SMA_L exists
+    start = int(np.rint(SMA_L * (1 + spread))) - 1
+    samples = _run(_sma_chunk, _chunks(n_sims, chunk_size, seed),
+                   (prices, SMA_S, SMA_L, spread, start, periods_per_year), processes)
+    observed = _sma_chunk(1, np.random.SeedSequence(0), prices, SMA_S, SMA_L, 0.0, start, periods_per_year)
+    return confidence_intervals(samples[METRICS], observed[METRICS].iloc[0], level), samples
+
+
+def _orb_chunk(rows, seed, grids, minutes, target, spread, max_minutes):
+    from orb_backtest import simulate
+
+    rng = np.random.default_rng(seed)
+    m = np.clip(np.rint(minutes * (1 + rng.uniform(-spread, spread, rows))), 1, max_minutes).astype(np.int64)
+    # targets on a 0.25 grid, so simulate() runs once per distinct target for all its minute values
+    t = np.maximum(0.25, np.round(target * (1 + rng.uniform(-spread, spread, rows)) * 4) / 4)
+    daily = np.zeros((rows, grids["close"].shape[0]))
+    for value in np.unique(t):
+        pick = np.flatnonzero(t == value)
+        daily[pick] = simulate(grids, m[pick], value)["ret"]
+    table = performance(daily, PERIODS_PER_YEAR)
+    table.insert(0, "target_multiple", t)
+    table.insert(0, "opening_range_minutes", m)
+    return table
+
+
+def perturb_orb(bars, opening_range_minutes=15, target_multiple=2.0, n_sims=2000, spread=0.3, level=0.95,
+                seed=0, chunk_size=500, processes=None):
+    """ORB re-run with random opening range lengths and targets within +-spread. One return per day."""
+    from orb_backtest import session_grid, simulate
+
+    _, grids = session_grid(bars)
+    samples = _run(_orb_chunk, _chunks(n_sims, chunk_size, seed),
+                   (grids, opening_range_minutes, target_multiple, spread, 120), processes)
+    observed = performance(simulate(grids, [opening_range_minutes], target_multiple)["ret"][0], PERIODS_PER_YEAR)
+    return confidence_intervals(samples[METRICS], observed, level), samples
+
+
+def print_intervals(title, intervals):
+    print(f"\n=== {title} ===")
+    print(intervals.to_string(float_format=lambda x: f"{x:.4f}"))
+
+
+# start program
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Bootstrap / Monte Carlo robustness checks")
+    p.add_argument("strategy", choices=["sma", "orb"])
+    p.add_argument("symbol")
+    p.add_argument("--sma", nargs=2, type=int, default=[50, 200], metavar=("SMA_S", "SMA_L"))
+    p.add_argument("--timeframe", default=None, help="sma: bars from the 1-min store (5m, 15m, 60m, 1d) instead of yfinance")
+    p.add_argument("--minutes", type=int, default=15, help="orb: opening range minutes")
+    p.add_argument("--target", type=float, default=2.0, help="orb: target multiple")
+    p.add_argument("--start", default="2005-01-01")
+    p.add_argument("--end", default=pd.Timestamp.today().strftime("%Y-%m-%d"))
+    p.add_argument("--sims", type=int, default=10_000, help="Bootstrap / shuffle simulations")
+    p.add_argument("--param-sims", type=int, default=2000, help="Parameter perturbation simulations")
+    p.add_argument("--block", type=int, default=20, help="Bootstrap block size in bars")
+    p.add_argument("--processes", type=int, default=None)
+    p.add_argument("--store", default=None, help="Bar store folder")
+    args = p.parse_args()
+
+    timer = time.perf_counter()
+    if args.strategy == "sma":
+        from smabacktestv1 import SMABacktester
+        from analytics import periods_per_year
+
+        tester = SMABacktester(args.symbol, args.sma[0], args.sma[1], args.start, args.end, timeframe=args.timeframe)
+        tester.test_results()
+        ppy = periods_per_year(args.timeframe)
+        data = tester.results
+        print_intervals("Block bootstrap", block_bootstrap(data["ret_strategy"], args.sims, args.block, ppy, log=True,
+                                                           positions=data["held"], processes=args.processes)[0])
+        # trades: the log return of every stretch in the market
+        trade_id = (data["held"].diff().fillna(data["held"]) > 0).cumsum()[data["held"] > 0]
+        trades = np.expm1(data["ret_strategy"][data["held"] > 0].groupby(trade_id).sum())
+        years = len(data) / ppy
+        print_intervals("Trade order shuffle", shuffle_trades(trades, args.sims, len(trades) / years,
+                                                              processes=args.processes)[0])
+        print_intervals("Parameter perturbation", perturb_sma(tester.close, args.sma[0], args.sma[1], args.param_sims,
+                                                              periods_per_year=ppy, processes=args.processes)[0])
+    else:
+        from bar_store import BarStore
+        from orb_backtest import orb_trades, session_grid, simulate
+
+        bars = BarStore(args.store).read_array(args.symbol, args.start, args.end)
+        days, grids = session_grid(bars)
+        daily = simulate(grids, [args.minutes], args.target)["ret"][0]
+        print_intervals("Block bootstrap (daily returns)", block_bootstrap(daily, args.sims, args.block,
+                                                                           processes=args.processes)[0])
+        trades = orb_trades(bars, args.minutes, args.target)["return"]
+        years = len(days) / PERIODS_PER_YEAR
+        print_intervals("Trade order shuffle", shuffle_trades(trades, args.sims, len(trades) / years,
+                                                              processes=args.processes)[0])
+        print_intervals("Parameter perturbation", perturb_orb(bars, args.minutes, args.target, args.param_sims,
+                                                              processes=args.processes)[0])
+    print(f"\nDone in {time.perf_counter() - timer:.2f} seconds")
@@ -0,0 +1,279 @@
+import argparse
+import asyncio
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+from ib_async import IB, RealTimeBar
+from ib_async.contract import Stock
+
+from bar_store import NY, BarStore
+from fake_ib import FakeIB
+
+"""
+Real-time scanner for a universe of symbols (hundreds in one process).
+
+Every symbol's 5-second bars go into per-cycle arrays. When a cycle (one bar timestamp) is
+complete, all indicators for the symbols that reported are updated together with array
+operations, each in O(1) per symbol (ring buffers + running sums, no window recomputation):
+- SMA of the close over `sma_window` bars
+- session VWAP
+- session high/low (range) and where the close sits inside it
+- relative volume: this bar's volume / average of the previous `volume_window` bars
+Then all symbols are ranked and the top ones printed as signals.
+
+score = relative volume * (close - VWAP) / VWAP   (> 0 long, < 0 short)
+
+Per-cycle latency (last bar of the cycle in -> ranking done) and throughput are kept in
+scanner.stats(), so we can see how many symbols one process handles.
+
+    python scanner.py AAPL MSFT TSLA NVDA --top 5
+    python scanner.py XYZ --fake            # offline, from the bar store
+"""
+
+NS = 1_000_000_000
+
+
+class Scanner():
+    def __init__(self, symbols, sma_window=20, volume_window=60, top=10, min_bars=None):
+        self.symbols = list(symbols)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        n = len(self.symbols)
+        self.sma_window = sma_window
+        self.volume_window = volume_window
+        self.top = top
+        self.min_bars = min_bars if min_bars is not None else sma_window
+
+        # ring buffers and running sums, one row per symbol
+        self.close_ring = np.zeros((n, sma_window))
+        self.close_sum = np.zeros(n)
+        self.volume_ring = np.zeros((n, volume_window))
+        self.volume_sum = np.zeros(n)
+        self.bars = np.zeros(n, dtype=np.int64)  # bars seen since start (ring position = bars % window)
+
+        # session state, reset when a new day starts
+        self.session_day = np.full(n, -1, dtype=np.int64)
+        self.pv_sum = np.zeros(n)
+        self.v_sum = np.zeros(n)
+        self.session_high = np.full(n, -np.inf)
+        self.session_low = np.full(n, np.inf)
+
+        # latest indicator values
+        self.close = np.full(n, np.nan)
+        self.sma = np.full(n, np.nan)
+        self.vwap = np.full(n, np.nan)
+        self.rel_volume = np.full(n, np.nan)
+        self.range_position = np.full(n, np.nan)
+        self.score = np.full(n, np.nan)
+
+        # bars of the cycle being collected
+        self.cycle_ts = None
+        self._reported = np.zeros(n, dtype=bool)
+        self._count = 0
+        self._high = np.zeros(n)
+        self._low = np.zeros(n)
+        self._close = np.zeros(n)
+        self._volume = np.zeros(n)
+        self._wap = np.zeros(n)
+
+        # stats
+        self.cycles = 0
+        self.bars_in = 0
+        self.started = time.perf_counter()
+        self.latencies = deque(maxlen=1000)
+        self.compute_times = deque(maxlen=1000)
+        self._last_arrival = 0.0
+        self.on_signals = None  # callback(cycle_ts, signals)
+
+    def on_bar(self, symbol, ts_ns, high, low, close, volume, wap=None):
+        """Add one bar. Closes the previous cycle first if this bar is from a later timestamp."""
+        if self.cycle_ts is not None and ts_ns > self.cycle_ts:
+            self.finish_cycle()
+        if self.cycle_ts is None:
+            self.cycle_ts = ts_ns
+        i = self.index[symbol]
+        if not self._reported[i]:
+            self._reported[i] = True
+            self._count += 1
+        self._high[i] = high
+        self._low[i] = low
+        self._close[i] = close
+        self._volume[i] = volume
+        self._wap[i] = wap if wap else close
+        self.bars_in += 1
+        self._last_arrival = time.perf_counter()
+        if self._count == len(self.symbols):  # everyone reported, no need to wait for the next timestamp
+            return self.finish_cycle()
+        return None
+
+    def finish_cycle(self):
+        if self.cycle_ts is None:
+            return None
+        start = time.perf_counter()
+        idx = np.flatnonzero(self._reported)
+        day = datetime.fromtimestamp(self.cycle_ts / NS, NY).toordinal()  # one lookup per cycle
+        self._update(idx, day)
+        signals = self._rank()
+        done = time.perf_counter()
+
+        self.compute_times.append(done - start)
+        self.latencies.append(done - self._last_arrival)
+        self.cycles += 1
+        cycle_ts = self.cycle_ts
+        self.cycle_ts = None
+        self._reported[:] = False
+        self._count = 0
+        if self.on_signals is not None:
+            self.on_signals(cycle_ts, signals)
+        return signals
+
+    def _update(self, idx, day):
+        close, volume, high, low = self._close[idx], self._volume[idx], self._high[idx], self._low[idx]
+
+        # new session: reset VWAP and range
+        new = self.session_day[idx] != day
+        if new.any():
+            reset = idx[new]
+            self.session_day[reset] = day
+            self.pv_sum[reset] = 0.0
+            self.v_sum[reset] = 0.0
+            self.session_high[reset] = -np.inf
+            self.session_low[reset] = np.inf
+
+        # relative volume against the previous bars (before this one goes into the ring)
+        seen = self.bars[idx]
+        filled = np.minimum(seen, self.volume_window)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg_volume = np.where(filled > 0, self.volume_sum[idx] / np.maximum(filled, 1), np.nan)
+            self.rel_volume[idx] = volume / avg_volume
+
+        # ring buffers: swap the oldest value for the newest and adjust the running sums
+        pos = seen % self.sma_window
+        self.close_sum[idx] += close - self.close_ring[idx, pos]
+        self.close_ring[idx, pos] = close
+        pos = seen % self.volume_window
+        self.volume_sum[idx] += volume - self.volume_ring[idx, pos]
+        self.volume_ring[idx, pos] = volume
+        self.bars[idx] = seen + 1
+
+        count = np.minimum(seen + 1, self.sma_window)
+        self.sma[idx] = np.where(count >= self.sma_window, self.close_sum[idx] / count, np.nan)
+
+        self.pv_sum[idx] += self._wap[idx] * volume
+        self.v_sum[idx] += volume
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.vwap[idx] = np.where(self.v_sum[idx] > 0, self.pv_sum[idx] / self.v_sum[idx], close)
+        self.session_high[idx] = np.maximum(self.session_high[idx], high)
+        self.session_low[idx] = np.minimum(self.session_low[idx], low)
+        width = self.session_high[idx] - self.session_low[idx]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.range_position[idx] = np.where(width > 0, (close - self.session_low[idx]) / width, 0.5)
+        self.close[idx] = close
+
+    def _rank(self):
+        with np.errstate(invalid="ignore"):
+            score = self.rel_volume * (self.close - self.vwap) / self.vwap
+        score[self.bars < self.min_bars] = np.nan
+        self.score = score
+        valid = np.flatnonzero(~np.isnan(score))
+        if len(valid) == 0:
+            return []
+        k = min(self.top, len(valid))
+        # partial sort: only the top k need ordering
+        best = valid[np.argpartition(-np.abs(score[valid]), k - 1)[:k]]
+        best = best[np.argsort(-np.abs(score[best]))]
+        return [
+            (self.symbols[i], "LONG" if score[i] > 0 else "SHORT", float(score[i]), float(self.close[i]),
+             float(self.vwap[i]), float(self.sma[i]), float(self.rel_volume[i]), float(self.range_position[i]))
+            for i in best
+        ]
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        compute = np.array(self.compute_times) if self.compute_times else np.zeros(1)
+        return {
+            "symbols": len(self.symbols),
+            "cycles": self.cycles,
+            "bars": self.bars_in,
+            "bars_per_second": self.bars_in / elapsed if elapsed > 0 else 0.0,
+            "cycle_compute_ms_avg": compute.mean() * 1e3,
+            "cycle_compute_ms_max": compute.max() * 1e3,
+            "cycle_latency_ms_avg": latencies.mean() * 1e3,
+            "cycle_latency_ms_p99": np.percentile(latencies, 99) * 1e3,
+        }
+
+    def report(self):
+        s = self.stats()
+        print(
+            f"Scanner: {s['symbols']} symbols, {s['cycles']} cycles, {s['bars']} bars "
+            f"({s['bars_per_second']:,.0f} bars/s) | compute avg {s['cycle_compute_ms_avg']:.3f} ms, "
+            f"max {s['cycle_compute_ms_max']:.3f} ms | latency avg {s['cycle_latency_ms_avg']:.3f} ms, "
+            f"p99 {s['cycle_latency_ms_p99']:.3f} ms"
+        )
+
+
+def print_signals(cycle_ts, signals):
+    if not signals:
+        return
+    stamp = datetime.fromtimestamp(cycle_ts / NS, NY).strftime("%Y-%m-%d %H:%M:%S")
+    print(f"\n--- {stamp} top {len(signals)} ---")
+    for symbol, side, score, close, vwap, sma, rel_volume, range_position in signals:
+        print(f"{symbol:6} {side:5} score={score:+.4f} C={close:.2f} VWAP={vwap:.2f} SMA={sma:.2f} "
+              f"RVOL={rel_volume:.2f} range={range_position:.0%}")
+
+
+# Subscribes to 5-sec real-time bars for every symbol and feeds them to the scanner
+async def main(symbols, top=10, report_every=60, fake_store=None, **fake_options):
+    ib = IB() if fake_store is None else FakeIB(BarStore(fake_store or None), **fake_options)
+    await ib.connectAsync("127.0.0.1", 7497, clientId=3)
+
+    scanner = Scanner(symbols, top=top)
+    scanner.on_signals = print_signals
+
+    def subscribe(symbol):
+        bars = ib.reqRealTimeBars(Stock(symbol, "SMART", "USD"), barSize=5, whatToShow="TRADES", useRTH=True)
+
+        def on_bar(bars: list[RealTimeBar], hasNewBar: bool):
+            if hasNewBar:
+                bar = bars[-1]
+                scanner.on_bar(symbol, int(bar.time.timestamp()) * NS, bar.high, bar.low, bar.close,
+                               bar.volume, bar.wap)
+
+        bars.updateEvent += on_bar
+        return bars
+
+    subscriptions = [subscribe(symbol) for symbol in symbols]
+    try:
+        while True:
+            await asyncio.sleep(report_every)
+            scanner.report()
+    finally:
+        for bars in subscriptions:
+            ib.cancelRealTimeBars(bars)
+        scanner.report()
+        ib.disconnect()
+
+
+# start program
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Real-time multi-symbol scanner")
+    p.add_argument("symbols", nargs="*", help="Ticker symbols, e.g. AAPL MSFT TSLA")
+    p.add_argument("--symbols-file", help="Text file with one symbol per line")
+    p.add_argument("--top", type=int, default=10, help="How many signals to show per cycle")
+    p.add_argument("--report-every", type=float, default=60.0, help="Seconds between stats reports")
+    p.add_argument("--fake", nargs="?", const="", metavar="STORE_DIR",
+                   help="Use the offline FakeIB served from the bar store instead of TWS (no network)")
+    p.add_argument("--fake-rate", type=float, default=50.0,
+                   help="FakeIB real-time bars per second per symbol (0 = as fast as possible)")
+    args = p.parse_args()
+
+    symbols = list(args.symbols)
+    if args.symbols_file:
+        with open(args.symbols_file) as f:
+            symbols += [line.strip().upper() for line in f if line.strip()]
+    if not symbols:
+        p.error("give at least one symbol or --symbols-file")
+
+    asyncio.run(main(symbols, args.top, args.report_every, args.fake, realtime_rate=args.fake_rate))
@@ -1,34 +1,274 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from analytics import performance, periods_per_year
+from indicators import sma, SMA_VERSION
+from price_cache import default_cache
+from resample import ResampleCache
+from result_cache import default_result_cache
+
+
+def _rolling_means(prices, windows):
+    """(len(windows), n) array of rolling means of prices, NaN during each window's warm-up."""
+    # indicators.sma works from prefix sums, every rolling mean is (csum[i+1] - csum[i+1-w]) / w,
+    # and gives the same numbers as the live indicators.SMA, so backtest and live signals agree
+    out = np.empty((len(windows), len(prices)))
+    for row, w in enumerate(windows):
+        out[row] = sma(prices, int(w))
+    return out
+
+
+def sma_grid_sweep(close, short_windows, long_windows, max_chunk_bytes=256 * 2**20):
+    """
+    Vectorized version of SMABacktester.test_results() for many SMA pairs at once.
+
+    close: price series (or array) in date order
+    short_windows, long_windows: iterables of window lengths, only pairs with SMA_S < SMA_L are tested
+
+    Returns a DataFrame with SMA_S, SMA_L, perf, outperf for every pair,
+    giving the same numbers as test_results() for that pair.
+    """
+    prices = np.asarray(close, dtype=np.float64).ravel()
+    n = len(prices)
+    shorts = np.unique(np.asarray(list(short_windows), dtype=np.int64))
+    longs = np.unique(np.asarray(list(long_windows), dtype=np.int64))
+    if n < 2 or len(shorts) == 0 or len(longs) == 0:
+        return pd.DataFrame(columns=["SMA_S", "SMA_L", "perf", "outperf"])
+    if shorts.min() < 1:
+        raise ValueError("SMA windows must be >= 1")
+
+    # log returns, returns[i] is the return from bar i-1 to bar i
+    returns = np.log(prices[1:] / prices[:-1])
+
+    sma_short = _rolling_means(prices, shorts)
+    sma_long = _rolling_means(prices, longs)
+
+    # buy and hold is measured from the first bar where SMA_L exists (same as the dropna in get_data)
+    # cum_returns[k] = sum of returns[1..k] in the original bar numbering
+    cum_returns = np.concatenate(([0.0], np.cumsum(returns)))
+    bh_sum = cum_returns[-1] - cum_returns[np.minimum(longs - 1, n - 1)]
+
+    # position at bar j is SMA_S > SMA_L (NaN compares as False, so no position during warm-up)
+    # strategy log return = sum over j of position[j] * returns[j+1]
+    # Build (shorts x longs x bars) position blocks, a few short windows at a time to bound memory.
+    # The matrix product needs float64, so the comparison is written straight into a float64 block
+    # (8 bytes per element, no bool block and no hidden upcast copy next to it).
+    shorts_per_chunk = max(1, int(max_chunk_bytes // max(1, 8 * len(longs) * (n - 1))))
+    strat_sum = np.empty((len(shorts), len(longs)))
+    for c0 in range(0, len(shorts), shorts_per_chunk):
+        short_chunk = sma_short[c0:c0 + shorts_per_chunk, None, :-1]
+        block = np.empty((len(short_chunk), len(longs), n - 1))
+        np.greater(short_chunk, sma_long[None, :, :-1], out=block, casting="unsafe")
+        strat_sum[c0:c0 + shorts_per_chunk] = block @ returns
+
+    ss, ll = np.meshgrid(shorts, longs, indexing="ij")
+    perf = np.exp(strat_sum)
+    outperf = perf - np.exp(bh_sum)[None, :]
+    # pairs with no data left after the warm-up can't be tested
+    perf[:, longs >= n] = np.nan
+    outperf[:, longs >= n] = np.nan
+
+    keep = ss < ll
+    return pd.DataFrame({
+        "SMA_S": ss[keep],
+        "SMA_L": ll[keep],
+        "perf": np.round(perf[keep], 6),
+        "outperf": np.round(outperf[keep], 6),
+    })
+
+
+def sma_strategy_returns(close, pairs):
+    """
+    Per-bar log returns and held positions of many (SMA_S, SMA_L) pairs as (pairs, bars-1) matrices,
+    same bars as sma_grid_sweep. Feed them to analytics.performance(..., log=True, positions=...)
+    to score a whole sweep at once.
+    """
+    prices = np.asarray(close, dtype=np.float64).ravel()
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    returns = np.log(prices[1:] / prices[:-1])
+    shorts, short_row = np.unique(pairs[:, 0], return_inverse=True)
+    longs, long_row = np.unique(pairs[:, 1], return_inverse=True)
+    sma_short = _rolling_means(prices, shorts)
+    sma_long = _rolling_means(prices, longs)
+    held = (sma_short[short_row, :-1] > sma_long[long_row, :-1]).astype(np.float64)
+    return held * returns, held
+
+
+def walk_forward_folds(n, train_size, test_size, anchored=False):
+    """
+    (train_start, train_end, test_start, test_end) bar numbers, ends exclusive, for n bars.
+    Each test window follows its train window, the next fold moves on by test_size.
+    anchored=True keeps every train window starting at bar 0 (expanding instead of rolling).
+    """
+    folds = []
+    test_start = train_size
+    while test_start < n:
+        test_end = min(test_start + test_size, n)
+        folds.append((0 if anchored else test_start - train_size, test_start, test_start, test_end))
+        test_start = test_end
+    return np.array(folds, dtype=np.int64).reshape(-1, 4)
+
+
+def _fold_sums(prices, shorts, longs, masks, max_chunk_bytes=256 * 2**20):
+    # Log return of every (short, long) pair inside every fold: (shorts, longs, folds).
+    # masks is (bars-1, folds) holding the bar's return where the bar is in the fold and 0 elsewhere,
+    # so one matrix product scores every pair on every fold at once.
+    n = len(prices)
+    sma_short = _rolling_means(prices, shorts)
+    sma_long = _rolling_means(prices, longs)
+    out = np.empty((len(shorts), len(longs), masks.shape[1]))
+    # per short window: the float64 position block (longs x bars-1) and the product (longs x folds)
+    shorts_per_chunk = max(1, int(max_chunk_bytes // max(1, 8 * len(longs) * (n - 1 + masks.shape[1]))))
+    for c0 in range(0, len(shorts), shorts_per_chunk):
+        short_chunk = sma_short[c0:c0 + shorts_per_chunk, None, :-1]
+        block = np.empty((len(short_chunk), len(longs), n - 1))
+        np.greater(short_chunk, sma_long[None, :, :-1], out=block, casting="unsafe")
+        out[c0:c0 + shorts_per_chunk] = (block.reshape(-1, n - 1) @ masks).reshape(len(short_chunk), len(longs), -1)
+    return out
+
+
+def sma_walk_forward(close, short_windows, long_windows, train_size, test_size, anchored=False, processes=None):
+    """
+    Walk-forward optimization of the SMA crossover.
+
+    For every fold the (SMA_S, SMA_L) pair with the best log return on the train window is picked
+    and then traded on the following test window only, so every test result is out-of-sample.
+    The rolling means are computed once for the whole series and all folds are scored together
+    (train and test) with one matrix product per chunk of short windows. With processes > 1 the
+    short windows are split over a process pool.
+
+    close: price Series (or array) in date order, train_size / test_size: number of bars
+    Returns (folds, equity):
+    folds:  one row per fold with dates, chosen pair, train_perf, test_perf and test buy & hold
+            (pair and perfs are NA / NaN for a fold with no SMA_S < SMA_L pair that fits its train window,
+            the strategy stays flat in that test window)
+    equity: stitched out-of-sample equity of the strategy and buy & hold over the test windows
+    """
+    prices = np.asarray(close, dtype=np.float64).ravel()
+    n = len(prices)
+    dates = close.index if isinstance(close, pd.Series) else pd.RangeIndex(n)
+    shorts = np.unique(np.asarray(list(short_windows), dtype=np.int64))
+    longs = np.unique(np.asarray(list(long_windows), dtype=np.int64))
+    folds = walk_forward_folds(n, train_size, test_size, anchored)
+    if len(folds) == 0:
+        raise ValueError(f"Need more than train_size={train_size} bars, got {n}")
+
+    # returns[k] is the return from bar k to bar k+1, earned by the position held at bar k.
+    # A window of bars [a, b) earns returns[a-1 .. b-2] (the first bar's own return belongs to the bar before).
+    returns = np.log(prices[1:] / prices[:-1])
+    k = np.arange(n - 1)
+
+    def window_members(starts, ends):
+        return (k[:, None] >= np.maximum(starts, 1)[None, :] - 1) & (k[:, None] < ends[None, :] - 1)
+
+    # members: (bars-1, 2 x folds) bool, which returns are in each train / test window.
+    # masks holds the return there and 0 elsewhere (a return can be 0 and still be in the window)
+    members = np.hstack([window_members(folds[:, 0], folds[:, 1]), window_members(folds[:, 2], folds[:, 3])])
+    masks = np.where(members, returns[:, None], 0.0)
+    if processes and processes > 1 and len(shorts) > 1:
+        chunks = np.array_split(shorts, min(processes, len(shorts)))
+        with ProcessPoolExecutor(processes) as pool:
+            sums = np.concatenate(list(pool.map(_fold_sums, [prices] * len(chunks), chunks,
+                                                [longs] * len(chunks), [masks] * len(chunks))))
+    else:
+        sums = _fold_sums(prices, shorts, longs, masks)
+    n_folds = len(folds)
+    train_sums, test_sums = sums[..., :n_folds], sums[..., n_folds:]
+
+    # best pair per fold among SMA_S < SMA_L, and the long window has to fit in the train window
+    valid = (shorts[:, None] < longs[None, :])[..., None] & (longs[None, :, None] < (folds[:, 1] - folds[:, 0])[None, None, :])
+    scores = np.where(valid, train_sums, -np.inf).reshape(-1, n_folds)
+    best = scores.argmax(axis=0)
+    has_pair = valid.reshape(-1, n_folds).any(axis=0)  # else argmax's 0 would pick an invalid pair
+    best_s, best_l = shorts[best // len(longs)], longs[best % len(longs)]
+
+    # stitched out-of-sample returns: the chosen pair's position, only inside its own test window
+    sma_cache = {}
+    def sma(w):
+        if w not in sma_cache:
+            sma_cache[w] = _rolling_means(prices, [w])[0]
+        return sma_cache[w]
+    oos = np.zeros(n - 1)
+    for f, (s, l) in enumerate(zip(best_s, best_l)):
+        if not has_pair[f]:
+            continue  # nothing to trade, flat for this test window
+        position = sma(s)[:-1] > sma(l)[:-1]
+        inside = members[:, n_folds + f]
+        oos[inside] = position[inside] * returns[inside]
+
+    first = max(folds[0, 2] - 1, 0)
+    equity = pd.DataFrame({
+        "strategy": np.exp(np.cumsum(oos[first:])),
+        "buy_hold": np.exp(np.cumsum(returns[first:])),
+    }, index=dates[first + 1:])
+
+    rows = np.arange(n_folds)
+    bh = masks[:, n_folds:].sum(axis=0)
+    folds_table = pd.DataFrame({
+        "train_start": dates[folds[:, 0]],
+        "train_end": dates[folds[:, 1] - 1],
+        "test_start": dates[folds[:, 2]],
+        "test_end": dates[folds[:, 3] - 1],
+        "SMA_S": pd.Series(best_s, dtype="Int64").where(has_pair).array,
+        "SMA_L": pd.Series(best_l, dtype="Int64").where(has_pair).array,
+        "train_perf": np.where(has_pair, np.round(np.exp(train_sums.reshape(-1, n_folds)[best, rows]), 6), np.nan),
+        "test_perf": np.where(has_pair, np.round(np.exp(test_sums.reshape(-1, n_folds)[best, rows]), 6), np.nan),
+        "test_bh": np.round(np.exp(bh), 6),
+    })
+    return folds_table, equity
+
 
 class SMABacktester():
-    def __init__(self, stock ,SMA_S,SMA_L,start, end):
+    def __init__(self, stock ,SMA_S,SMA_L,start, end, cache=None, timeframe=None, result_cache=None):
         self.stock = stock
         self.SMA_S = SMA_S
         self.SMA_L = SMA_L
         self.start = start
         self.end = end
         self.results = None #placeholder for now
+        #timeframe=None: daily closes from yfinance (PriceCache, so yfinance is only hit for new dates)
+        #timeframe="5m"/"15m"/"60m"/"1d": bars resampled from the local 1-min bar store, no network
+        self.timeframe = timeframe
+        if cache is None:
+            cache = default_cache() if timeframe is None else ResampleCache()
+        self.cache = cache
+        #ResultCache: same prices + same parameters -> stored result, no recomputation (False turns it off)
+        self.result_cache = default_result_cache() if result_cache is None else result_cache
         self.get_data()
+
+    def _cached(self, name, params, compute):
+        if not self.result_cache:
+            return compute()
+        # SMA_VERSION: results computed with an older SMA kernel are not reused
+        return self.result_cache.get_or_compute((name, SMA_VERSION, self.close, params), compute)
     
     def get_data(self):
-        df = yf.download(self.stock, start=self.start, end=self.end)
-        data = df["Close"][f'{self.stock}'].to_frame() 
+        if self.timeframe is None:
+            df = self.cache.get(self.stock, self.start, self.end)
+        else:
+            df = self.cache.get(self.stock, self.start, self.end, self.timeframe)
+        self.close = df["Close"].rename(f'{self.stock}') #full close series, kept for sweep()
+        data = self.close.to_frame()
         data['returns'] = np.log(data[f'{self.stock}'].div(data[f'{self.stock}'].shift(1)))
-        data['SMA_S'] = data[f"{self.stock}"].rolling(int(self.SMA_S)).mean()
-        data['SMA_L'] = data[f"{self.stock}"].rolling(int(self.SMA_L)).mean()
+        data['SMA_S'] = sma(data[f"{self.stock}"], int(self.SMA_S)) #same SMA as the sweeps and the live indicators
+        data['SMA_L'] = sma(data[f"{self.stock}"], int(self.SMA_L))
         data.dropna(inplace=True)
         self.data2 = data
         return self.data2
         
     def test_results(self):
+        data, perf, outperf = self._cached("SMABacktester.test_results", (self.SMA_S, self.SMA_L), self._test_results)
+        self.results = data
+        return perf, outperf
+
+    def _test_results(self):
         data = self.data2.copy()
         data["position"]=np.where(data["SMA_S"]>data["SMA_L"],1,0)
         
         #ret_startegy is the return every interval (D, W, Month etc)
-        data["ret_strategy"]=data["returns"] * data.position.shift(1)
+        data["held"]=data.position.shift(1) #position held over each interval
+        data["ret_strategy"]=data["returns"] * data["held"]
         data.dropna(inplace=True)
         
         data["returnsbh"]=data["returns"].cumsum().apply(np.exp)
@@ -37,13 +277,49 @@ class SMABacktester():
         data["strategybh"]=data["ret_strategy"].cumsum().apply(np.exp)
         perf=data["strategybh"].iloc[-1]
         outperf=perf-data["returnsbh"].iloc[-1]
-        self.results = data
         
         # ret = np.exp(data["ret_strategy"].sum())
         # std = data["ret_strategy"].std()*np.sqrt(252)
         
-        return round(perf,6), round(outperf,6)
+        return data, round(perf,6), round(outperf,6)
+
+    def metrics(self, risk_free=0.0):
+        """
+        CAGR, volatility, Sharpe, Sortino, drawdown, hit rate, turnover and exposure
+        of the strategy and of buy & hold (runs test_results() first if needed).
+        """
+        if self.results is None:
+            self.test_results()
+        data = self.results
+        ppy = periods_per_year(self.timeframe)
+        return pd.DataFrame({
+            "strategy": performance(data["ret_strategy"], ppy, log=True, positions=data["held"], risk_free=risk_free),
+            "buy_hold": performance(data["returns"], ppy, log=True, positions=np.ones(len(data)), risk_free=risk_free),
+        }).T
+
+    def sweep(self, short_windows, long_windows):
+        """
+        Test every (SMA_S, SMA_L) pair in one go on the data already downloaded,
+        instead of creating a new SMABacktester for each pair.
+        e.g. tester.sweep(range(10, 60), range(100, 250))
+        """
+        short_windows, long_windows = list(short_windows), list(long_windows)
+        return self._cached("sma_grid_sweep", (short_windows, long_windows),
+                            lambda: sma_grid_sweep(self.close, short_windows, long_windows))
         
+    def walk_forward(self, short_windows, long_windows, train_size=756, test_size=252, anchored=False, processes=None):
+        """
+        Walk-forward optimization on the data already downloaded: best pair on each train window,
+        traded on the next test window. Sizes are in bars (756 / 252 = 3 years / 1 year of daily bars).
+        e.g. folds, equity = tester.walk_forward(range(10, 60), range(100, 250))
+        """
+        short_windows, long_windows = list(short_windows), list(long_windows)
+        folds, equity = self._cached(
+            "sma_walk_forward", (short_windows, long_windows, train_size, test_size, anchored),
+            lambda: sma_walk_forward(self.close, short_windows, long_windows, train_size, test_size, anchored, processes))
+        self.walk_forward_equity = equity
+        return folds, equity
+
     def Plot_result(self):
         if self.results is None:
             print("No results to plot yet. Run test_results() first.")
@@ -0,0 +1,192 @@
+import argparse
+import os
+import tempfile
+import time
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+"""
+Runs (symbol, strategy, parameters) backtest jobs on all CPU cores.
+
+- The parent loads every symbol's prices once and writes them to .npy files in a temp folder.
+  Workers open them with np.load(mmap_mode="r"), so all processes share the same pages from the
+  OS file cache and a task only carries (symbol, strategy, list of parameters), never price data.
+- Each task is a chunk of parameter sets that the worker runs with the vectorized kernels
+  (sma_grid_sweep, orb_sweep), so the per-task overhead is small next to the work.
+- Results come back as soon as a task finishes (imap_unordered), go into one results table
+  (and optionally get appended to a CSV), with a progress line every few seconds.
+- Workers are limited to one BLAS thread each, so N processes use N cores and throughput
+  grows with the number of cores instead of the processes fighting over threads.
+
+    python sweep_runner.py sma SPY QQQ --short 10 60 5 --long 100 260 10 --start 2005-01-01 --end 2024-01-01
+    python sweep_runner.py sma ABC --timeframe 15m --short 5 50 5 --long 20 200 10      # offline, resampled bars
+    python sweep_runner.py orb ABC XYZ --minutes 5 61 5 --targets 1 1.5 2 3
+"""
+
+
+# --- strategies, run inside the workers ------------------------------------------------
+
+def run_sma(data, params):
+    """params: list of (SMA_S, SMA_L). data: close prices. Same numbers as SMABacktester.test_results()."""
+    from smabacktestv1 import sma_grid_sweep
+
+    pairs = pd.DataFrame(params, columns=["SMA_S", "SMA_L"])
+    result = sma_grid_sweep(data, pairs["SMA_S"].unique(), pairs["SMA_L"].unique())
+    return pairs.merge(result, on=["SMA_S", "SMA_L"], how="left")
+
+
+def run_orb(data, params):
+    """params: list of (opening_range_minutes, target_multiple). data: 1-min BAR_DTYPE array."""
+    from orb_backtest import orb_sweep
+
+    pairs = pd.DataFrame(params, columns=["opening_range_minutes", "target_multiple"])
+    parts = []
+    for target, group in pairs.groupby("target_multiple", sort=False):
+        result = orb_sweep(data, group["opening_range_minutes"].to_numpy(), target)
+        result.insert(1, "target_multiple", target)
+        parts.append(result)
+    return pd.concat(parts, ignore_index=True)
+
+
+STRATEGIES = {"sma": run_sma, "orb": run_orb}
+
+
+# --- job lists -------------------------------------------------------------------------
+
+def sma_jobs(symbols, short_windows, long_windows):
+    """One job per symbol with every (SMA_S, SMA_L) pair where SMA_S < SMA_L."""
+    pairs = [(s, l) for s in short_windows for l in long_windows if s < l]
+    return [(symbol, "sma", pairs) for symbol in symbols]
+
+
+def orb_jobs(symbols, minutes, targets):
+    pairs = [(m, t) for t in targets for m in minutes]
+    return [(symbol, "orb", pairs) for symbol in symbols]
+
+
+# --- loading the price data once, in the parent ----------------------------------------
+
+def load_data(symbol, strategy, start=None, end=None, timeframe=None, store=None):
+    if strategy == "orb":
+        from bar_store import BarStore
+        return (store or BarStore()).read_array(symbol, start, end)
+    if timeframe is None:
+        from price_cache import default_cache
+        df = default_cache().get(symbol, start, end)
+    else:
+        from resample import ResampleCache
+        df = ResampleCache(store).get(symbol, start, end, timeframe)
+    return df["Close"].to_numpy(dtype=np.float64)
+
+
+# --- worker side -------------------------------------------------------------------------
+
+_arrays = {}  # path -> memory-mapped array, one per worker process
+
+
+def _run_task(task):
+    task_id, symbol, strategy, path, params = task
+    start = time.perf_counter()
+    if path not in _arrays:
+        _arrays[path] = np.load(path, mmap_mode="r")
+    result = STRATEGIES[strategy](_arrays[path], params)
+    result.insert(0, "strategy", strategy)
+    result.insert(0, "symbol", symbol)
+    return task_id, len(params), result, time.perf_counter() - start
+
+
+# --- parent side -------------------------------------------------------------------------
+
+def run_sweep(jobs, processes=None, chunk_size=64, start=None, end=None, timeframe=None, store=None,
+              out=None, progress_every=2.0):
+    """
+    jobs: list of (symbol, strategy, list of parameter tuples), see sma_jobs() / orb_jobs().
+    Returns one DataFrame with a row per (symbol, strategy, parameters). With out="file.csv"
+    the rows are also appended to that file as tasks finish.
+    """
+    processes = processes or os.cpu_count() or 1
+    timer = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="sweep_") as folder:
+        # every (symbol, data kind) is loaded and written once, however many jobs use it
+        paths = {}
+        tasks = []
+        for symbol, strategy, params in jobs:
+            kind = "minutes" if strategy == "orb" else "closes"
+            if (symbol, kind) not in paths:
+                path = os.path.join(folder, f"{symbol}_{kind}.npy")
+                np.save(path, load_data(symbol, strategy, start, end, timeframe, store))
+                paths[(symbol, kind)] = path
+            # small jobs get smaller chunks so they still spread over every worker
+            size = max(1, min(chunk_size, -(-len(params) // (processes * 4))))
+            for i in range(0, len(params), size):
+                tasks.append((len(tasks), symbol, strategy, paths[(symbol, kind)], params[i:i + size]))
+        total_params = sum(len(task[4]) for task in tasks)
+        print(f"Loaded {len(paths)} price arrays in {time.perf_counter() - timer:.2f} seconds, "
+              f"running {total_params} parameter sets as {len(tasks)} tasks on {processes} processes")
+
+        # one BLAS thread per worker, inherited by the child processes
+        for name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+            os.environ.setdefault(name, "1")
+
+        results = []
+        done_params = 0
+        work_seconds = 0.0
+        started = last_print = time.perf_counter()
+        with get_context("spawn").Pool(processes) as pool:
+            for task_id, n, result, seconds in pool.imap_unordered(_run_task, tasks):
+                results.append(result)
+                done_params += n
+                work_seconds += seconds
+                if out is not None:
+                    result.to_csv(out, mode="a", header=not os.path.exists(out), index=False)
+                now = time.perf_counter()
+                if now - last_print >= progress_every or len(results) == len(tasks):
+                    rate = done_params / (now - started)
+                    eta = (total_params - done_params) / rate if rate > 0 else float("inf")
+                    print(f"{len(results)}/{len(tasks)} tasks, {done_params}/{total_params} parameter sets "
+                          f"({rate:,.0f}/s, ETA {eta:.0f} s)")
+                    last_print = now
+        wall = time.perf_counter() - started
+
+    table = pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+    # busy time of the workers / (wall time x processes): close to 1.0 means all cores were kept busy
+    print(f"Done: {total_params} parameter sets in {wall:.2f} seconds ({total_params / max(wall, 1e-9):,.0f}/s), "
+          f"worker utilisation {work_seconds / max(wall * processes, 1e-9):.0%}")
+    if len(table):
+        table = table.sort_values(list(table.columns[:4])).reset_index(drop=True)
+    return table
+
+
+# start program
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Parallel parameter sweep over symbols")
+    p.add_argument("strategy", choices=sorted(STRATEGIES))
+    p.add_argument("symbols", nargs="+")
+    p.add_argument("--short", nargs=3, type=int, default=[10, 60, 5], metavar=("START", "STOP", "STEP"),
+                   help="sma: short windows, like range(START, STOP, STEP)")
+    p.add_argument("--long", nargs=3, type=int, default=[100, 260, 10], metavar=("START", "STOP", "STEP"),
+                   help="sma: long windows")
+    p.add_argument("--timeframe", default=None, help="sma: bars from the 1-min store (5m, 15m, 60m, 1d) instead of yfinance")
+    p.add_argument("--minutes", nargs=3, type=int, default=[5, 61, 5], metavar=("START", "STOP", "STEP"),
+                   help="orb: opening range minutes")
+    p.add_argument("--targets", nargs="+", type=float, default=[2.0], help="orb: target multiples")
+    p.add_argument("--start", default="2000-01-01")
+    p.add_argument("--end", default=None)
+    p.add_argument("--processes", type=int, default=None, help="Worker processes (default: all cores)")
+    p.add_argument("--chunk-size", type=int, default=64, help="Parameter sets per task")
+    p.add_argument("--out", default=None, help="Append results to this CSV file as they arrive")
+    p.add_argument("--top", type=int, default=10, help="Best rows to print at the end")
+    args = p.parse_args()
+
+    end = args.end or pd.Timestamp.today().strftime("%Y-%m-%d")
+    if args.strategy == "sma":
+        jobs = sma_jobs(args.symbols, range(*args.short), range(*args.long))
+        sort_by = "perf"
+    else:
+        jobs = orb_jobs(args.symbols, range(*args.minutes), args.targets)
+        sort_by = "total_return"
+    table = run_sweep(jobs, args.processes, args.chunk_size, args.start, end, args.timeframe, out=args.out)
+    if len(table):
+        print(table.sort_values(sort_by, ascending=False).head(args.top).to_string(index=False))
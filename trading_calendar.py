@@ -0,0 +1,197 @@
+import argparse
+import os
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from bar_store import NY
+
+"""
+NYSE trading calendar as three int64 arrays, worked out once and kept on disk:
+
+    days    NY calendar day of every session (days since 1970-01-01, same as bar_store.trading_days)
+    opens   session open in UTC nanoseconds
+    closes  session close in UTC nanoseconds (early closes included, e.g. 13:00 the day after Thanksgiving)
+
+The file (trading_calendar.npz next to this module, 1990 to 2035) is part of the repo, so
+pandas_market_calendars is never needed to run anything: it is only imported by an explicit
+rebuild. TRADING_CALENDAR_FILE points to another file. Every question is a np.searchsorted on
+sorted arrays, for one timestamp or millions at once:
+
+    cal = default_calendar()
+    days, opens, closes = cal.sessions_in_range("2022-01-01", "2022-12-31")
+    cal.is_in_session(bars["ts"])              # bool per bar
+    cal.expected_bar_count(days[0], days[-1])  # 1-min bars per session
+
+Dates outside the range the file was built for raise ValueError: there the calendar can't tell
+"market closed" from "not in the file", and quietly dropping every bar would look like a closed market.
+
+Rebuild it (e.g. when new holidays are announced, or to cover more years) and commit the new file:
+    python trading_calendar.py build --start 1990-01-01 --end 2035-12-31
+"""
+
+NS_PER_MINUTE = 60 * 10**9
+EPOCH = date(1970, 1, 1)
+FIRST_DAY = "1990-01-01"
+LAST_DAY = "2035-12-31"
+DEFAULT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trading_calendar.npz")
+
+
+def _day_number(value):
+    # day number, date, or anything pd.Timestamp takes -> days since 1970-01-01
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if type(value) is date:
+        return (value - EPOCH).days
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert(NY)
+    return (ts.date() - EPOCH).days
+
+
+def _day_text(day):
+    return str(np.datetime64(int(day), "D"))
+
+
+class TradingCalendar():
+    def __init__(self, days, opens, closes, first_day=None, last_day=None):
+        self.days = np.asarray(days, dtype=np.int64)
+        self.opens = np.asarray(opens, dtype=np.int64)
+        self.closes = np.asarray(closes, dtype=np.int64)
+        # days the sessions were worked out for (None = no check, e.g. a slice of sessions)
+        self.first_day = None if first_day is None else _day_number(first_day)
+        self.last_day = None if last_day is None else _day_number(last_day)
+        if self.first_day is not None:
+            # the same range in UTC ns, NY midnight to NY midnight, for locate()
+            self._first_ns = pd.Timestamp(self.first_day, unit="D").tz_localize(NY).value
+            self._end_ns = pd.Timestamp(self.last_day + 1, unit="D").tz_localize(NY).value
+
+    @classmethod
+    def build(cls, start=FIRST_DAY, end=LAST_DAY):
+        """Sessions from pandas_market_calendars (the only place it is used)."""
+        import pandas_market_calendars as mcal
+
+        schedule = mcal.get_calendar("NYSE").schedule(start_date=start, end_date=end)
+        days = pd.DatetimeIndex(schedule.index).as_unit("ns").asi8 // (86_400 * 10**9)
+        opens = pd.DatetimeIndex(schedule["market_open"]).as_unit("ns").asi8
+        closes = pd.DatetimeIndex(schedule["market_close"]).as_unit("ns").asi8
+        return cls(days, opens, closes, start, end)
+
+    @classmethod
+    def load(cls, path=None):
+        """Calendar from the .npz file (never built here, see `python trading_calendar.py build`)."""
+        path = path or calendar_file()
+        try:
+            with np.load(path) as f:
+                days = f["days"]
+                first_day = f["first_day"] if "first_day" in f.files else days[0]
+                last_day = f["last_day"] if "last_day" in f.files else days[-1]
+                return cls(days, f["opens"], f["closes"], int(first_day), int(last_day))
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No trading calendar at {path}, build it once with: "
+                                    f"python trading_calendar.py build") from None
+
+    def save(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        extra = {} if self.first_day is None else {"first_day": self.first_day, "last_day": self.last_day}
+        np.savez(tmp, days=self.days, opens=self.opens, closes=self.closes, **extra)
+        os.replace(tmp, path)
+
+    def __len__(self):
+        return len(self.days)
+
+    def _check(self, first, last):
+        # day numbers first..last have to be inside the range the calendar was built for
+        if self.first_day is not None and (first < self.first_day or last > self.last_day):
+            raise ValueError(f"{_day_text(first)} to {_day_text(last)} is outside the trading calendar "
+                             f"({_day_text(self.first_day)} to {_day_text(self.last_day)}), rebuild it with "
+                             f"python trading_calendar.py build --start ... --end ...")
+
+    # --- sessions by day -----------------------------------------------------------
+    def sessions_in_range(self, start, end):
+        """(days, opens, closes) of the sessions from start to end, both days included."""
+        start, end = _day_number(start), _day_number(end)
+        self._check(start, end)
+        lo = np.searchsorted(self.days, start, side="left")
+        hi = np.searchsorted(self.days, end, side="right")
+        return self.days[lo:hi], self.opens[lo:hi], self.closes[lo:hi]
+
+    def session(self, day):
+        """(open_ns, close_ns) of that day's session, None if the market is closed."""
+        day = _day_number(day)
+        self._check(day, day)
+        i = np.searchsorted(self.days, day)
+        if i < len(self.days) and self.days[i] == day:
+            return int(self.opens[i]), int(self.closes[i])
+        return None
+
+    def expected_bar_count(self, start, end, minutes=1):
+        """Bars of `minutes` per session from start to end (last bin of an early close counts)."""
+        _, opens, closes = self.sessions_in_range(start, end)
+        width = minutes * NS_PER_MINUTE
+        return (closes - opens + width - 1) // width
+
+    # --- timestamps ------------------------------------------------------------------
+    def locate(self, ts_ns):
+        """Position of the session every UTC ns timestamp falls in (open <= ts < close), -1 outside."""
+        ts = np.asarray(ts_ns, dtype=np.int64)
+        if self.first_day is not None and ts.size and (ts.min() < self._first_ns or ts.max() >= self._end_ns):
+            outside = ts[(ts < self._first_ns) | (ts >= self._end_ns)]
+            days = pd.DatetimeIndex(outside[[0, -1]], tz="UTC").tz_convert(NY)
+            self._check(_day_number(days[0]), _day_number(days[-1]))
+        pos = np.searchsorted(self.opens, ts, side="right") - 1
+        inside = (pos >= 0) & (ts < self.closes[np.maximum(pos, 0)])
+        return np.where(inside, pos, -1)
+
+    def is_in_session(self, ts_ns):
+        """True where the timestamp (a bar start, UTC ns) is inside a session."""
+        return self.locate(ts_ns) >= 0
+
+
+def calendar_file():
+    """$TRADING_CALENDAR_FILE, or trading_calendar.npz next to this module (not the working directory)."""
+    return os.environ.get("TRADING_CALENDAR_FILE") or DEFAULT_FILE
+
+
+_default_calendar = None
+
+
+def default_calendar():
+    """One calendar per process, loaded from disk on first use."""
+    global _default_calendar
+    if _default_calendar is None:
+        _default_calendar = TradingCalendar.load()
+    return _default_calendar
+
+
+# start program
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="NYSE trading calendar")
+    sub = p.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Work the sessions out with pandas_market_calendars and save them")
+    build.add_argument("--start", default=FIRST_DAY)
+    build.add_argument("--end", default=LAST_DAY)
+    build.add_argument("--file", default=None,
+                       help="Output file (default: $TRADING_CALENDAR_FILE or trading_calendar.npz next to this file)")
+    show = sub.add_parser("show", help="Sessions between two days")
+    show.add_argument("start")
+    show.add_argument("end")
+    args = p.parse_args()
+
+    if args.command == "build":
+        timer = time.perf_counter()
+        calendar = TradingCalendar.build(args.start, args.end)
+        path = args.file or calendar_file()
+        calendar.save(path)
+        print(f"Saved {len(calendar)} sessions ({args.start} to {args.end}) to {path} "
+              f"in {time.perf_counter() - timer:.2f} seconds")
+    else:
+        days, opens, closes = default_calendar().sessions_in_range(args.start, args.end)
+        for o, c in zip(opens, closes):
+            o, c = pd.Timestamp(o, tz="UTC").tz_convert(NY), pd.Timestamp(c, tz="UTC").tz_convert(NY)
+            print(f"{o:%Y-%m-%d}  {o:%H:%M} - {c:%H:%M}  {(c - o) // pd.Timedelta(minutes=1)} minutes")